@@ -19,9 +19,8 @@
 import sys
 from os import path
 from enum import Enum
-from PyQt5.Qt import (
-    QApplication, QStandardPaths, QSettings
-)
+from PyQt5.QtCore import QStandardPaths, QSettings
+from PyQt5.QtWidgets import QApplication
 from log import logger
 
 
@@ -62,6 +61,10 @@ class Application(QApplication):
 
         return resourcePaths
 
+    def dataLocation(self):
+        return QStandardPaths.writableLocation(
+            QStandardPaths.AppLocalDataLocation)
+
     def findResource(self, resource, resourceType=None):
         if resourceType:
             extensions = Application._resourceMap[resourceType]['extensions']
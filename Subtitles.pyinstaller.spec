@@ -59,6 +59,7 @@ data_files = [
     # ('doc/LICENSE.PyQt5', RESOURCES_DIR),
     ('doc/LICENSE.html',  RESOURCES_DIR),
     ('resources/Subtitles.png', RESOURCES_DIR),
+    ('resources/languages.json', RESOURCES_DIR),
 ]
 if path.exists('doc/VERSION.commit'):
     data_files.append(('doc/VERSION.commit', RESOURCES_DIR))
@@ -0,0 +1,99 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Concurrent searches and downloads: threads vs. one event loop."""
+
+import asyncio
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .context import service
+from service.AsyncOpenSubService import AsyncOpenSubService
+from service.DownloadService import DownloadService
+from service.OpenSubService import OpenSubService
+from test.FakeOpenSubServer import FakeOpenSubServer
+
+SEARCHES = 200
+# Round trip time of the fake server, in seconds
+LATENCY = 0.05
+THREADS = 8
+
+
+def _hashes():
+    return ['{:016x}'.format(i) for i in range(SEARCHES)]
+
+
+def _threaded(subService, downloadService, directory):
+    def work(i, hash):
+        subtitle = subService.find_by_hash(hash)[0]
+        downloadService.download_subtitle(
+            subtitle, os.path.join(directory, 'movie{}.avi'.format(i)))
+
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(work, range(SEARCHES), _hashes()))
+        return THREADS
+
+
+def _async(subService, directory):
+    async def work(asyncService, i, hash):
+        subtitle = (await asyncService.find_by_hash(hash))[0]
+        await asyncService.download_subtitle(
+            subtitle, os.path.join(directory, 'movie{}.avi'.format(i)))
+
+    async def main():
+        asyncService = AsyncOpenSubService(subService)
+        try:
+            await asyncio.gather(*[work(asyncService, i, hash)
+                                   for i, hash in enumerate(_hashes())])
+        finally:
+            asyncService.close()
+
+    asyncio.run(main())
+    return 1
+
+
+def run():
+    results = []
+    for name in ('threads', 'asyncio'):
+        with FakeOpenSubServer(latency=LATENCY) as server, \
+                tempfile.TemporaryDirectory() as directory:
+            subService = OpenSubService(server_url=server.url)
+            subService.login()
+            downloadService = DownloadService(pool_size=THREADS)
+            start = time.perf_counter()
+            if name == 'threads':
+                threads = _threaded(subService, downloadService, directory)
+            else:
+                threads = _async(subService, directory)
+            seconds = time.perf_counter() - start
+            downloadService.close()
+            assert len(os.listdir(directory)) == SEARCHES
+        results.append(dict(name='search_download/{}'.format(name),
+                            calls=SEARCHES * 2, latency=LATENCY,
+                            threads=threads, seconds=seconds,
+                            calls_per_second=SEARCHES * 2 / seconds))
+    return results
+
+
+if __name__ == '__main__':
+    for r in run():
+        print(f"{r['name']:>30}: {r['seconds']:8.2f} s, "
+              f"{r['calls_per_second']:8.1f} calls/s, "
+              f"{r['threads']} thread(s)")
@@ -0,0 +1,67 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+"""End-to-end batch against a local fake OpenSubtitles server."""
+
+import tempfile
+import time
+
+from .context import service
+from .MovieHash_bench import makeSparseFile
+from service.BatchRunner import BatchRunner
+from service.DownloadService import DownloadService
+from service.OpenSubService import OpenSubService
+from test.FakeOpenSubServer import FakeOpenSubServer
+
+FILES = 200
+FILE_SIZE = 700 * 1024 * 1024
+# Round trip time of the fake server, in seconds
+LATENCIES = [0.0, 0.05]
+JOBS = 4
+
+
+def run():
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        filePaths = []
+        for i in range(FILES):
+            filePaths.append(makeSparseFile(directory, FILE_SIZE + i))
+
+        for latency in LATENCIES:
+            with FakeOpenSubServer(latency=latency) as server:
+                subService = OpenSubService(server_url=server.url)
+                downloadService = DownloadService(pool_size=JOBS)
+                runner = BatchRunner(subService, downloadService, jobs=JOBS)
+                start = time.perf_counter()
+                stats = runner.run(filePaths)
+                seconds = time.perf_counter() - start
+                downloadService.close()
+            assert stats.downloaded == FILES, str(stats)
+            results.append(dict(name='batch/{}'.format(latency),
+                                files=FILES, latency=latency, jobs=JOBS,
+                                seconds=seconds,
+                                files_per_second=FILES / seconds,
+                                searches=server.calls['SearchSubtitles']))
+    return results
+
+
+if __name__ == '__main__':
+    for r in run():
+        print(f"{r['name']:>12}: {r['seconds']:6.2f} s, "
+              f"{r['files_per_second']:7.1f} files/s, "
+              f"{r['searches']} searches")
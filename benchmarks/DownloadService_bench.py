@@ -0,0 +1,60 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import gzip
+import io
+import timeit
+
+from .context import service
+from service.DownloadService import DownloadService
+
+# Number of cues; a feature film has about 1500
+CUES = [1500, 50000]
+REPEAT = 5
+NUMBER = 10
+
+
+def _subtitle(cues):
+    return '\n'.join('{}\n00:00:{:02},000 --> 00:00:{:02},500\nLine {}\n'
+                     .format(i + 1, i % 60, i % 60, i)
+                     for i in range(cues)).encode('utf-8')
+
+
+def _chunks(data):
+    size = DownloadService.CHUNK_SIZE
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def run():
+    results = []
+    for cues in CUES:
+        data = _subtitle(cues)
+        chunks = _chunks(gzip.compress(data))
+        seconds = min(timeit.repeat(
+            lambda: DownloadService._gunzip(chunks, io.BytesIO()),
+            repeat=REPEAT, number=NUMBER)) / NUMBER
+        results.append(dict(name='gunzip/{}'.format(cues),
+                            size=len(data), seconds=seconds,
+                            bytes_per_second=len(data) / seconds))
+    return results
+
+
+if __name__ == '__main__':
+    for r in run():
+        print(f"{r['name']:>20}: {r['seconds'] * 1e3:8.2f} ms, "
+              f"{r['bytes_per_second'] / 2 ** 20:8.1f} MiB/s")
@@ -0,0 +1,68 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import timeit
+
+from .context import service
+from service.MovieHash import movie_hash
+from pythonopensubtitles.utils import File
+
+SIZES = [
+    128 * 1024,
+    700 * 1024 * 1024,
+    4 * 1024 * 1024 * 1024,
+]
+REPEAT = 5
+NUMBER = 50
+
+
+def makeSparseFile(directory, size):
+    filePath = os.path.join(directory, 'movie-{}.mkv'.format(size))
+    with open(filePath, 'wb') as f:
+        f.write(os.urandom(64 * 1024))
+        f.truncate(size)
+        f.seek(size - 64 * 1024)
+        f.write(os.urandom(64 * 1024))
+    return filePath
+
+
+def _best(func):
+    return min(timeit.repeat(func, repeat=REPEAT, number=NUMBER)) / NUMBER
+
+
+def run():
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in SIZES:
+            filePath = makeSparseFile(directory, size)
+            assert movie_hash(filePath) == File(filePath).get_hash()
+            library = _best(lambda: File(filePath).get_hash())
+            native = _best(lambda: movie_hash(filePath))
+            results.append(dict(name='movie_hash/{}'.format(size),
+                                size=size, seconds=native,
+                                library=library, native=native,
+                                speedup=library / native))
+    return results
+
+
+if __name__ == '__main__':
+    for r in run():
+        print(f"{r['size']:>12} bytes: library {r['library'] * 1e6:8.1f} us, "
+              f"native {r['native'] * 1e6:8.1f} us, {r['speedup']:5.1f}x")
@@ -0,0 +1,108 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import tempfile
+import timeit
+import tracemalloc
+
+from .context import service
+from .MovieHash_bench import makeSparseFile
+from service.HashCache import HashCache
+from service.OpenSubService import OpenSubService, SEARCH_MAX_QUERIES
+
+SIZES = [
+    128 * 1024,
+    700 * 1024 * 1024,
+    4 * 1024 * 1024 * 1024,
+]
+RESULTS_PER_QUERY = [10, 500]
+REPEAT = 5
+NUMBER = 20
+
+
+class _Client(object):
+    """Answers SearchSubtitles with many subtitles per query."""
+
+    def __init__(self, count):
+        self._count = count
+        self.token = None
+        self.data = {}
+
+    def login(self, username, password):
+        self.data = dict(status='200 OK')
+        return 'token'
+
+    def no_operation(self):
+        self.data = dict(status='200 OK')
+        return True
+
+    def search_subtitles(self, queries):
+        self.data = dict(status='200 OK')
+        return [dict(QueryNumber=str(i), MovieHash=q['moviehash'],
+                     Score=float(j), SubSize='100', SubHash='', SubBad='0',
+                     SubRating='0.0', SubDownloadsCnt='1', MovieFPS='0',
+                     SubFeatured='0', SubEncoding='UTF-8',
+                     SubDownloadLink='', SubLanguageID='eng',
+                     SubFormat='srt', ISO639='en')
+                for i, q in enumerate(queries) for j in range(self._count)]
+
+
+def _best(func, number=NUMBER):
+    return min(timeit.repeat(func, repeat=REPEAT, number=number)) / number
+
+
+def run():
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        svc = OpenSubService()
+        cached = OpenSubService(hash_cache=HashCache.in_directory(directory))
+        for size in SIZES:
+            filePath = makeSparseFile(directory, size)
+            results.append(dict(name='calculate_hash/{}'.format(size),
+                                size=size,
+                                seconds=_best(
+                                    lambda: svc.calculate_hash(filePath))))
+            cached.calculate_hash(filePath)
+            results.append(dict(name='calculate_hash_cached/{}'.format(size),
+                                size=size,
+                                seconds=_best(
+                                    lambda: cached.calculate_hash(filePath))))
+
+    hashes = ['{:016x}'.format(i) for i in range(SEARCH_MAX_QUERIES)]
+    for count in RESULTS_PER_QUERY:
+        svc = OpenSubService()
+        svc._ost = _Client(count)
+        seconds = _best(lambda: svc.find_by_hashes(hashes), number=5)
+        # Memory held by the parsed results, without the server's response
+        data = svc._ost.search_subtitles(
+            [dict(moviehash=hash) for hash in hashes])
+        tracemalloc.start()
+        parsed = list(svc._candidates(data))
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del parsed
+        results.append(dict(name='find_by_hashes/{}'.format(count),
+                            subtitles=count * len(hashes),
+                            seconds=seconds,
+                            bytes_per_subtitle=memory / len(data)))
+    return results
+
+
+if __name__ == '__main__':
+    for r in run():
+        print(f"{r['name']:>40}: {r['seconds'] * 1e6:10.1f} us")
@@ -0,0 +1,56 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Time until the main window is shown, measured in a fresh process."""
+
+import json
+import os
+import subprocess
+import sys
+
+from .context import service
+import startup
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+REPEAT = 5
+
+
+def _start():
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    env[startup.ENV] = 'quit'
+    output = subprocess.run([sys.executable, 'main.py'], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            check=True).stderr
+    # The report is the last line
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def run():
+    reports = [_start() for i in range(REPEAT)]
+    best = min(reports, key=lambda r: r['steps'][-1]['ms'])
+    results = []
+    for step in best['steps']:
+        results.append(dict(name='startup/{}'.format(step['step']),
+                            seconds=step['ms'] / 1000,
+                            modules=step['modules']))
+    results[-1]['deferred_loaded'] = best['loaded']
+    return results
+
+
+if __name__ == '__main__':
+    print(json.dumps(run(), indent=2))
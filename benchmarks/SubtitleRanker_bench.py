@@ -0,0 +1,69 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import random
+import timeit
+
+from .context import service
+from service.SubtitleCandidate import SubtitleCandidate
+from service.SubtitleRanker import SubtitleRanker
+
+CANDIDATES = [100, 5000]
+LANGUAGES = ['eng', 'bul', 'fre']
+REPEAT = 5
+NUMBER = 10
+
+
+def _candidates(count):
+    rnd = random.Random(0)
+    return [SubtitleCandidate(
+        hash='{:032x}'.format(i),
+        size='40000',
+        bad=rnd.choice(['0'] * 9 + ['1']),
+        rating='{:.1f}'.format(rnd.uniform(0, 10)),
+        downloads=str(rnd.randint(0, 100000)),
+        fps=rnd.choice(['23.976', '25.000', '0']),
+        featured=rnd.choice(['0', '1']),
+        encoding='UTF-8',
+        download_link='',
+        language_id=rnd.choice(LANGUAGES + ['ger']),
+        format=rnd.choice(['srt', 'sub', 'ass']),
+        language_id_iso='',
+        score=rnd.uniform(0, 20),
+        matched_by=rnd.choice(['moviehash', 'tag']))
+        for i in range(count)]
+
+
+def run():
+    results = []
+    ranker = SubtitleRanker()
+    for count in CANDIDATES:
+        candidates = _candidates(count)
+        seconds = min(timeit.repeat(
+            lambda: ranker.best_per_language(candidates, LANGUAGES, 23.976),
+            repeat=REPEAT, number=NUMBER)) / NUMBER
+        results.append(dict(name='best_per_language/{}'.format(count),
+                            candidates=count, seconds=seconds,
+                            candidates_per_second=count / seconds))
+    return results
+
+
+if __name__ == '__main__':
+    for r in run():
+        print(f"{r['name']:>24}: {r['seconds'] * 1e3:8.2f} ms, "
+              f"{r['candidates_per_second']:10.0f} candidates/s")
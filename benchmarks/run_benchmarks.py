@@ -0,0 +1,134 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Runs the benchmarks and reports the results as JSON.
+
+    python -m benchmarks.run_benchmarks --output bench-0.0.1.json
+    python -m benchmarks.run_benchmarks --baseline bench-0.0.1.json
+
+Every result has a unique ``name`` and the ``seconds`` it took, lower is
+better.  With ``--baseline``, results more than ``--tolerance`` slower than
+the baseline are reported, and the exit status is 1.
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+
+from .context import service
+
+BENCHMARKS = ['MovieHash', 'OpenSubService', 'SubtitleRanker',
+              'DownloadService', 'BatchRunner', 'Startup',
+              'AsyncOpenSubService']
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _version():
+    with open(os.path.join(ROOT, 'doc', 'VERSION')) as f:
+        return f.read().strip()
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'log', '--pretty=format:%h', '-n', '1'], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names=BENCHMARKS):
+    results = []
+    for name in names:
+        print("Running {}...".format(name), file=sys.stderr, flush=True)
+        module = importlib.import_module('benchmarks.{}_bench'.format(name))
+        for result in module.run():
+            result['benchmark'] = name
+            results.append(result)
+    return dict(version=_version(),
+                commit=_commit(),
+                python=platform.python_version(),
+                platform=platform.platform(),
+                machine=platform.machine(),
+                cpus=os.cpu_count(),
+                timestamp=datetime.datetime.now().isoformat(),
+                results=results)
+
+
+def compare(report, baseline, tolerance):
+    """Prints the change against ``baseline`` and returns the names of the
+    results that regressed."""
+    before = {r['name']: r['seconds'] for r in baseline['results']}
+    regressions = []
+    for r in report['results']:
+        if r['name'] not in before:
+            continue
+        ratio = r['seconds'] / before[r['name']]
+        regressed = ratio > 1 + tolerance
+        if regressed:
+            regressions.append(r['name'])
+        print("{:>40}: {:12.6f} s -> {:12.6f} s ({:+6.1%}){}".format(
+            r['name'], before[r['name']], r['seconds'], ratio - 1,
+            "  REGRESSION" if regressed else ""), file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='run_benchmarks',
+        description="Run the benchmarks and report the results as JSON.")
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help="benchmarks to run (default: all of {})".format(
+                            ', '.join(BENCHMARKS)))
+    parser.add_argument('-o', '--output',
+                        help="write the report to this file instead of "
+                             "stdout")
+    parser.add_argument('--baseline',
+                        help="report from an earlier run to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="slowdown that counts as a regression "
+                             "(default: %(default)s)")
+    args = parser.parse_args(argv)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark '{}'".format(name))
+
+    report = run(args.benchmarks or BENCHMARKS)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Headless command-line interface.
+
+Drives the services directly and never imports Qt, so that it starts fast
+and runs on machines without a display.  Progress is printed to stdout as
+one JSON object per line.
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import queue
+import sys
+from os import path
+import log
+from log import logger
+
+PROG = 'Subtitles'
+
+COMMANDS = ('scan', 'watch')
+
+LANGUAGES_FILE = path.join(path.dirname(path.abspath(__file__)),
+                           'resources', 'languages.json')
+
+
+def data_location():
+    """Returns the directory that QStandardPaths.AppLocalDataLocation
+    resolves to in the GUI, so that both share their caches."""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or \
+            path.expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base = path.expanduser('~/Library/Application Support')
+    else:
+        base = os.environ.get('XDG_DATA_HOME') or \
+            path.expanduser('~/.local/share')
+    return path.join(base, PROG)
+
+
+def _parse_args(argv):
+    # main.py imports this module to dispatch its arguments, so the
+    # services are only imported once a command runs.
+    from service.EncodingService import codec_name
+    from service.FolderWatcher import FolderWatcher
+    from service.OpenSubService import DEFAULT_LANGUAGES
+
+    parser = argparse.ArgumentParser(
+        prog=PROG, description="Download subtitles for video files.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('--lang', default=','.join(DEFAULT_LANGUAGES),
+                         help="comma-separated subtitle languages, as "
+                              "ISO 639-1 codes or language IDs; the best "
+                              "subtitle is downloaded for each "
+                              "(default: %(default)s)")
+    options.add_argument('--encoding',
+                         help="convert the subtitles to this encoding, "
+                              "e.g. UTF-8 (default: keep them as they are)")
+    options.add_argument('--jobs', type=int, default=4,
+                         help="number of hashing and download threads "
+                              "(default: %(default)s)")
+    options.add_argument('--cache-dir', default=data_location(),
+                         help="where to keep the caches "
+                              "(default: %(default)s)")
+    options.add_argument('--no-cache', action='store_true',
+                         help="neither read nor write the caches")
+    options.add_argument('--clear-cache', action='store_true',
+                         help="clear the caches before starting")
+    options.add_argument('--server', metavar='URL',
+                         help="XML-RPC endpoint to use instead of "
+                              "OpenSubtitles.org, e.g. a local test server")
+    options.add_argument('-v', '--verbose', action='store_true',
+                         help="log debug messages to stderr")
+
+    scan = subparsers.add_parser(
+        'scan', parents=[options],
+        help="Download subtitles for video files and directories")
+    scan.add_argument('paths', nargs='+', metavar='PATH',
+                      help="video file or directory to scan recursively; "
+                           "videos that already have subtitles in every "
+                           "language are skipped")
+
+    watch = subparsers.add_parser(
+        'watch', parents=[options],
+        help="Download subtitles for videos as they arrive in directories")
+    watch.add_argument('paths', nargs='+', metavar='DIR',
+                       help="directory to watch recursively; videos that "
+                            "are there already are left alone")
+    watch.add_argument('--settle', type=float, default=FolderWatcher.SETTLE,
+                       help="seconds a new video must stay unchanged "
+                            "before it counts as written "
+                            "(default: %(default)s)")
+    watch.add_argument('--interval', type=float,
+                       default=FolderWatcher.INTERVAL,
+                       help="seconds between checks of the directories "
+                            "(default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.encoding and not codec_name(args.encoding):
+        parser.error("unknown encoding '{}'".format(args.encoding))
+    return args
+
+
+def _print_event(event):
+    print(json.dumps(event), flush=True)
+
+
+@contextlib.contextmanager
+def _batch_runner(args):
+    """Yields a BatchRunner and the languages for the options in ``args``,
+    and closes the services afterwards."""
+    from service.BatchRunner import BatchRunner
+    from service.DownloadService import DownloadService
+    from service.EncodingService import EncodingService
+    from service.HashCache import HashCache
+    from service.OpenSubService import OpenSubService
+    from service.RateLimiter import RateLimiter
+    from service.ResultCache import ResultCache
+
+    hashCache = resultCache = None
+    if not args.no_cache:
+        hashCache = HashCache.in_directory(args.cache_dir)
+        resultCache = ResultCache.in_directory(args.cache_dir)
+        if args.clear_cache:
+            hashCache.invalidate()
+            resultCache.invalidate()
+
+    rateLimiter = RateLimiter()
+    subService = OpenSubService(hash_cache=hashCache,
+                                result_cache=resultCache,
+                                server_url=args.server,
+                                languages_file=LANGUAGES_FILE,
+                                rate_limiter=rateLimiter)
+    downloadService = DownloadService(pool_size=args.jobs,
+                                      rate_limiter=rateLimiter)
+    languages = subService.language_ids(args.lang.split(','))
+    runner = BatchRunner(subService, downloadService,
+                         languages=languages,
+                         jobs=args.jobs,
+                         on_event=_print_event,
+                         encoding=args.encoding,
+                         encodingService=EncodingService())
+    try:
+        yield runner, languages
+        _print_event(dict(event='rate_limits', **rateLimiter.metrics()))
+    finally:
+        downloadService.close()
+        if hashCache:
+            hashCache.close()
+        if resultCache:
+            resultCache.close()
+
+
+def scan(args):
+    from service.LibraryScanner import LibraryScanner
+
+    with _batch_runner(args) as (runner, languages):
+        scanner = LibraryScanner(languages=languages)
+        stats = runner.run(scanner.scan(args.paths))
+    return 1 if stats.failed else 0
+
+
+def watch(args):
+    """Runs a batch for every group of videos that arrives, until
+    interrupted."""
+    from service.FolderWatcher import FolderWatcher
+
+    arrived = queue.Queue()
+    with _batch_runner(args) as (runner, languages):
+        watcher = FolderWatcher(args.paths, on_files=arrived.put,
+                                languages=languages, settle=args.settle,
+                                interval=args.interval)
+        watcher.start()
+        _print_event(dict(event='watching', paths=args.paths))
+        try:
+            while True:
+                filePaths = arrived.get()
+                _print_event(dict(event='arrived', files=filePaths))
+                runner.run(filePaths)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.stop()
+    return 0
+
+
+def main(argv):
+    args = _parse_args(argv)
+    log.init(level=logging.DEBUG if args.verbose else logging.WARNING,
+             stream=sys.stderr)
+    logger.debug("Arguments: {}".format(args))
+    if args.command == 'scan':
+        return scan(args)
+    if args.command == 'watch':
+        return watch(args)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
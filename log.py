@@ -22,12 +22,11 @@ import sys
 logger = logging.getLogger('SubFinder')
 
 
-def init():
-    # TODO: Make configurable
-    logger.setLevel(logging.DEBUG)
+def init(level=logging.DEBUG, stream=sys.stdout):
+    logger.setLevel(level)
     # TODO: Create a file handler and log to a file
-    console_handler = logging.StreamHandler(stream=sys.stdout)
-    console_handler.setLevel(logging.DEBUG)
+    console_handler = logging.StreamHandler(stream=stream)
+    console_handler.setLevel(level)
     formatter = logging.Formatter(
         "[%(asctime)s %(levelname)s %(thread)x] "
         "%(filename)s:%(lineno)d:%(funcName)s: %(message)s")
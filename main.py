@@ -18,22 +18,31 @@
 # You should have received a copy of the GNU General Public License
 # along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
 
+import startup
 import sys
 import signal
+from functools import partial
 import log
-from PyQt5.Qt import (
-    PYQT_VERSION_STR,
-    QSettings,
-)
+import cli
 from log import logger
-from Application import Application
-from ui.MainWindow import MainWindow
 
 
-signal.signal(signal.SIGINT, signal.SIG_DFL)
+def gui_main():
+    # Ctrl-C quits, as Qt's event loop would not run the Python handler.
+    # The command-line interface keeps it, to stop cleanly.
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
 
+    # Qt is only imported here, so that the command-line interface does not
+    # pay for it.
+    from PyQt5.QtCore import (
+        PYQT_VERSION_STR,
+        QSettings,
+        QTimer,
+    )
+    from Application import Application
+    from ui.MainWindow import MainWindow
+    startup.mark('import')
 
-if __name__ == "__main__":
     log.init()
 
     logger.info("Using PyQt5 version {}".format(PYQT_VERSION_STR))
@@ -43,13 +52,32 @@ if __name__ == "__main__":
         QSettings.setDefaultFormat(QSettings.IniFormat)
 
     app = Application(sys.argv)
+    startup.mark('application')
     mainWin = MainWindow()
+    startup.mark('window')
     mainWin.show()
+    startup.mark('show')
+    if startup.enabled():
+        # Runs once the first events, including the first paint, are done
+        QTimer.singleShot(0, partial(startup_report, app))
 
     # TODO: For easier testing
-    if len(sys.argv) == 2:
+    if len(sys.argv) >= 2:
         logger.debug(
-            "Processing file from command line: '{}'".format(sys.argv[1]))
-        mainWin.processVideoFile(sys.argv[1])
+            "Processing files from command line: {}".format(sys.argv[1:]))
+        mainWin.processVideoFiles(sys.argv[1:])
+
+    return app.exec_()
+
 
-    sys.exit(app.exec_())
+def startup_report(app):
+    startup.mark('event loop')
+    startup.write_report()
+    if startup.quit_after_report():
+        app.quit()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] in cli.COMMANDS:
+        sys.exit(cli.main(sys.argv[1:]))
+    sys.exit(gui_main())
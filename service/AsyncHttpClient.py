@@ -0,0 +1,218 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import collections
+import ssl
+from urllib.parse import urljoin, urlsplit
+from log import logger
+
+HttpResponse = collections.namedtuple('HttpResponse',
+                                      'url status reason headers body')
+
+
+class HttpError(Exception):
+    def __init__(self, url, status, reason):
+        super().__init__("{} {} for {}".format(status, reason, url))
+        self.url = url
+        self.status = status
+        self.reason = reason
+
+
+class AsyncHttpClient(object):
+    """A minimal HTTP/1.1 client on asyncio streams.
+
+    Enough for XML-RPC and subtitle downloads: requests with a body,
+    Content-Length or chunked responses, redirects and keep-alive
+    connections, which are pooled per host and used by one request at a
+    time.  Must be used from a single event loop.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    TIMEOUT = 30  # seconds, for a whole request
+    MAX_IDLE = 8  # idle connections kept per host
+    MAX_REDIRECTS = 5
+    REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+    def __init__(self, user_agent=None, timeout=TIMEOUT, max_idle=MAX_IDLE):
+        super().__init__()
+        self._user_agent = user_agent
+        self._timeout = timeout
+        self._max_idle = max_idle
+        self._idle = {}  # (scheme, host, port) -> [(reader, writer)]
+        self._ssl = None
+
+    async def request(self, method, url, body=None, headers=None,
+                      on_chunk=None):
+        """Returns the ``HttpResponse`` to the request, following redirects;
+        raises HttpError for statuses from 400 on.
+
+        With ``on_chunk``, the body of a successful response is passed to it
+        piece by piece as it is received, instead of being returned.
+        """
+        for redirect in range(AsyncHttpClient.MAX_REDIRECTS + 1):
+            response = await asyncio.wait_for(
+                self._request(method, url, body, headers, on_chunk),
+                self._timeout)
+            location = response.headers.get('location')
+            if response.status not in AsyncHttpClient.REDIRECT_STATUSES \
+                    or not location:
+                break
+            url = urljoin(url, location)
+            if response.status == 303:
+                method, body = 'GET', None
+            logger.debug("Redirected to {}".format(url))
+        if response.status >= 400:
+            raise HttpError(url, response.status, response.reason)
+        return response
+
+    def close(self):
+        for connections in self._idle.values():
+            for reader, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+    async def _request(self, method, url, body, headers, on_chunk):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname,
+               parts.port or (443 if parts.scheme == 'https' else 80))
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        head = ['{} {} HTTP/1.1'.format(method, target),
+                'Host: {}'.format(parts.netloc)]
+        if self._user_agent:
+            head.append('User-Agent: {}'.format(self._user_agent))
+        for name, value in (headers or {}).items():
+            head.append('{}: {}'.format(name, value))
+        if body is not None:
+            head.append('Content-Length: {}'.format(len(body)))
+        message = ('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + \
+            (body or b'')
+
+        while True:
+            reader, writer, reused = await self._connect(key)
+            try:
+                writer.write(message)
+                await writer.drain()
+                status, reason, response_headers, keep_alive = \
+                    await self._read_head(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    # The server closed the idle connection; try a new one
+                    continue
+                raise
+            except BaseException:
+                # Cancelled or timed out halfway through the request
+                writer.close()
+                raise
+            break
+
+        try:
+            # Only a successful body goes to on_chunk
+            chunks = [] if on_chunk is None or status >= 300 else None
+            await self._read_body(reader, method, status, response_headers,
+                                  on_chunk if chunks is None
+                                  else chunks.append)
+        except BaseException:
+            writer.close()
+            raise
+        # Without a length, the body ends when the server closes
+        framed = 'content-length' in response_headers or \
+            'chunked' in response_headers.get('transfer-encoding', '')
+        if keep_alive and framed:
+            self._release(key, reader, writer)
+        else:
+            writer.close()
+        return HttpResponse(url, status, reason, response_headers,
+                            b''.join(chunks) if chunks is not None else None)
+
+    async def _connect(self, key):
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        scheme, host, port = key
+        context = None
+        if scheme == 'https':
+            if self._ssl is None:
+                self._ssl = ssl.create_default_context()
+            context = self._ssl
+        reader, writer = await asyncio.open_connection(host, port,
+                                                       ssl=context)
+        return reader, writer, False
+
+    def _release(self, key, reader, writer):
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self._max_idle:
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+    @staticmethod
+    async def _read_head(reader):
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed")
+        version, status, *reason = line.decode('latin-1').split(None, 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n'):
+                break
+            if not line:
+                raise asyncio.IncompleteReadError(b'', None)
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            headers[name] = headers[name] + ', ' + value \
+                if name in headers else value
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' \
+            else connection == 'keep-alive'
+        return int(status), ''.join(reason).strip(), headers, keep_alive
+
+    @staticmethod
+    async def _read_body(reader, method, status, headers, on_chunk):
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            return
+        if 'chunked' in headers.get('transfer-encoding', ''):
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if not size:
+                    break
+                on_chunk(await reader.readexactly(size))
+                await reader.readline()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass  # Trailers
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            while remaining:
+                chunk = await reader.readexactly(
+                    min(remaining, AsyncHttpClient.CHUNK_SIZE))
+                remaining -= len(chunk)
+                on_chunk(chunk)
+        else:
+            while True:
+                chunk = await reader.read(AsyncHttpClient.CHUNK_SIZE)
+                if not chunk:
+                    break
+                on_chunk(chunk)
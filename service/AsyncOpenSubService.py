@@ -0,0 +1,200 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import contextlib
+import os
+import tempfile
+import zlib
+from functools import partial
+from os import path
+from xmlrpc.client import dumps, loads
+from service.AsyncHttpClient import AsyncHttpClient
+from service.DownloadService import (
+    PROG, DownloadCancelled, DownloadService, replace_file
+)
+from service.OpenSubService import (
+    SEARCH_MAX_QUERIES, SEARCH_REFUSED, SEARCH_THROTTLED, NoSubtitlesFound,
+    OpenSubService, SearchPlan, search_outcome
+)
+from service.RateLimiter import DOWNLOAD, SEARCH, throttle_status
+from log import logger
+
+
+class AsyncOpenSubService(object):
+    """Searches OpenSubtitles.org and downloads subtitles from an asyncio
+    event loop.
+
+    The asynchronous counterpart of ``OpenSubService`` and
+    ``DownloadService``: the calls are coroutines that share one HTTP
+    client, so any number of them can be in flight on the thread of the
+    loop.  The server, the caches, the language lists and the session are
+    those of ``service``, an ``OpenSubService``.  With a ``rate_limiter``,
+    the calls use its budgets and throttled calls are retried.
+
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, service, rate_limiter=None, http=None):
+        super().__init__()
+        self._service = service
+        self._rate_limiter = rate_limiter
+        self._http = http or AsyncHttpClient(service.user_agent)
+
+    def close(self):
+        self._http.close()
+
+    async def login(self, username='', password=''):
+        """Returns the session token; raises LoginError if the server
+        refuses the login."""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, partial(self._service.login, username, password))
+
+    async def find_by_hash(self, hash, size=None, filePath=None):
+        """Returns the subtitles for one movie; raises NoSubtitlesFound if
+        there are none."""
+        if not hash:
+            raise ValueError('hash is empty')
+        result = (await self.find_by_hashes(
+            [hash], {hash: size} if size else None,
+            paths={hash: filePath} if filePath else None))[hash]
+        if not result:
+            raise NoSubtitlesFound(hash)
+        return result
+
+    async def find_by_hashes(self, hashes, sizes=None, languages=None,
+                             chunk_size=SEARCH_MAX_QUERIES, paths=None,
+                             recheck=()):
+        """Like ``OpenSubService.find_by_hashes()``, with the chunks
+        searched concurrently."""
+        plan = self._service.plan_search(hashes, sizes, languages,
+                                         chunk_size, paths, recheck)
+        result = dict(plan.cached)
+
+        async def search(chunk):
+            data = await self._search(SearchPlan.queries(chunk))
+            result.update(plan.results(chunk, data))
+
+        await asyncio.gather(*[search(chunk) for chunk in plan.chunks])
+        return {hash: result[hash] for hash in plan.hashes}
+
+    async def get_languages(self):
+        """Returns the ``Language`` list, from the cache if possible."""
+        cached = self._service.cached_languages()
+        if cached is not None:
+            return cached
+        data = await self._call('GetSubLanguages')
+        return self._service.store_languages(data.get('data') or [])
+
+    async def download_subtitle(self, subtitle, moviePath, cancelled=None):
+        """Like ``DownloadService.download_subtitle()``.
+
+        Cancelling the task also stops the download and leaves the subtitle
+        file as it was.
+        """
+        url = subtitle.download_link
+        filename = DownloadService.subtitle_path(moviePath, subtitle)
+        logger.debug("Downloading subtitle {} to '{}'".format(url, filename))
+
+        fd, tempPath = tempfile.mkstemp(prefix=PROG, suffix='.tmp',
+                                        dir=path.dirname(filename))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+                def write(chunk):
+                    if cancelled and cancelled():
+                        raise DownloadCancelled("Download cancelled")
+                    f.write(decompressor.decompress(chunk))
+
+                async def download():
+                    async with self._slot(DOWNLOAD):
+                        await self._http.request('GET', url, on_chunk=write)
+                await self._retry(download)
+                f.write(decompressor.flush())
+                if not decompressor.eof:
+                    raise IOError("Truncated subtitle download")
+            replace_file(tempPath, filename)
+        except BaseException:
+            os.remove(tempPath)
+            raise
+        return filename
+
+    def _slot(self, kind):
+        if self._rate_limiter:
+            return self._rate_limiter.async_slot(kind)
+        return _null_slot()
+
+    async def _retry(self, call):
+        # Retries a call the server throttled, only with a limiter, which
+        # pauses the calls before the retry
+        throttled = 0
+        while True:
+            try:
+                return await call()
+            except Exception as e:
+                if not throttle_status(e) or not self._rate_limiter or \
+                        throttled >= OpenSubService.THROTTLE_RETRIES:
+                    raise
+                throttled += 1
+
+    async def _call(self, method, *params):
+        body = dumps(params, method, allow_none=True).encode('utf-8')
+
+        async def call():
+            async with self._slot(SEARCH) as slot:
+                response = await self._http.request(
+                    'POST', self._service.server_url, body,
+                    {'Content-Type': 'text/xml'})
+                data = loads(response.body)[0][0]
+                status = data.get('status') or ''
+                if slot and status[:3] in ('429', '503'):
+                    slot.throttled()
+                return data
+        return await self._retry(call)
+
+    async def _session_token(self):
+        # Logging in and refreshing the session block, so only they run on
+        # the executor
+        session = self._service.session
+        return session.ready_token() or \
+            await asyncio.get_running_loop().run_in_executor(
+                None, session.token)
+
+    async def _search(self, queries):
+        refused = throttled = 0
+        while True:
+            token = await self._session_token()
+            data = await self._call('SearchSubtitles', token, queries)
+            outcome = search_outcome(
+                data.get('status') or '',
+                self._rate_limiter and
+                throttled < OpenSubService.THROTTLE_RETRIES, refused)
+            if outcome == SEARCH_THROTTLED:
+                throttled += 1
+            elif outcome == SEARCH_REFUSED:
+                refused += 1
+                self._service.session.invalidate(token)
+            else:
+                self._service.session.touch(token)
+                return data.get('data') or []
+
+
+@contextlib.asynccontextmanager
+async def _null_slot():
+    yield None
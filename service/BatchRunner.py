@@ -0,0 +1,199 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from os import path
+from service.BatchStats import BatchStats
+from service.HashExecutor import HashExecutor
+from service.OpenSubService import SEARCH_MAX_QUERIES, NoSubtitlesFound
+from service.SubtitleRanker import SubtitleRanker
+from log import logger
+
+
+class BatchRunner(object):
+    """Runs Hash -> Find Subtitles -> Download Subtitles without Qt.
+
+    This is the headless counterpart of ``ui.pipeline.Pipeline``.  Files are
+    hashed on up to ``jobs`` threads, ``HashExecutor.PER_DEVICE`` at a time
+    per device, searched in chunks on a single thread (the XML-RPC client
+    is not thread-safe) and downloaded on ``jobs`` threads.
+    The best subtitle is downloaded for each of ``languages`` and, if an
+    ``encoding`` is given, converted to it on the download thread.
+    ``on_event`` is called with a dict for every step, from any thread.
+    """
+
+    def __init__(self, subtitleService, downloadService, languages=None,
+                 jobs=4, on_event=None, ranker=None, encoding=None,
+                 encodingService=None):
+        super().__init__()
+        self._subService = subtitleService
+        self._downloadService = downloadService
+        self._languages = languages
+        self._jobs = jobs
+        self._on_event = on_event or (lambda event: None)
+        self._ranker = ranker or SubtitleRanker()
+        self._encoding = encoding
+        self._encService = encodingService
+        self._lock = threading.RLock()
+        self._searches = []
+        self._downloads = []
+        self._files_by_hash, self._sizes = {}, {}
+        self._pending = {}
+        self.stats = BatchStats()
+
+    def run(self, filePaths):
+        """Processes ``filePaths`` and returns the batch statistics.
+
+        ``filePaths`` may be any iterable, such as a generator that is still
+        discovering files; they are searched in chunks as they are hashed.
+        """
+        self.stats.reset()
+        self._searches = []
+        self._downloads = []
+        self._files_by_hash, self._sizes = {}, {}
+        self._pending = {}
+        with HashExecutor(max_workers=self._jobs) as hashPool, \
+                ThreadPoolExecutor(1, 'search') as searchPool, \
+                ThreadPoolExecutor(self._jobs, 'download') as downloadPool:
+            self._search_pool = searchPool
+            self._download_pool = downloadPool
+
+            hashes = []
+            for filePath in filePaths:
+                self.stats.file_queued()
+                hashes.append(hashPool.submit(filePath, self._hash,
+                                              filePath))
+            wait(hashes)
+
+            with self._lock:
+                self._flush_search()
+            # Downloads are submitted by the searches, so wait for those first
+            wait(self._searches)
+            wait(self._downloads)
+        self._event('finished', stats=self._stats_dict())
+        return self.stats
+
+    def _event(self, name, **kwargs):
+        event = dict(event=name, **kwargs)
+        with self._lock:
+            self._on_event(event)
+
+    def _fail(self, filePath, stage, e):
+        logger.error(f"{stage} failed for '{filePath}': {e}")
+        self.stats.file_failed()
+        self._event('failed', file=filePath, stage=stage, error=str(e))
+
+    def _hash(self, filePath):
+        try:
+            hash = self._subService.calculate_hash(filePath)
+            size = path.getsize(filePath)
+        except Exception as e:
+            self._fail(filePath, "Hash", e)
+            return
+        self.stats.file_hashed(size)
+        self._event('hashed', file=filePath, hash=hash, size=size)
+
+        with self._lock:
+            self._files_by_hash.setdefault(hash, []).append(filePath)
+            self._sizes[hash] = size
+            if len(self._files_by_hash) >= SEARCH_MAX_QUERIES:
+                self._flush_search()
+
+    def _flush_search(self):
+        # Called with the lock held
+        if self._files_by_hash:
+            self._searches.append(self._search_pool.submit(
+                self._search, self._files_by_hash, self._sizes))
+            self._files_by_hash, self._sizes = {}, {}
+
+    def _search(self, filesByHash, sizes):
+        filePaths = [f for files in filesByHash.values() for f in files]
+        try:
+            paths = {hash: files[0] for hash, files in filesByHash.items()}
+            result = self._subService.find_by_hashes(
+                list(filesByHash), sizes, languages=self._languages,
+                paths=paths)
+        except Exception as e:
+            for filePath in filePaths:
+                self._fail(filePath, "Find Subtitles", e)
+            return
+
+        for hash, files in filesByHash.items():
+            subtitles = result.get(hash) or []
+            subtitles = self._ranker.best_per_language(
+                subtitles, self._languages,
+                self._ranker.video_fps(subtitles))
+            for filePath in files:
+                if not subtitles:
+                    self._fail(filePath, "Find Subtitles",
+                               NoSubtitlesFound(hash))
+                    continue
+                self.stats.subtitles_found()
+                self._event('found', file=filePath, count=len(subtitles),
+                            languages=[s.language_id for s in subtitles])
+                with self._lock:
+                    self._pending[filePath] = [len(subtitles), None]
+                    for subtitle in subtitles:
+                        self._downloads.append(self._download_pool.submit(
+                            self._download, subtitle, filePath))
+
+    def _download(self, subtitle, filePath):
+        error = None
+        try:
+            subtitlePath = self._downloadService.download_subtitle(
+                subtitle, filePath)
+        except Exception as e:
+            error = e
+        else:
+            self._convert(subtitle, subtitlePath)
+            self._event('downloaded', file=filePath, subtitle=subtitlePath,
+                        language=subtitle.language_id)
+
+        # The file is done once all of its languages are
+        with self._lock:
+            pending = self._pending[filePath]
+            pending[0] -= 1
+            pending[1] = pending[1] or error
+            if pending[0]:
+                return
+            del self._pending[filePath]
+        if pending[1]:
+            self._fail(filePath, "Download Subtitles", pending[1])
+        else:
+            self.stats.file_downloaded()
+
+    def _convert(self, subtitle, subtitlePath):
+        if not self._encService or not self._encoding:
+            return
+        try:
+            self._encService.convert_file(subtitlePath, self._encoding,
+                                          subtitle.encoding)
+        except Exception as e:
+            # The subtitle is still usable in its original encoding
+            logger.warning(f"Unable to convert '{subtitlePath}' to "
+                           f"{self._encoding}: {e}")
+
+    def _stats_dict(self):
+        return dict(queued=self.stats.queued,
+                    downloaded=self.stats.downloaded,
+                    failed=self.stats.failed,
+                    elapsed=round(self.stats.elapsed, 3),
+                    files_per_second=round(self.stats.files_per_second, 3),
+                    bytes_hashed_per_second=round(
+                        self.stats.bytes_hashed_per_second))
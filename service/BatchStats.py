@@ -0,0 +1,97 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+import time
+
+
+class BatchStats(object):
+    """Aggregate counters for a batch of video files.
+
+    All methods are thread-safe, so the counters can be updated directly
+    from worker threads.  ``bytes_hashed`` counts the size of the video
+    files that were hashed, not the (much smaller) number of bytes read.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._start = None
+            self.queued = 0
+            self.hashed = 0
+            self.bytes_hashed = 0
+            self.found = 0
+            self.downloaded = 0
+            self.failed = 0
+
+    def file_queued(self):
+        with self._lock:
+            if self._start is None:
+                self._start = time.monotonic()
+            self.queued += 1
+
+    def file_hashed(self, size):
+        with self._lock:
+            self.hashed += 1
+            self.bytes_hashed += size
+
+    def subtitles_found(self):
+        with self._lock:
+            self.found += 1
+
+    def file_downloaded(self):
+        with self._lock:
+            self.downloaded += 1
+
+    def file_failed(self):
+        with self._lock:
+            self.failed += 1
+
+    def file_retried(self):
+        with self._lock:
+            self.failed = max(0, self.failed - 1)
+
+    @property
+    def completed(self):
+        return self.downloaded + self.failed
+
+    @property
+    def elapsed(self):
+        if self._start is None:
+            return 0.0
+        return time.monotonic() - self._start
+
+    @property
+    def files_per_second(self):
+        elapsed = self.elapsed
+        return self.completed / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def bytes_hashed_per_second(self):
+        elapsed = self.elapsed
+        return self.bytes_hashed / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.completed}/{self.queued} files " \
+            f"({self.downloaded} downloaded, {self.failed} failed) " \
+            f"in {self.elapsed:.1f}s, {self.files_per_second:.2f} files/s, " \
+            f"{self.bytes_hashed_per_second / (1024 * 1024):.1f} MiB/s hashed"
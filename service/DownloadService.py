@@ -0,0 +1,157 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import os
+import stat
+import tempfile
+import zlib
+import requests
+from os import path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from service.RateLimiter import DOWNLOAD, THROTTLE_STATUSES
+from log import logger
+
+PROG = 'Subtitles'
+
+
+def _umask():
+    # Read once, while the process is still single-threaded, since reading
+    # it means setting it
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+_UMASK = _umask()
+
+
+def replace_file(tempPath, filePath):
+    """Moves ``tempPath``, made by ``tempfile.mkstemp()`` and thus only
+    readable by its owner, over ``filePath``, with the mode of the file it
+    replaces or that of a new file."""
+    try:
+        mode = stat.S_IMODE(os.stat(filePath).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    os.chmod(tempPath, mode)
+    os.replace(tempPath, filePath)
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class DownloadService(object):
+    """Downloads subtitles over a shared, keep-alive HTTP session.
+
+    The session is shared by all worker threads; ``pool_size`` should match
+    the number of threads downloading concurrently.  Connection errors and
+    transient server errors are retried with exponential backoff.  With a
+    ``rate_limiter``, downloads use its download budget, and downloads the
+    server throttled are retried after the limiter's pause.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    POOL_SIZE = 4
+    TIMEOUT = (10, 30)  # (connect, read) seconds
+    RETRIES = 3
+    BACKOFF = 0.5  # seconds, doubled after every retry
+    # Not the throttling statuses, which are left to the rate limiter
+    RETRY_STATUSES = (500, 502, 504)
+    THROTTLE_RETRIES = 3
+
+    def __init__(self, pool_size=POOL_SIZE, timeout=TIMEOUT, retries=RETRIES,
+                 backoff=BACKOFF, rate_limiter=None):
+        super().__init__()
+        self._timeout = timeout
+        self._rate_limiter = rate_limiter
+
+        retry = Retry(total=retries,
+                      backoff_factor=backoff,
+                      status_forcelist=DownloadService.RETRY_STATUSES)
+        adapter = HTTPAdapter(pool_maxsize=pool_size, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def close(self):
+        self._session.close()
+
+    @staticmethod
+    def subtitle_path(moviePath, subtitle):
+        """Returns where the subtitle for ``moviePath`` is saved."""
+        basename = path.splitext(path.basename(moviePath))[0]
+        sub_basename = "{}.{}.{}".format(
+            basename, subtitle.language_id, subtitle.format)
+        return path.join(path.dirname(moviePath), sub_basename)
+
+    def download_subtitle(self, subtitle, moviePath, cancelled=None):
+        """Downloads the gzipped subtitle next to ``moviePath``.
+
+        The response is decompressed while it is received, into a temporary
+        file in the destination directory, which then replaces the
+        subtitle file atomically.  ``cancelled`` is an optional callable
+        checked between chunks; once it returns True, the download stops
+        with DownloadCancelled and the subtitle file is left as it was.
+        """
+        url = subtitle.download_link
+        filename = self.subtitle_path(moviePath, subtitle)
+        logger.debug("Downloading subtitle {} to '{}'".format(url, filename))
+
+        throttled = 0
+        while True:
+            with self._slot() as slot, \
+                    self._session.get(url, stream=True,
+                                      timeout=self._timeout) as r:
+                if r.status_code in THROTTLE_STATUSES and slot and \
+                        throttled < DownloadService.THROTTLE_RETRIES:
+                    slot.throttled()
+                    throttled += 1
+                    continue
+                # The slot also counts a throttling HTTPError
+                r.raise_for_status()
+                fd, tempPath = tempfile.mkstemp(prefix=PROG, suffix='.tmp',
+                                                dir=path.dirname(filename))
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        self._gunzip(
+                            r.iter_content(DownloadService.CHUNK_SIZE), f,
+                            cancelled)
+                    replace_file(tempPath, filename)
+                except BaseException:
+                    os.remove(tempPath)
+                    raise
+            return filename
+
+    def _slot(self):
+        if self._rate_limiter:
+            return self._rate_limiter.slot(DOWNLOAD)
+        return contextlib.nullcontext()
+
+    @staticmethod
+    def _gunzip(chunks, f, cancelled=None):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            if cancelled and cancelled():
+                raise DownloadCancelled("Download cancelled")
+            f.write(decompressor.decompress(chunk))
+        f.write(decompressor.flush())
+        if not decompressor.eof:
+            raise IOError("Truncated subtitle download")
@@ -0,0 +1,132 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import codecs
+import encodings
+import threading
+
+
+def _normalize(name):
+    return encodings.normalize_encoding(name).lower()
+
+
+class EncodingRegistry(object):
+    """The text encodings that subtitles can be converted to.
+
+    Maps every alias of a codec, Python's and Qt's, to Python's canonical
+    codec name, and every codec to the name shown to the user.  The table
+    is built once per process, on first use of ``instance()``.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._codecs = {}  # normalized name -> Python codec name, or None
+        self._display = {}  # Python codec name -> display name
+        self._qt = {}  # Python codec name -> Qt codec name
+        self._names = None
+        self.qt_registered = False
+
+        for alias, module in encodings.aliases.aliases.items():
+            codec = self._lookup(module)
+            if not codec:
+                continue
+            self._codecs[_normalize(alias)] = codec
+            self._codecs[_normalize(module)] = codec
+            self._codecs[_normalize(codec)] = codec
+            self._display.setdefault(codec, codec.upper().replace('_', '-'))
+
+    @staticmethod
+    def instance():
+        if EncodingRegistry._instance is None:
+            with EncodingRegistry._instance_lock:
+                if EncodingRegistry._instance is None:
+                    EncodingRegistry._instance = EncodingRegistry()
+        return EncodingRegistry._instance
+
+    @staticmethod
+    def _lookup(name):
+        try:
+            info = codecs.lookup(name)
+        except (LookupError, TypeError):
+            return None
+        # Skip bytes-to-bytes codecs such as base64 and zlib
+        if not getattr(info, '_is_text_encoding', True):
+            return None
+        return info.name
+
+    def lookup(self, name):
+        """Returns Python's canonical name for the text encoding ``name``,
+        or None if there is no such encoding."""
+        if not name:
+            return None
+        key = _normalize(name)
+        try:
+            return self._codecs[key]
+        except KeyError:
+            codec = self._lookup(name)
+            self._codecs[key] = codec
+            if codec:
+                with self._lock:
+                    if codec not in self._display:
+                        self._display[codec] = codec.upper().replace('_', '-')
+                        self._names = None
+            return codec
+
+    def register_qt_codec(self, name, aliases=()):
+        """Registers a Qt codec, so that its name is the one shown for the
+        Python codec it matches."""
+        codec = self.lookup(name)
+        if not codec:
+            for alias in aliases:
+                codec = self.lookup(alias)
+                if codec:
+                    break
+        if not codec:
+            return
+        for alias in (name,) + tuple(aliases):
+            key = _normalize(alias)
+            if not self._codecs.get(key):
+                self._codecs[key] = codec
+        with self._lock:
+            self._qt.setdefault(codec, name)
+            self._names = None
+
+    def display_name(self, name):
+        """Returns the name shown for the encoding ``name``, or None."""
+        codec = self.lookup(name)
+        if not codec:
+            return None
+        return self._qt.get(codec) or self._display.get(codec)
+
+    def qt_name(self, name):
+        return self._qt.get(self.lookup(name))
+
+    @property
+    def names(self):
+        """The display names of all encodings, sorted."""
+        with self._lock:
+            if self._names is None:
+                self._names = tuple(sorted(
+                    (self._qt.get(codec) or display
+                     for codec, display in self._display.items()),
+                    key=str.lower))
+            return self._names
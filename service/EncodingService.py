@@ -16,24 +16,112 @@
 # You should have received a copy of the GNU General Public License
 # along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
 
-import encodings
+import codecs
+import os
+import stat
+import tempfile
+from os import path
+from service.EncodingRegistry import EncodingRegistry
+from log import logger
+
+PROG = 'Subtitles'
+
+
+def codec_name(name):
+    """Returns Python's canonical name for the codec ``name``, or None."""
+    return EncodingRegistry.instance().lookup(name)
 
 
 class EncodingService(object):
+    CHUNK_SIZE = 64 * 1024
+    # UTF-8 is tried before the hint: text that decodes as UTF-8 almost
+    # never is in a single-byte encoding, which decodes nearly anything.
+    FIRST_ENCODING = 'utf-8'
+    # Tried after the hint, in order; latin-1 decodes anything.
+    FALLBACK_ENCODINGS = ('cp1252', 'latin-1')
+    # UTF-32 first, as its little-endian BOM starts with UTF-16's
+    BOMS = ((codecs.BOM_UTF32_LE, 'utf-32'),
+            (codecs.BOM_UTF32_BE, 'utf-32'),
+            (codecs.BOM_UTF8, 'utf-8-sig'),
+            (codecs.BOM_UTF16_LE, 'utf-16'),
+            (codecs.BOM_UTF16_BE, 'utf-16'))
+
     def __init__(self):
         super().__init__()
 
-        self._encodings = self._get_encodings()
-
-    def _get_encodings(self):
-        enc_list = list(set(sorted(encodings.aliases.aliases.values())))
-        for i in range(len(enc_list)):
-            enc = enc_list[i]
-            enc = enc.upper()
-            enc = enc.replace('_', '-')
-            enc_list[i] = enc
-        return sorted(enc_list)
+    @property
+    def registry(self):
+        return EncodingRegistry.instance()
 
     @property
     def encodings(self):
-        return self._encodings
+        return self.registry.names
+
+    def _candidates(self, filePath, hint):
+        with open(filePath, 'rb') as f:
+            head = f.read(4)
+        for bom, encoding in EncodingService.BOMS:
+            if head.startswith(bom):
+                return [encoding]
+        candidates = []
+        for encoding in (EncodingService.FIRST_ENCODING, hint) + \
+                EncodingService.FALLBACK_ENCODINGS:
+            name = codec_name(encoding) if encoding else None
+            if name and name not in candidates:
+                candidates.append(name)
+        return candidates
+
+    def convert_file(self, filePath, target, hint=None):
+        """Converts the text file ``filePath`` to the ``target`` encoding,
+        in place, and returns the encoding it was in.
+
+        The source encoding is detected from a byte order mark, or else is
+        the first of UTF-8, ``hint`` and ``FALLBACK_ENCODINGS`` that decodes
+        the whole file.  The file is converted in chunks into a temporary file,
+        which then replaces it.  Raises UnicodeEncodeError, leaving the file
+        as it was, if the text cannot be represented in ``target``.
+        """
+        targetName = codec_name(target)
+        if not targetName:
+            raise LookupError("Unknown encoding '{}'".format(target))
+
+        for source in self._candidates(filePath, hint):
+            try:
+                if source == targetName:
+                    self._transcode(filePath, source, None)
+                else:
+                    self._convert(filePath, source, targetName)
+            except UnicodeDecodeError:
+                logger.debug("'{}' is not in {}".format(filePath, source))
+                continue
+            logger.debug("Converted '{}' from {} to {}".format(
+                filePath, source, targetName))
+            return source
+        raise UnicodeError("Unable to detect the encoding of '{}'".format(
+            filePath))
+
+    def _convert(self, filePath, source, target):
+        fd, tempPath = tempfile.mkstemp(prefix=PROG, suffix='.tmp',
+                                        dir=path.dirname(filePath))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                self._transcode(filePath, source, target, out)
+            os.chmod(tempPath, stat.S_IMODE(os.stat(filePath).st_mode))
+            os.replace(tempPath, filePath)
+        except BaseException:
+            os.remove(tempPath)
+            raise
+
+    @staticmethod
+    def _transcode(filePath, source, target, out=None):
+        # Only decodes if there is no output, to validate the source encoding
+        decoder = codecs.getincrementaldecoder(source)()
+        encoder = codecs.getincrementalencoder(target)() if out else None
+        with open(filePath, 'rb') as f:
+            while True:
+                chunk = f.read(EncodingService.CHUNK_SIZE)
+                text = decoder.decode(chunk, final=not chunk)
+                if out:
+                    out.write(encoder.encode(text, final=not chunk))
+                if not chunk:
+                    break
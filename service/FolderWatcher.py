@@ -0,0 +1,223 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import threading
+import time
+from os import path
+from service.LibraryScanner import LibraryScanner, is_video
+from log import logger
+
+
+class FolderWatcher(object):
+    """Detects video files arriving below a set of directories.
+
+    The directories are listed once, and then only the ones that changed
+    are listed again: those passed to ``notify()``, e.g. by a file system
+    watcher, and with ``poll``, those whose modification time changed.  A
+    directory is listed ``debounce`` seconds after its last change, so that
+    a burst of changes costs one listing.  A directory that appears is
+    watched as well, and its videos count as new.
+
+    A new video is reported once its size and modification time have not
+    changed for ``settle`` seconds, i.e. once it has been written.  Videos
+    that already have subtitles for every language in ``languages`` are
+    skipped, as by ``LibraryScanner``.
+
+    ``start()`` checks every ``interval`` seconds on a daemon thread, and
+    calls ``on_files`` with the list of videos that are ready, and
+    ``on_directories`` with the lists of directories that are added and
+    removed, both from that thread.  ``check()`` does one round without
+    the thread.
+    """
+
+    SETTLE = 2.0  # seconds
+    INTERVAL = 1.0  # seconds
+    DEBOUNCE = 0.5  # seconds
+
+    def __init__(self, paths, on_files=None, on_directories=None,
+                 languages=None, settle=SETTLE, interval=INTERVAL,
+                 debounce=DEBOUNCE, poll=True, clock=time.monotonic):
+        super().__init__()
+        self._paths = [path.abspath(p) for p in paths]
+        self._on_files = on_files or (lambda files: None)
+        self._on_directories = on_directories or \
+            (lambda added, removed: None)
+        self._scanner = LibraryScanner(languages=languages)
+        self._settle = settle
+        self._interval = interval
+        self._debounce = debounce
+        self.poll = poll
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._changed = {}  # directory -> time of the last change
+        self._entries = {}  # directory -> (mtime, set of names)
+        self._pending = {}  # file -> (size, mtime, time it was last seen)
+        self._added, self._removed = [], []
+        self._started = False
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def directories(self):
+        """The directories being watched."""
+        with self._lock:
+            return list(self._entries)
+
+    def notify(self, directory):
+        """Records that ``directory`` changed.  May be called from any
+        thread."""
+        with self._lock:
+            self._changed[path.abspath(directory)] = self._clock()
+
+    def start(self):
+        if self._thread:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='watch',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._thread:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                files = self.check()
+                self._report()
+                if files:
+                    self._on_files(files)
+            except Exception as e:
+                logger.warning("Error watching {}: {}".format(self._paths, e))
+            if self._stopped.wait(self._interval):
+                return
+
+    def check(self):
+        """Lists the changed directories and returns the new videos that
+        have settled."""
+        if not self._started:
+            self._started = True
+            for directory in self._paths:
+                if path.isdir(directory):
+                    self._add_tree(directory, new=False)
+                else:
+                    logger.warning("Not a directory: '{}'".format(directory))
+            return []
+
+        now = self._clock()
+        if self.poll:
+            for directory, (mtime, names) in list(self._entries.items()):
+                if _mtime(directory) != mtime:
+                    self._changed.setdefault(directory, now)
+        with self._lock:
+            changed = [d for d, t in self._changed.items()
+                       if now - t >= self._debounce]
+            for directory in changed:
+                del self._changed[directory]
+        for directory in sorted(changed):
+            self._list(directory, now)
+        return self._settled(now)
+
+    def _report(self):
+        added, removed = self._added, self._removed
+        self._added, self._removed = [], []
+        if added or removed:
+            self._on_directories(added, removed)
+
+    def _add_tree(self, directory, new, now=None):
+        with self._lock:
+            self._entries[directory] = (_mtime(directory), set())
+        self._added.append(directory)
+        self._list(directory, now, new)
+
+    def _list(self, directory, now, new=True):
+        try:
+            mtime = _mtime(directory)
+            with os.scandir(directory) as it:
+                entries = list(it)
+        except OSError:
+            self._remove_tree(directory)
+            return
+        if directory not in self._entries:
+            # Removed along with a parent before it could be listed
+            return
+        names = {entry.name for entry in entries}
+        lowerNames = {name.lower() for name in names}
+        previous = self._entries[directory][1]
+        with self._lock:
+            self._entries[directory] = (mtime, names)
+        for entry in entries:
+            if entry.name in previous:
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.'):
+                        self._add_tree(entry.path, new, now)
+                elif new and is_video(entry.name) and entry.is_file() and \
+                        not self._scanner.has_subtitles(entry.name,
+                                                        lowerNames):
+                    st = entry.stat()
+                    self._pending[entry.path] = (st.st_size, st.st_mtime,
+                                                 now)
+            except OSError as e:
+                logger.warning("Unable to stat '{}': {}".format(entry.path,
+                                                                e))
+        for name in previous - names:
+            gone = path.join(directory, name)
+            self._pending.pop(gone, None)
+            if gone in self._entries:
+                self._remove_tree(gone)
+
+    def _remove_tree(self, directory):
+        prefix = directory + os.sep
+        with self._lock:
+            for d in list(self._entries):
+                if d == directory or d.startswith(prefix):
+                    del self._entries[d]
+                    self._changed.pop(d, None)
+                    self._removed.append(d)
+
+    def _settled(self, now):
+        ready = []
+        for filePath, (size, mtime, seen) in list(self._pending.items()):
+            try:
+                st = os.stat(filePath)
+            except OSError:
+                del self._pending[filePath]
+                continue
+            if (st.st_size, st.st_mtime) != (size, mtime):
+                # Still being written
+                self._pending[filePath] = (st.st_size, st.st_mtime, now)
+            elif now - seen >= self._settle:
+                del self._pending[filePath]
+                ready.append(filePath)
+        if ready:
+            logger.info("{} new video file(s)".format(len(ready)))
+        return sorted(ready)
+
+
+def _mtime(directory):
+    try:
+        return os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
@@ -0,0 +1,130 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sqlite3
+import threading
+import time
+from os import path
+from log import logger
+
+
+class HashCache(object):
+    """Persistent movie hash cache, stored in an SQLite database.
+
+    Entries are keyed by absolute path and are only valid while the file's
+    size, inode and modification time are unchanged.  The least recently
+    used entries are evicted once there are more than ``max_entries``, and
+    entries not used for ``max_age`` seconds are dropped.
+    """
+
+    FILENAME = 'hashes.sqlite'
+    MAX_ENTRIES = 100000
+    MAX_AGE = 180 * 24 * 60 * 60  # 180 days
+
+    # Refresh an entry's last use at most this often, so that re-scanning
+    # an unchanged library does not turn into a write per file.
+    TOUCH_INTERVAL = 24 * 60 * 60
+    EVICT_INTERVAL = 1000  # insertions
+
+    def __init__(self, dbPath, max_entries=MAX_ENTRIES, max_age=MAX_AGE):
+        super().__init__()
+        self._max_entries = max_entries
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self.hits = 0
+        self.misses = 0
+
+        logger.debug("Hash cache: '{}'".format(dbPath))
+        self._db = sqlite3.connect(dbPath, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS hashes ('
+                ' path TEXT PRIMARY KEY,'
+                ' size INTEGER NOT NULL,'
+                ' inode INTEGER NOT NULL,'
+                ' mtime INTEGER NOT NULL,'
+                ' hash TEXT NOT NULL,'
+                ' last_used REAL NOT NULL)')
+            self._evict()
+
+    @staticmethod
+    def in_directory(directory):
+        os.makedirs(directory, exist_ok=True)
+        return HashCache(path.join(directory, HashCache.FILENAME))
+
+    def get(self, filePath, st=None):
+        """Returns the cached hash, or None if missing or stale."""
+        filePath = path.abspath(filePath)
+        st = st or os.stat(filePath)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                'SELECT size, inode, mtime, hash, last_used FROM hashes '
+                'WHERE path = ?', (filePath,)).fetchone()
+            if not row or row[:3] != (st.st_size, st.st_ino, st.st_mtime_ns):
+                self.misses += 1
+                return None
+            self.hits += 1
+            if now - row[4] > HashCache.TOUCH_INTERVAL:
+                with self._db:
+                    self._db.execute(
+                        'UPDATE hashes SET last_used = ? WHERE path = ?',
+                        (now, filePath))
+            return row[3]
+
+    def put(self, filePath, hash, st=None):
+        filePath = path.abspath(filePath)
+        st = st or os.stat(filePath)
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)',
+                (filePath, st.st_size, st.st_ino, st.st_mtime_ns, hash,
+                 time.time()))
+            self._inserts += 1
+            if self._inserts % HashCache.EVICT_INTERVAL == 0:
+                self._evict()
+
+    def invalidate(self, filePath=None):
+        """Forgets ``filePath``, or every entry if no path is given."""
+        with self._lock, self._db:
+            if filePath is None:
+                self._db.execute('DELETE FROM hashes')
+            else:
+                self._db.execute('DELETE FROM hashes WHERE path = ?',
+                                 (path.abspath(filePath),))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM hashes').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _evict(self):
+        self._db.execute('DELETE FROM hashes WHERE last_used < ?',
+                         (time.time() - self._max_age,))
+        self._db.execute(
+            'DELETE FROM hashes WHERE path IN ('
+            ' SELECT path FROM hashes ORDER BY last_used DESC, rowid DESC'
+            ' LIMIT -1 OFFSET ?)', (self._max_entries,))
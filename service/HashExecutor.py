@@ -0,0 +1,115 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import heapq
+import itertools
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+def device_of(filePath):
+    """Returns the ID of the device holding ``filePath``, or None if it
+    cannot be read."""
+    try:
+        return os.stat(filePath).st_dev
+    except OSError:
+        return None
+
+
+class HashExecutor(object):
+    """Runs disk-bound functions, such as hashing, with limited parallelism
+    per device.
+
+    At most ``per_device`` functions read from the same device at once, so
+    that a spinning disk or a network share is not thrashed by seeks,
+    while files on different devices are read in parallel, on up to
+    ``max_workers`` threads in total.  The queued functions of a device
+    run highest ``priority`` first.
+
+    The device of a file is looked up on a worker thread, since that may
+    block on an unresponsive share.
+    """
+
+    PER_DEVICE = 2
+    MAX_WORKERS = 8
+
+    def __init__(self, per_device=PER_DEVICE, max_workers=MAX_WORKERS,
+                 device=device_of):
+        super().__init__()
+        self._per_device = per_device
+        self._device = device
+        self._pool = ThreadPoolExecutor(max_workers, 'hash')
+        self._lock = threading.Lock()
+        self._queues = {}  # device -> heap of (-priority, order, item)
+        self._running = {}  # device -> count
+        self._order = itertools.count()
+
+    def submit(self, filePath, fn, *args, priority=0):
+        """Runs ``fn(*args)``, which reads ``filePath``, and returns its
+        ``concurrent.futures.Future``."""
+        future = Future()
+        self._pool.submit(self._dispatch, filePath,
+                          (future, fn, args, priority))
+        return future
+
+    def shutdown(self, wait=True):
+        """Stops accepting functions; with ``wait``, returns once the
+        submitted ones have run."""
+        self._pool.shutdown(wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    def _dispatch(self, filePath, item):
+        future, fn, args, priority = item
+        if future.cancelled():
+            return
+        device = self._device(filePath)
+        with self._lock:
+            heapq.heappush(self._queues.setdefault(device, []),
+                           (-priority, next(self._order), item))
+            if self._running.get(device, 0) >= self._per_device:
+                # A worker of the device runs it when it is done
+                return
+            self._running[device] = self._running.get(device, 0) + 1
+        self._work(device)
+
+    def _work(self, device):
+        # Runs the queued functions of the device until there are none
+        while True:
+            with self._lock:
+                queue = self._queues.get(device)
+                if not queue:
+                    self._queues.pop(device, None)
+                    self._running[device] -= 1
+                    if not self._running[device]:
+                        del self._running[device]
+                    return
+                future, fn, args, priority = heapq.heappop(queue)[2]
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
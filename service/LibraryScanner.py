@@ -0,0 +1,148 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import mimetypes
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from log import logger
+
+# Also used as the name filter of the "Open Video Files" dialog
+VIDEO_MIME_TYPES = [
+    "video/mp4",
+    "video/quicktime",
+    "video/x-msvideo",
+    "video/x-ms-wmv",
+    "video/x-matroska",
+]
+
+
+def _video_extensions():
+    # mimetypes depends on the platform's MIME database, so always include
+    # the common containers.
+    extensions = {'.avi', '.divx', '.flv', '.m4v', '.mkv', '.mov', '.mp4',
+                  '.mpeg', '.mpg', '.ogv', '.ts', '.webm', '.wmv'}
+    for mimeType in VIDEO_MIME_TYPES:
+        extensions.update(mimetypes.guess_all_extensions(mimeType))
+    return frozenset(ext.lower() for ext in extensions)
+
+
+VIDEO_EXTENSIONS = _video_extensions()
+
+SUBTITLE_FORMATS = ('srt', 'sub', 'ssa', 'ass', 'smi', 'txt', 'vtt', 'mpl')
+
+
+def is_video(filename):
+    return path.splitext(filename)[1].lower() in VIDEO_EXTENSIONS
+
+
+class LibraryScanner(object):
+    """Finds the video files below a set of directories.
+
+    Directories are listed in parallel with ``os.scandir()`` on ``jobs``
+    threads, and video files are yielded as soon as they are found.  A video
+    is skipped if a ``<name>.<language>.<format>`` subtitle already exists
+    next to it for every language in ``languages``.  Symbolic links to
+    directories are not followed.
+    """
+
+    JOBS = 8
+    _DONE = object()
+
+    def __init__(self, languages=None, jobs=JOBS):
+        super().__init__()
+        self._languages = [lang.lower() for lang in languages or []]
+        self._jobs = jobs
+
+    def has_subtitles(self, filename, names):
+        """Whether ``names``, the lower-case file names in the video's
+        directory, include a subtitle for every language."""
+        if not self._languages:
+            return False
+        base = path.splitext(filename)[0].lower()
+        return all(any('{}.{}.{}'.format(base, lang, fmt) in names
+                       for fmt in SUBTITLE_FORMATS)
+                   for lang in self._languages)
+
+    def scan(self, paths):
+        """Yields the video files below ``paths``.
+
+        Paths that are files are yielded as they are.
+        """
+        directories = []
+        for p in paths:
+            if path.isdir(p):
+                directories.append(p)
+            else:
+                yield p
+        if not directories:
+            return
+
+        results = queue.Queue()
+        state = dict(pending=len(directories), stopped=False)
+        lock = threading.Lock()
+
+        def scanDirectory(directory):
+            try:
+                if not state['stopped']:
+                    self._scan_directory(directory, results, submit)
+            except OSError as e:
+                logger.warn("Unable to scan '{}': {}".format(directory, e))
+            finally:
+                with lock:
+                    state['pending'] -= 1
+                    if not state['pending']:
+                        results.put(LibraryScanner._DONE)
+
+        def submit(directory):
+            with lock:
+                if state['stopped']:
+                    return
+                state['pending'] += 1
+                executor.submit(scanDirectory, directory)
+
+        executor = ThreadPoolExecutor(self._jobs, 'scan')
+        try:
+            for directory in directories:
+                executor.submit(scanDirectory, directory)
+            while True:
+                filePath = results.get()
+                if filePath is LibraryScanner._DONE:
+                    break
+                yield filePath
+        finally:
+            # Also reached when the consumer stops early
+            state['stopped'] = True
+            executor.shutdown(wait=False)
+
+    def _scan_directory(self, directory, results, submit):
+        with os.scandir(directory) as it:
+            entries = list(it)
+        names = {entry.name.lower() for entry in entries}
+        for entry in sorted(entries, key=lambda e: e.name):
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.'):
+                        submit(entry.path)
+                elif is_video(entry.name) and entry.is_file() and \
+                        not self.has_subtitles(entry.name, names):
+                    results.put(entry.path)
+            except OSError as e:
+                logger.warn("Unable to stat '{}': {}".format(entry.path, e))
@@ -0,0 +1,106 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+"""The OpenSubtitles movie hash.
+
+The hash is the file size plus the sums of the first and the last 64 KiB of
+the file, read as little-endian 64-bit integers, modulo 2**64.  See
+http://trac.opensubtitles.org/projects/opensubtitles/wiki/HashSourceCodes
+"""
+
+import os
+import sys
+from array import array
+
+CHUNK_SIZE = 64 * 1024
+MIN_SIZE = 2 * CHUNK_SIZE
+_MASK = 0xFFFFFFFFFFFFFFFF
+
+
+def _pread(fd, size, offset):
+    data = b''
+    while len(data) < size:
+        chunk = os.pread(fd, size - len(data), offset + len(data))
+        if not chunk:
+            raise OSError("Unexpected end of file at offset {}".format(
+                offset + len(data)))
+        data += chunk
+    return data
+
+
+def _read_seek(fd, size, offset):
+    # os.pread() is not available on Windows
+    os.lseek(fd, offset, os.SEEK_SET)
+    data = b''
+    while len(data) < size:
+        chunk = os.read(fd, size - len(data))
+        if not chunk:
+            raise OSError("Unexpected end of file at offset {}".format(
+                offset + len(data)))
+        data += chunk
+    return data
+
+
+_read = _pread if hasattr(os, 'pread') else _read_seek
+
+
+def _advise(fd, offset, length, advice):
+    # Only a hint; not available on Windows and macOS
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fd, offset, length, getattr(os, advice))
+        except OSError:
+            pass
+
+
+def _sum_words(data):
+    words = array('Q')
+    words.frombytes(data)
+    if sys.byteorder != 'little':
+        words.byteswap()
+    return sum(words)
+
+
+def hash_regions(size, head, tail):
+    """Computes the hash from the size and the head and tail regions."""
+    return '{:016x}'.format(
+        (size + _sum_words(head) + _sum_words(tail)) & _MASK)
+
+
+def movie_hash(filePath):
+    """Returns the movie hash of ``filePath`` as 16 hex digits.
+
+    Only the two regions are read, without read-ahead, and they are dropped
+    from the page cache afterwards, so that hashing a library does not
+    evict the files that are in use.  Raises ValueError if the file is
+    smaller than 128 KiB.
+    """
+    fd = os.open(filePath, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        size = os.fstat(fd).st_size
+        if size < MIN_SIZE:
+            raise ValueError("'{}' is too small to hash ({} bytes)".format(
+                filePath, size))
+        _advise(fd, 0, 0, 'POSIX_FADV_RANDOM')
+        head = _read(fd, CHUNK_SIZE, 0)
+        tail = _read(fd, CHUNK_SIZE, size - CHUNK_SIZE)
+        _advise(fd, 0, CHUNK_SIZE, 'POSIX_FADV_DONTNEED')
+        _advise(fd, size - CHUNK_SIZE, CHUNK_SIZE, 'POSIX_FADV_DONTNEED')
+    finally:
+        os.close(fd)
+    return hash_regions(size, head, tail)
@@ -16,75 +16,495 @@
 # You should have received a copy of the GNU General Public License
 # along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
 
-from pythonopensubtitles.utils import File
+import contextlib
+import json
+import os
+import re
+import threading
+from os import path
+from xmlrpc.client import ProtocolError, SafeTransport, ServerProxy, Transport
 from pythonopensubtitles import opensubtitles
+from pythonopensubtitles.settings import Settings
+from service.MovieHash import movie_hash
+from service.RateLimiter import SEARCH, throttle_status
+from service.SubtitleCandidate import (
+    Language, SubtitleCandidate, MATCH_HASH, MATCH_TAG, MATCH_IMDB, MATCHES
+)
+from service.TokenManager import TokenManager
 from log import logger
 
 
+# Maximum number of queries the server accepts in one SearchSubtitles call.
+SEARCH_MAX_QUERIES = 20
+
+DEFAULT_LANGUAGES = ['eng']
+
+# What to do after a SearchSubtitles response, from search_outcome()
+SEARCH_DONE = 'done'
+SEARCH_THROTTLED = 'throttled'
+SEARCH_REFUSED = 'refused'
+
+_IMDB_ID = re.compile(r'(?<![a-z0-9])tt(\d{7,8})(?!\d)', re.IGNORECASE)
+
+
+def imdb_id(filePath):
+    """Returns the numeric IMDb id in the name of the file or of its
+    directory, such as ``1234567`` for ``Movie.tt1234567.mkv``, or None."""
+    for name in (path.basename(filePath),
+                 path.basename(path.dirname(filePath))):
+        match = _IMDB_ID.search(name)
+        if match:
+            return match.group(1)
+    return None
+
+
+class LoginError(Exception):
+    pass
+
+
+class SearchError(Exception):
+    """The server answered a search with an error ``status``, such as
+    "503 Service Unavailable", even after any retries."""
+
+    def __init__(self, status):
+        super().__init__("Search failed: {}".format(status or 'no status'))
+        self.status = status
+
+
+class NoSubtitlesFound(Exception):
+    def __init__(self, hash=None):
+        super().__init__("No subtitles found")
+        self.hash = hash
+
+
+def search_outcome(status, retry, refused):
+    """Classifies the ``status`` of a SearchSubtitles response, for the
+    search loops of ``OpenSubService`` and ``AsyncOpenSubService``.
+
+    Returns SEARCH_DONE with the results, SEARCH_THROTTLED to search again
+    if ``retry`` allows it, or SEARCH_REFUSED to log in again and search
+    again, unless the session was already ``refused`` once.  Raises
+    LoginError or SearchError otherwise.
+    """
+    if status[:3] in ('429', '503') and retry:
+        return SEARCH_THROTTLED
+    if status.startswith('401') and not refused:
+        return SEARCH_REFUSED
+    if status.startswith('401'):
+        raise LoginError("Session refused: {}".format(status))
+    if not status.startswith('200'):
+        # Not cached as a miss: the movie may have subtitles
+        raise SearchError(status)
+    return SEARCH_DONE
+
+
 class OpenSubService(object):
-    def __init__(self):
+    """Searches OpenSubtitles.org for subtitles.
+
+    May be shared between threads: the XML-RPC calls are serialized, and
+    all of them use one session, which is opened on first use and renewed
+    when it expires.  With a ``rate_limiter``, the calls use its search
+    budget, and throttled searches are retried.
+    """
+
+    # Time to live of cached results, in seconds
+    LANGUAGES_TTL = 7 * 24 * 60 * 60
+    SEARCH_TTL = 6 * 60 * 60
+    # Misses are cached briefly, so that a retry soon asks the server again
+    SEARCH_MISS_TTL = 15 * 60
+    # Retries of a search the server throttled, after the limiter's pause
+    THROTTLE_RETRIES = 3
+
+    def __init__(self, hash_cache=None, result_cache=None, server_url=None,
+                 languages_file=None, rate_limiter=None):
         super().__init__()
+        self._hash_cache = hash_cache
+        self._result_cache = result_cache
+        self._languages_file = languages_file
+        self._rate_limiter = rate_limiter
+        self._credentials = ('', '')
+        # The client keeps the last response and shares one connection
+        self._rpc_lock = threading.RLock()
+        self._session = TokenManager(self._login, self._no_operation)
         # settings.Settings.VERBOSE = True
 
         # TODO: Request a proper useragent from
         # http://trac.opensubtitles.org/projects/opensubtitles/wiki/DevReadFirst
         self._ost = opensubtitles.OpenSubtitles(
             user_agent='TemporaryUserAgent')
+        self.server_url = server_url or Settings.OPENSUBTITLES_SERVER
+        if server_url:
+            # Talk to another XML-RPC endpoint, e.g. a local test server
+            logger.debug("Server: {}".format(server_url))
+            transport = SafeTransport() if server_url.startswith('https:') \
+                else Transport()
+            transport.user_agent = self._ost.user_agent
+            self._ost.xmlrpc = ServerProxy(server_url, allow_none=True,
+                                           transport=transport)
+
+    @property
+    def user_agent(self):
+        return self._ost.user_agent
+
+    @property
+    def session(self):
+        """The ``TokenManager`` of the session."""
+        return self._session
 
     def login(self, username='', password=''):
-        logger.debug("")
-        token = self._ost.login(username=username, password=password)
+        """Returns the session token; raises LoginError if the server
+        refuses the login.
+
+        The searches log in by themselves, so this is only needed to use
+        other credentials or to check that the server accepts the login.
+        """
+        credentials = (username, password)
+        if credentials != self._credentials:
+            self._credentials = credentials
+            self._session.reset()
+        return self._session.token()
+
+    def _slot(self):
+        if self._rate_limiter:
+            return self._rate_limiter.slot(SEARCH)
+        return contextlib.nullcontext()
+
+    def _login(self):
+        username, password = self._credentials
+        # The limiter is waited for before taking the lock
+        with self._slot(), self._rpc_lock:
+            token = self._ost.login(username=username, password=password)
+            status = self._ost.data.get('status')
         logger.debug("Login token: {}".format(token))
+        if not token:
+            raise LoginError("Unable to login: {}".format(status))
         return token
 
+    def _no_operation(self, token):
+        with self._slot(), self._rpc_lock:
+            self._ost.token = token
+            return self._ost.no_operation()
+
+    def _search(self, queries):
+        refused = throttled = 0
+        while True:
+            token = self._session.token()
+            try:
+                data, status = self._search_call(token, queries)
+            except ProtocolError as e:
+                if not throttle_status(e) or not self._retry(throttled):
+                    raise
+                throttled += 1
+                continue
+            outcome = search_outcome(status, self._retry(throttled), refused)
+            if outcome == SEARCH_THROTTLED:
+                throttled += 1
+            elif outcome == SEARCH_REFUSED:
+                # The server no longer knows the session
+                refused += 1
+                self._session.invalidate(token)
+            else:
+                self._session.touch(token)
+                return data or []
+
+    def _search_call(self, token, queries):
+        with self._slot() as slot, self._rpc_lock:
+            self._ost.token = token
+            data = self._ost.search_subtitles(queries)
+            status = self._ost.data.get('status') or ''
+            if slot and status[:3] in ('429', '503'):
+                slot.throttled()
+        return data, status
+
+    def _retry(self, throttled):
+        # Only with a limiter, which pauses the searches before the retry
+        return self._rate_limiter and \
+            throttled < OpenSubService.THROTTLE_RETRIES
+
     def calculate_hash(self, filePath):
         logger.debug("filePath: {}".format(filePath))
-        f = File(filePath)
-        hash = f.get_hash()
+        if self._hash_cache:
+            st = os.stat(filePath)
+            hash = self._hash_cache.get(filePath, st)
+            if hash:
+                logger.debug("cached hash: {}".format(hash))
+                return hash
+
+        hash = movie_hash(filePath)
         logger.debug("hash: {}".format(hash))
+
+        if self._hash_cache:
+            self._hash_cache.put(filePath, hash, st)
         return hash
 
-    def find_by_hash(self, hash):
+    def find_by_hash(self, hash, size=None, filePath=None):
+        """Returns the subtitles for one movie; raises NoSubtitlesFound if
+        there are none."""
         logger.debug("hash={}".format(hash))
         if not hash:
             raise ValueError('hash is empty')
-        config = {
-            # TODO: Adjust for language
-            'sublanguageid': 'eng',
+
+        result = self.find_by_hashes(
+            [hash], {hash: size} if size else None, paths={hash: filePath}
+            if filePath else None)[hash]
+        if not result:
+            raise NoSubtitlesFound(hash)
+        return result
+
+    def find_by_hashes(self, hashes, sizes=None, languages=None,
+                       chunk_size=SEARCH_MAX_QUERIES, paths=None,
+                       recheck=()):
+        """Searches for subtitles for many movie hashes at once.
+
+        Returns a dict mapping every hash to its subtitles, as
+        ``SubtitleCandidate`` records with the best score first; hashes
+        without results map to ``[]``.  See ``iter_by_hashes()`` for the
+        arguments.
+        """
+        hashes = list(dict.fromkeys(hashes))
+        result = dict(self.iter_by_hashes(hashes, sizes, languages,
+                                          chunk_size, paths, recheck))
+        return {hash: result[hash] for hash in hashes}
+
+    def iter_by_hashes(self, hashes, sizes=None, languages=None,
+                       chunk_size=SEARCH_MAX_QUERIES, paths=None,
+                       recheck=()):
+        """Yields ``(hash, subtitles)`` for many movie hashes, as soon as
+        the subtitles of each hash are known.
+
+        Cached hashes come first.  The other queries are packed into as few
+        SearchSubtitles calls as the server allows, ``chunk_size`` queries
+        each, and the results of each call are yielded before the next one
+        is made.  ``sizes`` optionally maps a hash to the movie size in
+        bytes, and ``languages`` lists the subtitle language IDs to search
+        for (English by default).
+
+        ``paths`` optionally maps a hash to the movie's file path.  The file
+        name and an IMDb id found in the path are then queried in the same
+        call as the hash, and are used if the hash has no subtitles; each
+        subtitle's ``matched_by`` tells which query found it.
+
+        The server is asked again about the hashes in ``recheck`` if they
+        are cached without subtitles, e.g. when the user retries them.
+        """
+        plan = self.plan_search(hashes, sizes, languages, chunk_size, paths,
+                                recheck)
+        logger.debug("{} hashes, {} cached".format(len(plan.hashes),
+                                                   len(plan.cached)))
+        yield from plan.cached.items()
+
+        for chunk in plan.chunks:
+            logger.debug("Calling search_subtitles() with {} queries".format(
+                len(chunk)))
+            data = self._search(SearchPlan.queries(chunk))
+            yield from plan.results(chunk, data)
+
+    def plan_search(self, hashes, sizes=None, languages=None,
+                    chunk_size=SEARCH_MAX_QUERIES, paths=None, recheck=()):
+        """Returns the ``SearchPlan`` for the arguments of
+        ``iter_by_hashes()``, for clients that send the queries
+        themselves."""
+        hashes = list(dict.fromkeys(hashes))
+        if not all(hashes):
+            raise ValueError('hash is empty')
+        return SearchPlan(self, hashes, sizes or {}, paths or {},
+                          ','.join(languages or DEFAULT_LANGUAGES),
+                          chunk_size, recheck)
+
+    @staticmethod
+    def _result_keys(hashes, sizes, paths, language):
+        keys = {}
+        for hash in hashes:
+            keys[hash] = 'candidates/{}/{}/{}'.format(language, hash,
+                                                      sizes.get(hash))
+            if paths.get(hash):
+                keys[hash] += '/' + path.basename(paths[hash])
+        return keys
+
+    def _cached_results(self, key):
+        cached = self._result_cache.get(key) if self._result_cache else None
+        if cached is None:
+            return None
+        return [SubtitleCandidate.from_row(row) for row in cached]
+
+    def _cache_results(self, key, subtitles):
+        if self._result_cache:
+            ttl = OpenSubService.SEARCH_TTL if subtitles \
+                else OpenSubService.SEARCH_MISS_TTL
+            self._result_cache.put(key, [s.to_row() for s in subtitles], ttl)
+
+    @staticmethod
+    def _results(chunk, data):
+        # Yields (hash, subtitles) for every hash of the chunk, from the
+        # matches of the best kind
+        found = {hash: {} for hash, _, _ in chunk}
+        for sub in data:
+            hash, match = OpenSubService._query_match(sub, chunk)
+            if hash in found:
+                found[hash].setdefault(match, []).append(sub)
+
+        for hash, matches in found.items():
+            match = next((m for m in MATCHES if matches.get(m)), None)
+            yield hash, list(OpenSubService._candidates(
+                matches.get(match, []), match))
+
+    @staticmethod
+    def _queries(hash, size, filePath, language):
+        queries = []
+        query = {
+            'sublanguageid': language,
             'moviehash': hash,
-            # 'moviebytesize': f.size
         }
+        if size:
+            query['moviebytesize'] = str(size)
+        queries.append((MATCH_HASH, query))
+        if filePath:
+            queries.append((MATCH_TAG, {
+                'sublanguageid': language,
+                'tag': path.basename(filePath),
+            }))
+            imdb = imdb_id(filePath)
+            if imdb:
+                queries.append((MATCH_IMDB, {
+                    'sublanguageid': language,
+                    'imdbid': imdb,
+                }))
+        return queries
+
+    @staticmethod
+    def _chunk_queries(hashes, sizes, paths, language, chunk_size):
+        # Yields lists of (hash, match, query), keeping the queries for one
+        # hash in the same call.
+        chunk = []
+        for hash in hashes:
+            queries = [(hash, match, query) for match, query in
+                       OpenSubService._queries(hash, sizes.get(hash),
+                                               paths.get(hash), language)]
+            if chunk and len(chunk) + len(queries) > chunk_size:
+                yield chunk
+                chunk = []
+            chunk.extend(queries)
+        if chunk:
+            yield chunk
 
-        logger.debug("Calling search_subtitles()")
-        data = self._ost.search_subtitles([config])
-        if not data:
-            raise Exception("No data")
-            return
+    @staticmethod
+    def _query_match(sub, chunk):
+        # QueryNumber is the index of the matching query within the call;
+        # fall back to the hash the server matched on.
+        try:
+            hash, match, query = chunk[int(sub['QueryNumber'])]
+            return hash, match
+        except (KeyError, ValueError, IndexError):
+            return sub.get('MovieHash'), MATCH_HASH
 
+    @staticmethod
+    def _candidates(data, match=MATCH_HASH):
+        for sub in sorted(data, key=lambda x: float(x['Score']),
+                          reverse=True):
+            yield SubtitleCandidate.from_result(sub, match)
+
+    def language_ids(self, codes):
+        """Maps language codes to the IDs used by the search.
+
+        ``codes`` are ISO 639-1 codes, as saved in the preferences, or
+        search IDs, which are kept as they are.  Unknown codes are skipped.
+        Returns ``DEFAULT_LANGUAGES`` if nothing is left.
+        """
+        languages = self.cached_languages() or self.bundled_languages() or []
+        ids = {lang.code: lang.id for lang in languages if lang.code}
+        ids.update((lang.id, lang.id) for lang in languages)
         result = []
-        logger.debug("Generating subtitles")
-        for sub in sorted(data, key=lambda x: x['Score'], reverse=True):
-            result.append(dict(size=sub['SubSize'],
-                               hash=sub['SubHash'],
-                               bad=sub['SubBad'] != '0',
-                               rating=sub['SubRating'],
-                               downloads=sub['SubDownloadsCnt'],
-                               fps=sub['MovieFPS'],
-                               featured=sub['SubFeatured'],
-                               encoding=sub['SubEncoding'],
-                               downloadLink=sub['SubDownloadLink'],
-                               language_id=sub['SubLanguageID'],
-                               format=sub['SubFormat'],
-                               language_id_iso=sub['ISO639']
-                               ))
-        return result
+        for code in codes or []:
+            id = ids.get(code)
+            if not id and not languages and len(code) == 3:
+                id = code
+            if not id:
+                logger.warning("Unknown language '{}'".format(code))
+            elif id not in result:
+                result.append(id)
+        return result or list(DEFAULT_LANGUAGES)
+
+    def bundled_languages(self):
+        """Returns the ``Language`` list shipped with the application, or
+        None."""
+        if not self._languages_file:
+            return None
+        try:
+            with open(self._languages_file, 'rb') as f:
+                return [Language.from_dict(d) for d in
+                        json.loads(f.read().decode('utf-8'))]
+        except Exception as e:
+            logger.warning("Error reading bundled languages '{}': {}".format(
+                self._languages_file, e))
+            return None
+
+    def cached_languages(self):
+        """Returns the cached ``Language`` list without a remote call, or
+        None."""
+        if not self._result_cache:
+            return None
+        cached = self._result_cache.get('languages')
+        if cached is None:
+            return None
+        return [Language.from_dict(d) for d in cached]
 
     def get_languages(self):
-        data = self._ost.get_subtitle_languages()
-        result = []
-        for i in data:
-            lang = dict(code=i['ISO639'],
-                        name=i['LanguageName'],
-                        id=i['SubLanguageID'])
-            result.append(lang)
-        return result
+        """Returns the ``Language`` list, from the cache if possible."""
+        cached = self.cached_languages()
+        if cached is not None:
+            return cached
+
+        with self._slot(), self._rpc_lock:
+            data = self._ost.get_subtitle_languages()
+        return self.store_languages(data)
+
+    def store_languages(self, data):
+        """Returns the ``Language`` list of the ``data`` of a
+        GetSubLanguages response, and caches it."""
+        languages = [Language(i['ISO639'], i['LanguageName'],
+                              i['SubLanguageID']) for i in data]
+        if self._result_cache:
+            self._result_cache.put('languages',
+                                   [lang._asdict() for lang in languages],
+                                   OpenSubService.LANGUAGES_TTL)
+        return languages
+
+
+class SearchPlan(object):
+    """The searches for many movie hashes, from ``plan_search()``.
+
+    ``cached`` maps the hashes found in the result cache to their
+    subtitles.  ``chunks`` lists the SearchSubtitles calls needed for the
+    other ``hashes``; the client sends the ``queries()`` of each chunk,
+    and passes the data of the response to ``results()``.  Shared by
+    ``OpenSubService`` and ``AsyncOpenSubService``, which send the calls
+    in their own ways.
+    """
+
+    def __init__(self, service, hashes, sizes, paths, language, chunk_size,
+                 recheck=()):
+        super().__init__()
+        self._service = service
+        self._keys = service._result_keys(hashes, sizes, paths, language)
+        self.hashes = hashes
+        self.cached = {}
+        missing = []
+        for hash in hashes:
+            cached = service._cached_results(self._keys[hash])
+            if cached is None or (not cached and hash in recheck):
+                missing.append(hash)
+            else:
+                self.cached[hash] = cached
+        self.chunks = list(service._chunk_queries(missing, sizes, paths,
+                                                  language, chunk_size))
+
+    @staticmethod
+    def queries(chunk):
+        return [query for _, _, query in chunk]
+
+    def results(self, chunk, data):
+        """Yields ``(hash, subtitles)`` for every hash of ``chunk``, from
+        the ``data`` of its SearchSubtitles response, and caches them."""
+        for hash, subtitles in self._service._results(chunk, data):
+            self._service._cache_results(self._keys[hash], subtitles)
+            yield hash, subtitles
@@ -0,0 +1,332 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import collections
+import contextlib
+import threading
+import time
+from log import logger
+
+SEARCH = 'search'
+DOWNLOAD = 'download'
+
+# HTTP statuses with which a server asks the client to slow down
+THROTTLE_STATUSES = (429, 503)
+
+
+def throttle_status(e):
+    """Returns the HTTP status of ``e`` if it is a throttling response,
+    such as an xmlrpc.client.ProtocolError or a requests.HTTPError, or
+    None."""
+    status = getattr(e, 'errcode', None) or getattr(e, 'status', None)
+    response = getattr(e, 'response', None)
+    if status is None and response is not None:
+        status = getattr(response, 'status_code', None)
+    return status if status in THROTTLE_STATUSES else None
+
+
+class TokenBucket(object):
+    """Allows ``rate`` calls per second on average, and bursts of up to
+    ``burst`` calls.
+
+    ``acquire()`` blocks until the call is allowed, and
+    ``acquire_async()`` waits for it without blocking the event loop.
+    Waiting callers reserve their token in order, so none of them starves.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        super().__init__()
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = clock()
+        self.waiting = 0
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Takes a token, and returns how long it waited for it."""
+        wait = self._reserve()
+        if wait:
+            try:
+                self._sleep(wait)
+            finally:
+                self._done_waiting()
+        return wait
+
+    async def acquire_async(self):
+        """Like ``acquire()``, for coroutines."""
+        wait = self._reserve()
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._done_waiting()
+        return wait
+
+    def _reserve(self):
+        # Takes a token, and returns how long to wait until it is valid
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if wait:
+                self.waiting += 1
+        return wait
+
+    def _done_waiting(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def pause(self, seconds):
+        """Lets no call through for ``seconds``, on top of the calls that
+        are already waiting."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+
+class AdaptiveConcurrency(object):
+    """Limits the number of concurrent calls, adapting the limit with
+    additive increase, multiplicative decrease (AIMD).
+
+    A throttled call multiplies the limit by ``decrease``, at most once per
+    ``cooldown`` seconds, so that a burst of failures from the same
+    overload counts once.  A call that takes at most ``target_latency``
+    seconds adds ``increase / limit``, i.e. about ``increase`` per round of
+    ``limit`` calls.  Slower calls leave the limit as it is.
+
+    Threads wait in ``acquire()`` and coroutines in ``acquire_async()``;
+    both may share one limit.
+    """
+
+    def __init__(self, maximum, minimum=1, initial=None, increase=1.0,
+                 decrease=0.5, target_latency=2.0, cooldown=1.0,
+                 clock=time.monotonic):
+        super().__init__()
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(maximum if initial is None else initial)
+        self._increase = increase
+        self._decrease = decrease
+        self._target_latency = target_latency
+        self._cooldown = cooldown
+        self._clock = clock
+        self._decreased = None
+        self._cond = threading.Condition()
+        self._futures = []  # (loop, future) of waiting coroutines
+        self.in_flight = 0
+        self.waiting = 0
+
+    def acquire(self):
+        with self._cond:
+            self.waiting += 1
+            try:
+                while self._full():
+                    self._cond.wait()
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if not self._full():
+                    self.in_flight += 1
+                    return
+                future = loop.create_future()
+                self._futures.append((loop, future))
+                self.waiting += 1
+            try:
+                await future
+            finally:
+                with self._cond:
+                    self.waiting -= 1
+
+    def _full(self):
+        return self.in_flight >= max(self.minimum, int(self.limit))
+
+    def release(self, latency, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                now = self._clock()
+                if self._decreased is None or \
+                        now - self._decreased >= self._cooldown:
+                    self._decreased = now
+                    self.limit = max(self.minimum,
+                                     self.limit * self._decrease)
+            elif latency <= self._target_latency:
+                self.limit = min(self.maximum,
+                                 self.limit + self._increase / self.limit)
+            self._cond.notify_all()
+            futures, self._futures = self._futures, []
+        for loop, future in futures:
+            with contextlib.suppress(RuntimeError):  # The loop is closed
+                loop.call_soon_threadsafe(_wake, future)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Budget(object):
+    WINDOW = 10.0  # seconds over which the call rate is measured
+
+    def __init__(self, bucket, concurrency):
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.calls = 0
+        self.throttled = 0
+        self.recent = collections.deque()
+
+
+class _Slot(object):
+    def __init__(self):
+        self.is_throttled = False
+
+    def throttled(self):
+        """Marks the call as throttled, e.g. after a retried 429."""
+        self.is_throttled = True
+
+
+class RateLimiter(object):
+    """Budgets the calls to the OpenSubtitles servers.
+
+    Searches (and the other XML-RPC calls) and downloads have separate
+    budgets, each a ``TokenBucket`` for the rate and an
+    ``AdaptiveConcurrency`` for the number of calls in flight.  One limiter
+    is meant to be shared by all services of the process:
+
+        with limiter.slot(SEARCH):
+            ...
+
+    or, in a coroutine, ``async with limiter.async_slot(SEARCH)``.
+    A call that fails with a throttling status, or is marked with
+    ``slot.throttled()``, lowers the concurrency of its budget and pauses
+    it for ``THROTTLE_PAUSE`` seconds.
+    """
+
+    # OpenSubtitles allows 40 XML-RPC requests per 10 seconds per IP
+    SEARCH_RATE = 3.5
+    SEARCH_BURST = 10
+    SEARCH_CONCURRENCY = 2
+    DOWNLOAD_RATE = 8.0
+    DOWNLOAD_BURST = 16
+    DOWNLOAD_CONCURRENCY = 8
+    THROTTLE_PAUSE = 2.0  # seconds
+
+    def __init__(self, search_rate=SEARCH_RATE, search_burst=SEARCH_BURST,
+                 search_concurrency=SEARCH_CONCURRENCY,
+                 download_rate=DOWNLOAD_RATE,
+                 download_burst=DOWNLOAD_BURST,
+                 download_concurrency=DOWNLOAD_CONCURRENCY,
+                 throttle_pause=THROTTLE_PAUSE, clock=time.monotonic,
+                 sleep=time.sleep):
+        super().__init__()
+        self._clock = clock
+        self._throttle_pause = throttle_pause
+        self._lock = threading.Lock()
+        self._budgets = {
+            SEARCH: _Budget(
+                TokenBucket(search_rate, search_burst, clock, sleep),
+                AdaptiveConcurrency(search_concurrency, clock=clock)),
+            DOWNLOAD: _Budget(
+                TokenBucket(download_rate, download_burst, clock, sleep),
+                AdaptiveConcurrency(download_concurrency, clock=clock)),
+        }
+
+    @contextlib.contextmanager
+    def slot(self, kind):
+        """Waits until a call of ``kind`` is allowed, and records how it
+        went."""
+        budget = self._budgets[kind]
+        budget.bucket.acquire()
+        budget.concurrency.acquire()
+        slot = _Slot()
+        start = self._clock()
+        try:
+            yield slot
+        except Exception as e:
+            if throttle_status(e):
+                slot.throttled()
+            raise
+        finally:
+            self._release(kind, budget, slot, self._clock() - start)
+
+    @contextlib.asynccontextmanager
+    async def async_slot(self, kind):
+        """Like ``slot()``, for coroutines."""
+        budget = self._budgets[kind]
+        await budget.bucket.acquire_async()
+        await budget.concurrency.acquire_async()
+        slot = _Slot()
+        start = self._clock()
+        try:
+            yield slot
+        except Exception as e:
+            if throttle_status(e):
+                slot.throttled()
+            raise
+        finally:
+            self._release(kind, budget, slot, self._clock() - start)
+
+    def _release(self, kind, budget, slot, latency):
+        budget.concurrency.release(latency, slot.is_throttled)
+        if slot.is_throttled:
+            logger.warning("Throttled by the server, slowing down {} "
+                           "requests".format(kind))
+            budget.bucket.pause(self._throttle_pause)
+        now = self._clock()
+        with self._lock:
+            budget.calls += 1
+            budget.throttled += slot.is_throttled
+            budget.recent.append(now)
+            while budget.recent and budget.recent[0] < now - _Budget.WINDOW:
+                budget.recent.popleft()
+
+    def metrics(self):
+        """Returns, for each kind of call, the configured and measured rate
+        in calls per second, the concurrency limit, the calls in flight and
+        waiting, and the totals."""
+        result = {}
+        now = self._clock()
+        with self._lock:
+            for kind, budget in self._budgets.items():
+                recent = [t for t in budget.recent
+                          if t >= now - _Budget.WINDOW]
+                result[kind] = dict(
+                    rate=budget.bucket.rate,
+                    current_rate=round(len(recent) / _Budget.WINDOW, 3),
+                    limit=round(budget.concurrency.limit, 2),
+                    in_flight=budget.concurrency.in_flight,
+                    waiting=budget.bucket.waiting +
+                    budget.concurrency.waiting,
+                    calls=budget.calls,
+                    throttled=budget.throttled)
+        return result
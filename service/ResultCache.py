@@ -0,0 +1,125 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from os import path
+from log import logger
+
+
+class ResultCache(object):
+    """Cache for remote call results with a per-entry time to live.
+
+    Recently used entries are kept in memory, up to ``max_entries``.  If a
+    database path is given, entries are also written to an SQLite database
+    so that they survive restarts.  Values must be JSON-serializable and
+    must not be None.
+    """
+
+    FILENAME = 'results.sqlite'
+    MAX_ENTRIES = 1024
+
+    def __init__(self, dbPath=None, max_entries=MAX_ENTRIES):
+        super().__init__()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self._db = None
+        if dbPath:
+            logger.debug("Result cache: '{}'".format(dbPath))
+            self._db = sqlite3.connect(dbPath, check_same_thread=False)
+            with self._lock, self._db:
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS results ('
+                    ' key TEXT PRIMARY KEY,'
+                    ' value TEXT NOT NULL,'
+                    ' expires REAL NOT NULL)')
+                self._db.execute('DELETE FROM results WHERE expires < ?',
+                                 (time.time(),))
+
+    @staticmethod
+    def in_directory(directory, max_entries=MAX_ENTRIES):
+        os.makedirs(directory, exist_ok=True)
+        return ResultCache(path.join(directory, ResultCache.FILENAME),
+                           max_entries)
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[1] < now:
+                del self._memory[key]
+                entry = None
+            if not entry and self._db:
+                row = self._db.execute(
+                    'SELECT value, expires FROM results '
+                    'WHERE key = ? AND expires >= ?', (key, now)).fetchone()
+                if row:
+                    entry = (json.loads(row[0]), row[1])
+                    self._remember(key, entry)
+            if not entry:
+                self.misses += 1
+                return default
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, ttl):
+        entry = (value, time.time() + ttl)
+        with self._lock:
+            self._remember(key, entry)
+            if self._db:
+                with self._db:
+                    self._db.execute(
+                        'INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                        (key, json.dumps(value), entry[1]))
+
+    def invalidate(self, key=None):
+        """Forgets ``key``, or every entry if no key is given."""
+        with self._lock:
+            if key is None:
+                self._memory.clear()
+            else:
+                self._memory.pop(key, None)
+            if self._db:
+                with self._db:
+                    if key is None:
+                        self._db.execute('DELETE FROM results')
+                    else:
+                        self._db.execute('DELETE FROM results WHERE key = ?',
+                                         (key,))
+
+    def close(self):
+        with self._lock:
+            if self._db:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
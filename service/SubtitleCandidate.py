@@ -0,0 +1,146 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import NamedTuple
+
+# How a subtitle was found, best match first.  A hash miss falls back to the
+# file name, then to an IMDb id in the file or directory name.
+MATCH_HASH = 'moviehash'
+MATCH_TAG = 'tag'
+MATCH_IMDB = 'imdbid'
+MATCHES = (MATCH_HASH, MATCH_TAG, MATCH_IMDB)
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class Language(NamedTuple):
+    code: str  # ISO 639-1, may be empty
+    name: str
+    id: str  # SubLanguageID, as used by the search
+
+    @staticmethod
+    def from_dict(d):
+        return Language(d['code'], d['name'], d['id'])
+
+
+class SubtitleCandidate(object):
+    """A subtitle found by a search.
+
+    Numeric fields are kept as the strings the server sent and converted
+    when they are read, so that records which are never looked at cost
+    only their slots.  ``to_row()`` and ``from_row()`` convert to and from
+    a JSON-friendly list.
+    """
+
+    __slots__ = ('hash', '_size', '_bad', '_rating', '_downloads', '_fps',
+                 '_featured', 'encoding', 'download_link', 'language_id',
+                 'format', 'language_id_iso', '_score', 'matched_by')
+
+    def __init__(self, hash, size, bad, rating, downloads, fps, featured,
+                 encoding, download_link, language_id, format,
+                 language_id_iso, score, matched_by=MATCH_HASH):
+        self.hash = hash
+        self._size = size
+        self._bad = bad
+        self._rating = rating
+        self._downloads = downloads
+        self._fps = fps
+        self._featured = featured
+        self.encoding = encoding
+        self.download_link = download_link
+        self.language_id = language_id
+        self.format = format
+        self.language_id_iso = language_id_iso
+        self._score = score
+        self.matched_by = matched_by
+
+    @staticmethod
+    def from_result(sub, match=MATCH_HASH):
+        """Creates a candidate from a SearchSubtitles result."""
+        return SubtitleCandidate(sub['SubHash'],
+                                 sub['SubSize'],
+                                 sub['SubBad'],
+                                 sub['SubRating'],
+                                 sub['SubDownloadsCnt'],
+                                 sub['MovieFPS'],
+                                 sub['SubFeatured'],
+                                 sub['SubEncoding'],
+                                 sub['SubDownloadLink'],
+                                 sub['SubLanguageID'],
+                                 sub['SubFormat'],
+                                 sub['ISO639'],
+                                 sub['Score'],
+                                 match)
+
+    @staticmethod
+    def from_row(row):
+        return SubtitleCandidate(*row)
+
+    def to_row(self):
+        return [getattr(self, name) for name in SubtitleCandidate.__slots__]
+
+    @property
+    def size(self):
+        return _int(self._size)
+
+    @property
+    def bad(self):
+        return _int(self._bad) != 0
+
+    @property
+    def rating(self):
+        return _float(self._rating)
+
+    @property
+    def downloads(self):
+        return _int(self._downloads)
+
+    @property
+    def fps(self):
+        return _float(self._fps)
+
+    @property
+    def featured(self):
+        return _int(self._featured) != 0
+
+    @property
+    def score(self):
+        return _float(self._score)
+
+    def __eq__(self, other):
+        return isinstance(other, SubtitleCandidate) and \
+            self.to_row() == other.to_row()
+
+    def __hash__(self):
+        return hash(tuple(self.to_row()))
+
+    def __repr__(self):
+        return 'SubtitleCandidate({!r}, {}, {})'.format(
+            self.download_link, self.language_id, self.matched_by)
@@ -0,0 +1,149 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import collections
+import heapq
+import math
+from operator import mul
+from service.OpenSubService import DEFAULT_LANGUAGES
+from service.SubtitleCandidate import MATCH_HASH, MATCH_TAG, MATCH_IMDB
+
+# Subtitle formats, most preferred first
+FORMATS = ('srt', 'ass', 'ssa', 'vtt', 'sub', 'smi', 'txt', 'mpl')
+
+
+class SubtitleRanker(object):
+    """Orders ``SubtitleCandidate`` records by a weighted sum of their
+    features.
+
+    Every feature is normalized to [-1, 1] and multiplied by its weight in
+    ``weights``; missing weights take the defaults in ``WEIGHTS``.  Ranking
+    computes each candidate's score once and sorts once.  ``fps`` is the
+    frame rate of the video, if known, and ``languages`` lists the
+    subtitle language IDs, most preferred first.
+    """
+
+    FEATURES = ('bad', 'match', 'language', 'fps', 'rating', 'downloads',
+                'featured', 'score', 'format')
+    WEIGHTS = dict(bad=-10.0,
+                   match=4.0,
+                   language=3.0,
+                   fps=2.0,
+                   rating=2.0,
+                   downloads=1.5,
+                   featured=1.0,
+                   score=1.0,
+                   format=0.5)
+
+    MATCHES = {MATCH_HASH: 1.0, MATCH_TAG: 0.5, MATCH_IMDB: 0.0}
+    # Frame rates closer than this are considered equal
+    FPS_TOLERANCE = 0.01
+    # Values at which the rating, download count and server score max out
+    MAX_RATING = 10.0
+    MAX_DOWNLOADS = 1e6
+    MAX_SCORE = 20.0
+
+    def __init__(self, weights=None, formats=FORMATS):
+        super().__init__()
+        weights = dict(SubtitleRanker.WEIGHTS, **(weights or {}))
+        unknown = set(weights) - set(SubtitleRanker.FEATURES)
+        if unknown:
+            raise ValueError("Unknown features: {}".format(
+                ', '.join(sorted(unknown))))
+        self.weights = weights
+        self._weights = tuple(weights[f] for f in SubtitleRanker.FEATURES)
+        self._formats = {fmt: 1.0 - i / len(formats)
+                         for i, fmt in enumerate(formats)}
+        self._max_downloads = math.log1p(SubtitleRanker.MAX_DOWNLOADS)
+
+    @staticmethod
+    def _priorities(languages):
+        languages = languages or DEFAULT_LANGUAGES
+        return {lang: 1.0 - i / len(languages)
+                for i, lang in enumerate(languages)}
+
+    def _features(self, subtitle, fps, priorities):
+        subtitleFps = subtitle.fps
+        if fps and subtitleFps:
+            fpsMatch = 1.0 if abs(fps - subtitleFps) < \
+                SubtitleRanker.FPS_TOLERANCE else -1.0
+        else:
+            fpsMatch = 0.0
+        return (
+            1.0 if subtitle.bad else 0.0,
+            SubtitleRanker.MATCHES.get(subtitle.matched_by, 0.0),
+            priorities.get(subtitle.language_id, 0.0),
+            fpsMatch,
+            min(subtitle.rating, SubtitleRanker.MAX_RATING) /
+            SubtitleRanker.MAX_RATING,
+            min(math.log1p(subtitle.downloads) / self._max_downloads, 1.0),
+            1.0 if subtitle.featured else 0.0,
+            min(subtitle.score, SubtitleRanker.MAX_SCORE) /
+            SubtitleRanker.MAX_SCORE,
+            self._formats.get(subtitle.format, 0.0),
+        )
+
+    def score(self, subtitle, fps=None, languages=None):
+        return sum(map(mul, self._weights, self._features(
+            subtitle, fps, self._priorities(languages))))
+
+    def breakdown(self, subtitle, fps=None, languages=None):
+        """Returns the weighted value of every feature, and their sum as
+        ``total``."""
+        features = self._features(subtitle, fps, self._priorities(languages))
+        result = {name: weight * value for name, weight, value in
+                  zip(SubtitleRanker.FEATURES, self._weights, features)}
+        result['total'] = sum(result.values())
+        return result
+
+    def _key(self, fps, languages):
+        priorities = self._priorities(languages)
+        weights = self._weights
+        return lambda s: sum(map(mul, weights,
+                                 self._features(s, fps, priorities)))
+
+    def rank(self, subtitles, fps=None, languages=None):
+        """Returns ``subtitles`` sorted best first."""
+        return sorted(subtitles, key=self._key(fps, languages), reverse=True)
+
+    def top(self, subtitles, n, fps=None, languages=None):
+        """Returns the ``n`` best of ``subtitles``, best first, without
+        sorting the rest.  ``subtitles`` may be a generator."""
+        return heapq.nlargest(n, subtitles, key=self._key(fps, languages))
+
+    @staticmethod
+    def video_fps(subtitles):
+        """Returns the frame rate that most of the ``subtitles`` matched by
+        hash were made for, as that of the video, or None."""
+        counts = collections.Counter(
+            round(s.fps, 3) for s in subtitles
+            if s.matched_by == MATCH_HASH and s.fps)
+        return counts.most_common(1)[0][0] if counts else None
+
+    def best_per_language(self, subtitles, languages, fps=None):
+        """Returns the best of ``subtitles`` for each of ``languages``, in
+        the order of ``languages``, skipping languages without subtitles."""
+        languages = languages or DEFAULT_LANGUAGES
+        key = self._key(fps, languages)
+        best = {}
+        for subtitle in subtitles:
+            score = key(subtitle)
+            current = best.get(subtitle.language_id)
+            if current is None or score > current[0]:
+                best[subtitle.language_id] = (score, subtitle)
+        return [best[lang][1] for lang in languages if lang in best]
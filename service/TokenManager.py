@@ -0,0 +1,154 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+import time
+from log import logger
+
+
+class TokenManager(object):
+    """Shares one session token between threads.
+
+    The token is fetched with ``login()`` on first use, and then handed to
+    every caller until it is invalidated.  Concurrent callers wait for the
+    same login rather than each logging in.
+
+    The server ends a session after some idle time (15 minutes for
+    OpenSubtitles).  A token that has not been used for ``refresh_after``
+    seconds is first checked with ``no_operation(token)``, which also
+    extends the session, and replaced if the server no longer accepts it.
+    ``start()`` does the same in the background, so that an idle
+    application keeps its session.
+    """
+
+    REFRESH_AFTER = 10 * 60  # seconds
+    KEEP_ALIVE_INTERVAL = 60  # seconds
+
+    def __init__(self, login, no_operation, refresh_after=REFRESH_AFTER,
+                 clock=time.monotonic):
+        super().__init__()
+        self._login = login
+        self._no_operation = no_operation
+        self._refresh_after = refresh_after
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._token = None
+        self._used = 0.0
+        self._stopped = None
+        self._thread = None
+        self.logins = 0
+        self.refreshes = 0
+
+    def token(self):
+        """Returns a valid token, logging in if needed.
+
+        Raises whatever ``login()`` raises if that fails.
+        """
+        with self._lock:
+            if self._token and self._idle() >= self._refresh_after:
+                self._refresh()
+            if not self._token:
+                logger.debug("Logging in")
+                self._token = self._login()
+                self.logins += 1
+            self._used = self._clock()
+            return self._token
+
+    def ready_token(self):
+        """Returns the token that ``token()`` would return without calling
+        the server, or None if it would log in or refresh the session, or
+        if another thread is doing so.  Never blocks.
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            if not self._token or self._idle() >= self._refresh_after:
+                return None
+            self._used = self._clock()
+            return self._token
+        finally:
+            self._lock.release()
+
+    def touch(self, token):
+        """Records that ``token`` was used in a request, which the server
+        counts as activity."""
+        with self._lock:
+            if token == self._token:
+                self._used = self._clock()
+
+    def invalidate(self, token):
+        """Drops ``token`` after the server refused it.
+
+        The next ``token()`` logs in again.  A token that has already been
+        replaced is ignored, so callers that fail with the same token cause
+        one login between them.
+        """
+        with self._lock:
+            if token == self._token:
+                logger.info("Session expired")
+                self._token = None
+
+    def reset(self):
+        """Drops the token, e.g. after the credentials have changed."""
+        with self._lock:
+            self._token = None
+
+    def keep_alive(self):
+        """Refreshes the token if it has been idle for too long."""
+        with self._lock:
+            if self._token and self._idle() >= self._refresh_after:
+                self._refresh()
+
+    def start(self, interval=KEEP_ALIVE_INTERVAL):
+        """Calls ``keep_alive()`` every ``interval`` seconds on a daemon
+        thread, until ``stop()``."""
+        if self._thread:
+            return
+        # One event per thread, as a stopped thread may still be refreshing
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        args=(interval, self._stopped),
+                                        name='keep-alive', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the keep-alive thread, without waiting for a refresh in
+        progress, which could block on the network."""
+        if not self._thread:
+            return
+        self._stopped.set()
+        self._thread = self._stopped = None
+
+    def _run(self, interval, stopped):
+        while not stopped.wait(interval):
+            try:
+                self.keep_alive()
+            except Exception as e:
+                logger.warning("Unable to refresh the session: {}".format(e))
+
+    def _idle(self):
+        return self._clock() - self._used
+
+    def _refresh(self):
+        # Called with the lock held
+        self.refreshes += 1
+        if self._no_operation(self._token):
+            self._used = self._clock()
+        else:
+            logger.info("Session expired while idle")
+            self._token = None
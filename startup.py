@@ -0,0 +1,76 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Start-up timing of the GUI.
+
+``main.py`` marks the steps of the start-up.  If ``SUBTITLES_STARTUP_REPORT``
+is set, the time of each step and the modules imported until then are
+written to stderr once the window is shown:
+
+    SUBTITLES_STARTUP_REPORT=1 python main.py
+
+With ``SUBTITLES_STARTUP_REPORT=quit`` the application exits right after,
+which is how ``benchmarks/Startup_bench.py`` measures the start-up.  For
+the time spent in every import, run ``python -X importtime main.py``.
+"""
+
+import json
+import os
+import sys
+import time
+
+ENV = 'SUBTITLES_STARTUP_REPORT'
+
+# Modules that the window should not need to be shown
+DEFERRED_MODULES = ('requests', 'xmlrpc.client', 'pythonopensubtitles',
+                    'service.OpenSubService', 'ui.PreferencesDialog',
+                    'ui.AboutDialog')
+
+_start = time.perf_counter()
+_marks = []
+
+
+def mark(step):
+    """Records that ``step`` has finished."""
+    _marks.append((step, time.perf_counter(), len(sys.modules)))
+
+
+def enabled():
+    return bool(os.environ.get(ENV))
+
+
+def quit_after_report():
+    return os.environ.get(ENV) == 'quit'
+
+
+def report():
+    """Returns the steps so far, as a JSON-compatible dict."""
+    steps = []
+    previous = _start
+    for step, t, modules in _marks:
+        steps.append(dict(step=step,
+                          ms=round((t - _start) * 1000, 1),
+                          delta_ms=round((t - previous) * 1000, 1),
+                          modules=modules))
+        previous = t
+    return dict(steps=steps,
+                loaded=[m for m in DEFERRED_MODULES if m in sys.modules])
+
+
+def write_report(stream=sys.stderr):
+    print(json.dumps(report()), file=stream, flush=True)
@@ -0,0 +1,149 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import asyncio
+import unittest
+
+from .context import service
+from service.AsyncHttpClient import AsyncHttpClient, HttpError
+
+
+class AsyncHttpClientTests(unittest.TestCase):
+    """Talks to a scripted HTTP/1.1 server on the same event loop."""
+
+    def setUp(self):
+        self.connections = 0
+        self.requests = []
+        self.responses = {}
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            headers = {}
+            while True:
+                header = await reader.readline()
+                if header == b'\r\n':
+                    break
+                name, _, value = header.decode().partition(':')
+                headers[name.lower()] = value.strip()
+            body = await reader.readexactly(
+                int(headers.get('content-length', 0)))
+            method, target, version = line.decode().split()
+            self.requests.append((method, target, body))
+            if target not in self.responses:
+                # Never answers, until the client hangs up
+                await reader.read()
+                break
+            writer.write(self.responses[target])
+            await writer.drain()
+            if b'Connection: close' in self.responses[target]:
+                break
+        writer.close()
+
+    def _run(self, coro_func, **kwargs):
+        async def main():
+            server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            client = AsyncHttpClient('test', **kwargs)
+            try:
+                return await coro_func(
+                    client, 'http://127.0.0.1:{}'.format(port))
+            finally:
+                client.close()
+                server.close()
+                await server.wait_closed()
+        return asyncio.run(main())
+
+    def test_keep_alive(self):
+        self.responses['/a'] = b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n' \
+            b'\r\nok'
+
+        async def requests(client, url):
+            return [(await client.request('POST', url + '/a', b'x')).body
+                    for i in range(3)]
+
+        self.assertEqual(self._run(requests), [b'ok'] * 3)
+        self.assertEqual(self.connections, 1)
+        self.assertEqual(self.requests, [('POST', '/a', b'x')] * 3)
+
+    def test_chunked(self):
+        self.responses['/c'] = b'HTTP/1.1 200 OK\r\n' \
+            b'Transfer-Encoding: chunked\r\n\r\n' \
+            b'3\r\nabc\r\n2;ext=1\r\nde\r\n0\r\n\r\n'
+
+        async def request(client, url):
+            chunks = []
+            await client.request('GET', url + '/c', on_chunk=chunks.append)
+            return chunks
+
+        self.assertEqual(self._run(request), [b'abc', b'de'])
+
+    def test_redirect(self):
+        self.responses['/old'] = b'HTTP/1.1 302 Found\r\n' \
+            b'Location: /new\r\nContent-Length: 0\r\n\r\n'
+        self.responses['/new'] = b'HTTP/1.1 200 OK\r\n' \
+            b'Connection: close\r\n\r\nnew'
+
+        async def request(client, url):
+            return await client.request('GET', url + '/old')
+
+        response = self._run(request)
+        self.assertEqual((response.status, response.body), (200, b'new'))
+        self.assertTrue(response.url.endswith('/new'))
+
+    def test_error(self):
+        self.responses['/busy'] = b'HTTP/1.1 503 Service Unavailable\r\n' \
+            b'Content-Length: 4\r\n\r\nbusy'
+        chunks = []
+
+        async def request(client, url):
+            await client.request('GET', url + '/busy',
+                                 on_chunk=chunks.append)
+
+        with self.assertRaises(HttpError) as cm:
+            self._run(request)
+        self.assertEqual(cm.exception.status, 503)
+        # The error body is not taken for the content
+        self.assertEqual(chunks, [])
+
+    def test_timeout(self):
+        writers = []
+
+        async def request(client, url):
+            connect = client._connect
+
+            async def record(key):
+                connection = await connect(key)
+                writers.append(connection[1])
+                return connection
+
+            client._connect = record
+            with self.assertRaises(asyncio.TimeoutError):
+                await client.request('GET', url + '/slow')
+            return writers[0].is_closing()
+
+        # The connection is closed rather than left open
+        self.assertTrue(self._run(request, timeout=0.1))
+
+
+if __name__ == '__main__':
+    unittest.main()
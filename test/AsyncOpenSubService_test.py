@@ -0,0 +1,184 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import asyncio
+import os
+import stat
+import tempfile
+import time
+import unittest
+
+from .context import service
+from .FakeOpenSubServer import FakeServerTestCase
+from service.AsyncHttpClient import HttpError
+from service.AsyncOpenSubService import AsyncOpenSubService
+from service.DownloadService import DownloadCancelled, _UMASK
+from service.OpenSubService import NoSubtitlesFound, SearchError
+from service.RateLimiter import RateLimiter, SEARCH
+
+
+class AsyncOpenSubServiceTests(FakeServerTestCase):
+    server_options = dict(latency=0.05, missing=['{:016x}'.format(7)])
+
+    def setUp(self):
+        super().setUp()
+        self._dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._dir.cleanup()
+        super().tearDown()
+
+    def _run(self, coro_func, **kwargs):
+        # The client belongs to the loop it is used on
+        async def main():
+            asyncService = AsyncOpenSubService(self.subService, **kwargs)
+            try:
+                return await coro_func(asyncService)
+            finally:
+                asyncService.close()
+        return asyncio.run(main())
+
+    def test_login(self):
+        token = self._run(lambda s: s.login())
+        self.assertEqual(token, self.subService.session.token())
+
+    def test_find_by_hash(self):
+        subtitles = self._run(lambda s: s.find_by_hash('{:016x}'.format(1)))
+        self.assertEqual(len(subtitles), 3)
+        self.assertEqual(subtitles[0].language_id, 'eng')
+        with self.assertRaises(NoSubtitlesFound):
+            self._run(lambda s: s.find_by_hash('{:016x}'.format(7)))
+
+    def test_find_by_hashes(self):
+        hashes = ['{:016x}'.format(i) for i in range(45)]
+        result = self._run(lambda s: s.find_by_hashes(hashes, chunk_size=5))
+        self.assertEqual(list(result), hashes)
+        self.assertEqual(result[hashes[7]], [])
+        self.assertEqual(self.server.calls['SearchSubtitles'], 9)
+        # The session is the one of the wrapped service
+        self.assertEqual(self.server.calls['LogIn'], 1)
+        self.assertEqual(self.subService.session.logins, 1)
+
+    def test_concurrent(self):
+        async def search(asyncService):
+            return await asyncio.gather(*[
+                asyncService.find_by_hash('{:016x}'.format(100 + i))
+                for i in range(100)])
+
+        start = time.monotonic()
+        results = self._run(search)
+        elapsed = time.monotonic() - start
+        self.assertEqual(len(results), 100)
+        # 100 calls of 50 ms each, far from one at a time
+        self.assertLess(elapsed, 3.0)
+
+    def test_session_token(self):
+        session = self.subService.session
+        token = session.token
+        blocking = []
+
+        def recordToken():
+            blocking.append(token())
+            return blocking[-1]
+
+        session.token = recordToken
+
+        async def search(asyncService):
+            for i in range(3):
+                await asyncService.find_by_hash('{:016x}'.format(1 + i))
+
+        self._run(search)
+        # Only the login leaves the loop's thread
+        self.assertEqual(blocking, ['token1'])
+
+    def test_session_expired(self):
+        async def search(asyncService):
+            await asyncService.find_by_hash('{:016x}'.format(1))
+            self.server.expire_tokens()
+            return await asyncService.find_by_hash('{:016x}'.format(2))
+
+        self.assertEqual(len(self._run(search)), 3)
+        self.assertEqual(self.server.calls['LogIn'], 2)
+
+    def test_get_languages(self):
+        languages = self._run(lambda s: s.get_languages())
+        self.assertEqual([lang.id for lang in languages][:2],
+                         ['eng', 'fre'])
+
+    def test_download(self):
+        moviePath = os.path.join(self._dir.name, 'movie.avi')
+
+        async def download(asyncService):
+            subtitles = await asyncService.find_by_hash('{:016x}'.format(1))
+            return await asyncService.download_subtitle(subtitles[0],
+                                                        moviePath)
+
+        subtitlePath = self._run(download)
+        self.assertEqual(subtitlePath,
+                         os.path.join(self._dir.name, 'movie.eng.srt'))
+        with open(subtitlePath) as f:
+            self.assertTrue(f.read().startswith('1\n'))
+        self.assertEqual(stat.S_IMODE(os.stat(subtitlePath).st_mode),
+                         0o666 & ~_UMASK)
+
+    def test_download_cancelled(self):
+        moviePath = os.path.join(self._dir.name, 'movie.avi')
+
+        async def download(asyncService):
+            subtitles = await asyncService.find_by_hash('{:016x}'.format(1))
+            return await asyncService.download_subtitle(
+                subtitles[0], moviePath, cancelled=lambda: True)
+
+        with self.assertRaises(DownloadCancelled):
+            self._run(download)
+        self.assertEqual(os.listdir(self._dir.name), [])
+
+    def test_retry_throttled(self):
+        limiter = RateLimiter(search_rate=100, throttle_pause=0.01)
+
+        async def search(asyncService):
+            await asyncService.login()
+            self.server.throttle(2)
+            return await asyncService.find_by_hash('{:016x}'.format(1))
+
+        self.assertEqual(len(self._run(search, rate_limiter=limiter)), 3)
+        self.assertEqual(self.server.calls['429'], 2)
+        self.assertEqual(limiter.metrics()[SEARCH]['throttled'], 2)
+
+    def test_no_limiter(self):
+        async def search(asyncService):
+            await asyncService.login()
+            self.server.throttle(1)
+            return await asyncService.find_by_hash('{:016x}'.format(1))
+
+        with self.assertRaises(HttpError):
+            self._run(search)
+
+    def test_search_failed(self):
+        async def search(asyncService):
+            await asyncService.login()
+            self.server.fail_searches(1, '429 Too many requests')
+            return await asyncService.find_by_hash('{:016x}'.format(1))
+
+        with self.assertRaises(SearchError):
+            self._run(search)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from .context import service
+from service.BatchRunner import BatchRunner
+from service.SubtitleCandidate import SubtitleCandidate
+
+
+class FakeSubtitleService(object):
+    def __init__(self):
+        self.searches = []
+
+    def calculate_hash(self, filePath):
+        if filePath.endswith('broken.avi'):
+            raise ValueError('too small')
+        return os.path.basename(filePath)
+
+    def find_by_hashes(self, hashes, sizes, languages=None, paths=None):
+        self.searches.append(hashes)
+        subtitles = [SubtitleCandidate('', '100', '0', '0', '0', '0', '0',
+                                       'UTF-8', '', lang, 'srt', '', '0')
+                     for lang in ['ger'] + languages]
+        return {h: [] if h.startswith('missing') else subtitles
+                for h in hashes}
+
+
+class FakeDownloadService(object):
+    def download_subtitle(self, subtitle, filePath):
+        return '{}.{}.srt'.format(filePath, subtitle.language_id)
+
+
+class BatchRunnerTests(unittest.TestCase):
+    def test_run(self):
+        with tempfile.TemporaryDirectory() as directory:
+            names = ['movie{}.avi'.format(i) for i in range(25)] + \
+                ['missing.avi', 'broken.avi']
+            files = [os.path.join(directory, n) for n in names]
+            for f in files:
+                open(f, 'wb').close()
+
+            events = []
+            subService = FakeSubtitleService()
+            runner = BatchRunner(subService, FakeDownloadService(),
+                                 languages=['eng', 'bul'],
+                                 jobs=4, on_event=events.append)
+            stats = runner.run(files)
+
+        self.assertEqual((stats.queued, stats.downloaded, stats.failed),
+                         (27, 25, 2))
+        self.assertEqual(sorted(len(s) for s in subService.searches), [6, 20])
+        failed = {e['file']: e['stage'] for e in events
+                  if e['event'] == 'failed'}
+        self.assertEqual(failed, {files[-2]: 'Find Subtitles',
+                                  files[-1]: 'Hash'})
+        self.assertEqual(events[-1]['event'], 'finished')
+        downloaded = [e['subtitle'] for e in events
+                      if e['event'] == 'downloaded']
+        self.assertEqual(len(downloaded), 50)
+        self.assertIn(files[0] + '.bul.srt', downloaded)
+
+    def test_cli_does_not_import_qt(self):
+        root = os.path.join(os.path.dirname(__file__), '..')
+        code = "import sys, cli; " \
+            "sys.exit(any(m.startswith('PyQt5') for m in sys.modules))"
+        subprocess.check_call([sys.executable, '-c', code], cwd=root)
@@ -0,0 +1,143 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import gzip
+import os
+import stat
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import requests
+
+from .context import service
+from service.DownloadService import (
+    DownloadService, DownloadCancelled, _UMASK
+)
+from service.RateLimiter import DOWNLOAD, RateLimiter
+from service.SubtitleCandidate import SubtitleCandidate
+
+SUBTITLE = b'1\n00:00:01,000 --> 00:00:02,000\nHello\n\n' * 1000
+
+
+class GzipHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    failures = 0
+
+    def do_GET(self):
+        if self.path in ('/flaky', '/busy') and GzipHandler.failures < 2:
+            GzipHandler.failures += 1
+            self.send_response(502 if self.path == '/flaky' else 503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = gzip.compress(SUBTITLE)
+        if self.path == '/truncated':
+            body = body[:len(body) // 2]
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadServiceTests(unittest.TestCase):
+    def setUp(self):
+        self._server = HTTPServer(('127.0.0.1', 0), GzipHandler)
+        threading.Thread(target=self._server.serve_forever,
+                         daemon=True).start()
+        self._url = 'http://127.0.0.1:{}'.format(self._server.server_port)
+        self._dir = tempfile.TemporaryDirectory()
+        self._movie = os.path.join(self._dir.name, 'movie.avi')
+
+    def tearDown(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._dir.cleanup()
+
+    def _subtitle(self, urlPath):
+        return SubtitleCandidate('', '100', '0', '0', '0', '0', '0', 'UTF-8',
+                                 self._url + urlPath, 'eng', 'srt', 'en',
+                                 '0')
+
+    def test_download(self):
+        svc = DownloadService()
+        filename = svc.download_subtitle(self._subtitle('/sub.gz'),
+                                         self._movie)
+        self.assertEqual(filename,
+                         os.path.join(self._dir.name, 'movie.eng.srt'))
+        with open(filename, 'rb') as f:
+            self.assertEqual(f.read(), SUBTITLE)
+        self.assertEqual(os.listdir(self._dir.name), ['movie.eng.srt'])
+
+    def test_mode(self):
+        svc = DownloadService()
+        filename = svc.download_subtitle(self._subtitle('/sub.gz'),
+                                         self._movie)
+        # As for any new file, rather than mkstemp()'s 0600
+        self.assertEqual(stat.S_IMODE(os.stat(filename).st_mode),
+                         0o666 & ~_UMASK)
+        # A replaced subtitle keeps its mode
+        os.chmod(filename, 0o640)
+        svc.download_subtitle(self._subtitle('/sub.gz'), self._movie)
+        self.assertEqual(stat.S_IMODE(os.stat(filename).st_mode), 0o640)
+
+    def test_retry(self):
+        GzipHandler.failures = 0
+        svc = DownloadService(backoff=0)
+        filename = svc.download_subtitle(self._subtitle('/flaky'),
+                                         self._movie)
+        self.assertEqual(GzipHandler.failures, 2)
+        self.assertTrue(os.path.exists(filename))
+        svc.close()
+
+    def test_retry_throttled(self):
+        GzipHandler.failures = 0
+        limiter = RateLimiter(throttle_pause=0)
+        svc = DownloadService(backoff=0, rate_limiter=limiter)
+        svc.download_subtitle(self._subtitle('/busy'), self._movie)
+        # Every attempt goes through the limiter
+        metrics = limiter.metrics()[DOWNLOAD]
+        self.assertEqual((metrics['calls'], metrics['throttled']), (3, 2))
+        svc.close()
+
+    def test_throttled(self):
+        GzipHandler.failures = 0
+        svc = DownloadService(backoff=0)
+        # Not retried without a limiter to pause the downloads
+        with self.assertRaises(requests.HTTPError) as cm:
+            svc.download_subtitle(self._subtitle('/busy'), self._movie)
+        self.assertEqual(cm.exception.response.status_code, 503)
+        self.assertEqual(GzipHandler.failures, 1)
+        svc.close()
+
+    def test_truncated(self):
+        svc = DownloadService()
+        with self.assertRaises(IOError):
+            svc.download_subtitle(self._subtitle('/truncated'), self._movie)
+        self.assertEqual(os.listdir(self._dir.name), [])
+
+    def test_cancelled(self):
+        svc = DownloadService()
+        with self.assertRaises(DownloadCancelled):
+            svc.download_subtitle(self._subtitle('/sub.gz'), self._movie,
+                                  cancelled=lambda: True)
+        self.assertEqual(os.listdir(self._dir.name), [])
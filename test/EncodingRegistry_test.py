@@ -0,0 +1,71 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+
+from .context import service
+from service.EncodingRegistry import EncodingRegistry
+
+
+class EncodingRegistryTests(unittest.TestCase):
+    def setUp(self):
+        self.registry = EncodingRegistry()
+
+    def test_lookup(self):
+        self.assertEqual(self.registry.lookup('UTF-8'), 'utf-8')
+        self.assertEqual(self.registry.lookup('utf8'), 'utf-8')
+        self.assertEqual(self.registry.lookup('Windows-1251'), 'cp1251')
+        self.assertEqual(self.registry.lookup('latin1'), 'iso8859-1')
+        self.assertIsNone(self.registry.lookup('no-such-encoding'))
+        self.assertIsNone(self.registry.lookup(''))
+
+    def test_binary_codecs_skipped(self):
+        self.assertIsNone(self.registry.lookup('base64'))
+        self.assertNotIn('BASE64-CODEC', self.registry.names)
+
+    def test_names(self):
+        names = self.registry.names
+        self.assertIn('UTF-8', names)
+        self.assertIn('CP1251', names)
+        self.assertEqual(len(names), len(set(names)))
+        self.assertEqual(list(names), sorted(names, key=str.lower))
+        self.assertIs(self.registry.names, names)
+
+    def test_qt_codec(self):
+        self.registry.register_qt_codec('windows-1251', ['CP1251'])
+        self.assertEqual(self.registry.qt_name('cp1251'), 'windows-1251')
+        self.assertEqual(self.registry.display_name('CP1251'), 'windows-1251')
+        self.assertIn('windows-1251', self.registry.names)
+        self.assertNotIn('CP1251', self.registry.names)
+
+    def test_qt_only_alias(self):
+        # Qt knows the codec by a name Python does not
+        self.registry.register_qt_codec('Qt-Only-Name', ['cp1252'])
+        self.assertEqual(self.registry.lookup('Qt-Only-Name'), 'cp1252')
+
+    def test_unknown_qt_codec(self):
+        self.registry.register_qt_codec('TSCII', ['x-tscii'])
+        self.assertIsNone(self.registry.lookup('TSCII'))
+        self.assertNotIn('TSCII', self.registry.names)
+
+    def test_instance(self):
+        self.assertIs(EncodingRegistry.instance(), EncodingRegistry.instance())
+
+
+if __name__ == '__main__':
+    unittest.main()
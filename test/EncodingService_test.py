@@ -0,0 +1,79 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import codecs
+import os
+import tempfile
+import unittest
+
+from .context import service
+from service.EncodingService import EncodingService
+
+TEXT = '1\n00:00:01,000 --> 00:00:02,000\nЗдравей, свят!\n'
+
+
+class EncodingServiceTests(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._dir.name, 'movie.bul.srt')
+        self.svc = EncodingService()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _write(self, data):
+        with open(self._path, 'wb') as f:
+            f.write(data)
+
+    def _read(self):
+        with open(self._path, 'rb') as f:
+            return f.read()
+
+    def test_convert_with_hint(self):
+        self._write(TEXT.encode('cp1251') * 5000)
+        self.assertEqual(self.svc.convert_file(self._path, 'UTF-8', 'CP1251'),
+                         'cp1251')
+        self.assertEqual(self._read(), TEXT.encode('utf-8') * 5000)
+
+    def test_convert_bom(self):
+        self._write(codecs.BOM_UTF16_LE + TEXT.encode('utf-16-le'))
+        self.assertEqual(self.svc.convert_file(self._path, 'windows-1251',
+                                               'CP1252'), 'utf-16')
+        self.assertEqual(self._read(), TEXT.encode('cp1251'))
+
+    def test_detect_utf8(self):
+        self._write(TEXT.encode('utf-8'))
+        self.assertEqual(self.svc.convert_file(self._path, 'UTF-8', 'ASCII'),
+                         'utf-8')
+        self.assertEqual(self.svc.convert_file(self._path, 'UTF-8', 'bogus'),
+                         'utf-8')
+        self.assertEqual(self._read(), TEXT.encode('utf-8'))
+
+    def test_wrong_hint(self):
+        # UTF-8 text also decodes as CP1251, into mojibake
+        self._write(TEXT.encode('utf-8'))
+        self.assertEqual(self.svc.convert_file(self._path, 'UTF-8', 'CP1251'),
+                         'utf-8')
+        self.assertEqual(self._read(), TEXT.encode('utf-8'))
+
+    def test_unencodable(self):
+        self._write(TEXT.encode('utf-8'))
+        with self.assertRaises(UnicodeEncodeError):
+            self.svc.convert_file(self._path, 'ISO-8859-1')
+        self.assertEqual(self._read(), TEXT.encode('utf-8'))
+        self.assertEqual(os.listdir(self._dir.name), ['movie.bul.srt'])
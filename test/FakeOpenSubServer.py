@@ -0,0 +1,345 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+"""A local stand-in for the OpenSubtitles XML-RPC API.
+
+Implements LogIn, LogOut, NoOperation, SearchSubtitles and GetSubLanguages,
+and serves gzipped subtitles for the download links it hands out.  Latency,
+error rate and result sizes are configurable, so the same server is used for
+offline tests and for load benchmarks:
+
+    python -m test.FakeOpenSubServer --port 8000 --latency 0.05
+    python main.py scan --server http://127.0.0.1:8000/xml-rpc DIR
+"""
+
+import argparse
+import collections
+import gzip
+import random
+import re
+import threading
+import time
+import unittest
+import zlib
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+from .context import service
+from service.OpenSubService import OpenSubService
+
+LANGUAGES = [
+    ('eng', 'en', 'English'),
+    ('fre', 'fr', 'French'),
+    ('ger', 'de', 'German'),
+    ('spa', 'es', 'Spanish'),
+    ('bul', 'bg', 'Bulgarian'),
+]
+_LANGUAGE_CODES = {id: code for id, code, name in LANGUAGES}
+
+OK = '200 OK'
+UNAUTHORIZED = '401 Unauthorized'
+
+
+class _Handler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/xml-rpc',)
+
+    def do_POST(self):
+        if self.server.fake.delay_or_fail(self):
+            super().do_POST()
+
+    def do_GET(self):
+        if not self.server.fake.delay_or_fail(self):
+            return
+        match = re.match(r'^/download/(\d+)\.gz$', self.path)
+        if not match:
+            self.send_error(404)
+            return
+        body = gzip.compress(self.server.fake.subtitle(int(match.group(1))))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+    # Room for the connections of many concurrent clients
+    request_queue_size = 128
+
+
+class FakeOpenSubServer(object):
+    """Serves the fake API on ``127.0.0.1``.
+
+    ``latency`` seconds are added to every request, and ``error_rate`` of the
+    requests fail with HTTP 503.  A searched hash has subtitles unless it is
+    in ``missing`` or falls within ``miss_rate``; it then has
+    ``results_per_language`` subtitles in each requested language.  File
+    name (tag) and IMDb id queries only find subtitles for the names in
+    ``tags`` and the ids in ``imdb_ids``.
+    Subtitles have ``subtitle_lines`` cues.  Sessions expire after
+    ``token_lifetime`` seconds.
+    """
+
+    def __init__(self, port=0, latency=0.0, error_rate=0.0, miss_rate=0.0,
+                 results_per_language=3, subtitle_lines=500,
+                 token_lifetime=15 * 60, missing=(), tags=(), imdb_ids=(),
+                 seed=0):
+        super().__init__()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.miss_rate = miss_rate
+        self.results_per_language = results_per_language
+        self.subtitle_lines = subtitle_lines
+        self.token_lifetime = token_lifetime
+        self.missing = set(missing)
+        self.tags = set(tags)
+        self.imdb_ids = set(imdb_ids)
+        self.calls = collections.Counter()
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._subtitles = {}
+        self._throttled = []
+        self._failed_searches = []
+
+        self._server = _Server(('127.0.0.1', port), _Handler,
+                               allow_none=True, logRequests=False)
+        self._server.fake = self
+        for name in ('LogIn', 'LogOut', 'NoOperation', 'SearchSubtitles',
+                     'GetSubLanguages'):
+            self._server.register_function(getattr(self, name), name)
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}/xml-rpc'.format(self.port)
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def delay_or_fail(self, handler):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self._throttled:
+                status = self._throttled.pop()
+            elif self._random.random() < self.error_rate:
+                status = 503
+            else:
+                return True
+            self.calls[str(status)] += 1
+        handler.send_response(status)
+        handler.send_header('Content-Length', '0')
+        handler.end_headers()
+        return False
+
+    def throttle(self, count, status=429):
+        """Fails the next ``count`` requests with ``status``."""
+        with self._lock:
+            self._throttled.extend([status] * count)
+
+    def fail_searches(self, count, status='503 Service Unavailable'):
+        """Answers the next ``count`` searches with ``status`` in the
+        XML-RPC response, rather than with an HTTP error."""
+        with self._lock:
+            self._failed_searches.extend([status] * count)
+
+    def expire_tokens(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def _valid(self, token):
+        with self._lock:
+            expires = self._tokens.get(token)
+        return expires is not None and expires > time.time()
+
+    def LogIn(self, username, password, language, useragent):
+        self._count('LogIn')
+        with self._lock:
+            token = 'token{}'.format(self.calls['LogIn'])
+            self._tokens[token] = time.time() + self.token_lifetime
+        return dict(status=OK, token=token, seconds=0.001)
+
+    def LogOut(self, token):
+        self._count('LogOut')
+        with self._lock:
+            self._tokens.pop(token, None)
+        return dict(status=OK, seconds=0.001)
+
+    def NoOperation(self, token):
+        self._count('NoOperation')
+        if not self._valid(token):
+            return dict(status=UNAUTHORIZED, seconds=0.001)
+        with self._lock:
+            self._tokens[token] = time.time() + self.token_lifetime
+        return dict(status=OK, seconds=0.001)
+
+    def GetSubLanguages(self, language='en'):
+        self._count('GetSubLanguages')
+        data = [dict(SubLanguageID=id, ISO639=code, LanguageName=name)
+                for id, code, name in LANGUAGES]
+        return dict(status=OK, data=data, seconds=0.001)
+
+    def SearchSubtitles(self, token, queries, options=None):
+        self._count('SearchSubtitles')
+        if not self._valid(token):
+            return dict(status=UNAUTHORIZED, seconds=0.001)
+        with self._lock:
+            if self._failed_searches:
+                return dict(status=self._failed_searches.pop(),
+                            seconds=0.001)
+        data = []
+        for number, query in enumerate(queries):
+            data.extend(self._search(number, query))
+        return dict(status=OK, data=data or False, seconds=0.001)
+
+    def _has_subtitles(self, hash):
+        if hash in self.missing:
+            return False
+        return random.Random(hash).random() >= self.miss_rate
+
+    def _search(self, number, query):
+        if 'moviehash' in query:
+            hash, matchedBy = query['moviehash'], 'moviehash'
+            if not self._has_subtitles(hash):
+                return []
+        elif query.get('tag') in self.tags:
+            hash = '{:016x}'.format(zlib.crc32(query['tag'].encode()))
+            matchedBy = 'tag'
+        elif query.get('imdbid') in self.imdb_ids:
+            hash = '{:016x}'.format(int(query['imdbid']))
+            matchedBy = 'imdbid'
+        else:
+            return []
+        languages = query.get('sublanguageid', 'all').split(',')
+        if 'all' in languages:
+            languages = list(_LANGUAGE_CODES)
+        results = []
+        rnd = random.Random(hash)
+        for language in languages:
+            for i in range(self.results_per_language):
+                results.append(self._make_result(number, query, hash,
+                                                 matchedBy, language, rnd))
+        return results
+
+    def _make_result(self, number, query, hash, matchedBy, language, rnd):
+        with self._lock:
+            subId = len(self._subtitles) + 1
+            self._subtitles[subId] = language
+        return {
+            'QueryNumber': str(number),
+            'MatchedBy': matchedBy,
+            'MovieHash': hash,
+            'MovieByteSize': str(query.get('moviebytesize', '0')),
+            'MovieName': 'Movie {}'.format(hash),
+            'MovieReleaseName': 'Movie.{}.720p'.format(hash),
+            'IDMovieImdb': str(int(hash[:6], 16)),
+            'MovieFPS': rnd.choice(['23.976', '25.000', '0']),
+            'IDSubtitleFile': str(subId),
+            'SubFileName': 'Movie.{}.{}.srt'.format(hash, language),
+            'SubSize': str(self.subtitle_lines * 40),
+            'SubHash': '{:032x}'.format(subId),
+            'SubBad': rnd.choice(['0', '0', '0', '1']),
+            'SubRating': '{:.1f}'.format(rnd.uniform(0, 10)),
+            'SubDownloadsCnt': str(rnd.randint(0, 100000)),
+            'SubFeatured': rnd.choice(['0', '1']),
+            'SubEncoding': rnd.choice(['UTF-8', 'CP1252', 'CP1251']),
+            'SubFormat': 'srt',
+            'SubLanguageID': language,
+            'ISO639': _LANGUAGE_CODES.get(language, language[:2]),
+            'LanguageName': language,
+            'SubDownloadLink': 'http://127.0.0.1:{}/download/{}.gz'.format(
+                self.port, subId),
+            'Score': rnd.uniform(0, 20),
+        }
+
+    def subtitle(self, subId):
+        lines = []
+        for i in range(self.subtitle_lines):
+            lines.append('{}\n00:00:{:02},000 --> 00:00:{:02},500\n'
+                         'Subtitle {} line {}\n'.format(
+                             i + 1, i % 60, i % 60, subId, i))
+        return '\n'.join(lines).encode('utf-8')
+
+
+class FakeServerTestCase(unittest.TestCase):
+    """Starts a fake server for every test, and an ``OpenSubService``
+    that talks to it."""
+
+    server_options = {}
+
+    def setUp(self):
+        self.server = FakeOpenSubServer(**self.server_options).start()
+        self.subService = OpenSubService(server_url=self.server.url)
+
+    def tearDown(self):
+        self.server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve a fake OpenSubtitles XML-RPC API.")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--miss-rate', type=float, default=0.0)
+    parser.add_argument('--results-per-language', type=int, default=3)
+    parser.add_argument('--subtitle-lines', type=int, default=500)
+    args = parser.parse_args()
+
+    server = FakeOpenSubServer(port=args.port, latency=args.latency,
+                               error_rate=args.error_rate,
+                               miss_rate=args.miss_rate,
+                               results_per_language=args.results_per_language,
+                               subtitle_lines=args.subtitle_lines)
+    print("Serving on {}".format(server.url), flush=True)
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
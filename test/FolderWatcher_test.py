@@ -0,0 +1,141 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import tempfile
+import threading
+import unittest
+
+from .context import service
+from .FakeClock import FakeClock
+from service.FolderWatcher import FolderWatcher
+
+
+class FolderWatcherTests(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.root = self._dir.name
+        self.clock = FakeClock()
+        self._write('old.mkv')
+        self.watcher = FolderWatcher([self.root], languages=['eng'],
+                                     settle=2, debounce=0.5,
+                                     clock=self.clock)
+        self.watcher.check()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _write(self, name, data=b'x' * 1024):
+        filePath = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(filePath), exist_ok=True)
+        with open(filePath, 'ab') as f:
+            f.write(data)
+        # Directory modification times may be coarse
+        st = os.stat(os.path.dirname(filePath))
+        os.utime(os.path.dirname(filePath),
+                 ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        return filePath
+
+    def _check(self, seconds=0):
+        self.clock.now += seconds
+        return self.watcher.check()
+
+    def test_settle(self):
+        filePath = self._write('new.mkv')
+        self.assertEqual(self._check(), [])
+        # Listed after the debounce delay
+        self.assertEqual(self._check(1), [])
+        self._write('new.mkv')
+        # Still growing
+        self.assertEqual(self._check(2), [])
+        self.assertEqual(self._check(1), [])
+        self.assertEqual(self._check(1), [filePath])
+        self.assertEqual(self._check(5), [])
+
+    def test_existing_and_skipped(self):
+        self._write('notes.txt')
+        self._write('other.avi')
+        self._write('other.eng.srt')
+        self.assertEqual(self._check(1), [])
+        self.assertEqual(self._check(3), [])
+
+    def test_debounce(self):
+        first = self._write('a.mkv')
+        self._check()
+        self.clock.now += 0.3
+        second = self._write('b.mkv')
+        # Changed again within the debounce delay
+        self.watcher.poll = False
+        self.watcher.notify(self.root)
+        self.assertEqual(self._check(0.3), [])
+        self.assertEqual(self._check(0.5), [])
+        self.assertEqual(self._check(2), [first, second])
+
+    def test_new_directory(self):
+        self._check()
+        filePath = self._write(os.path.join('season', 'ep1.mkv'))
+        self._check()
+        self._check(1)
+        self.assertIn(os.path.dirname(filePath), self.watcher.directories)
+        self.assertEqual(self._check(2), [filePath])
+
+    def test_removed(self):
+        filePath = self._write(os.path.join('season', 'ep1.mkv'))
+        self._check(1)
+        os.remove(filePath)
+        os.rmdir(os.path.dirname(filePath))
+        st = os.stat(self.root)
+        os.utime(self.root, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self._check(1)
+        self.assertEqual(self._check(1), [])
+        self.assertEqual(self.watcher.directories, [self.root])
+
+    def test_notify(self):
+        self.watcher.poll = False
+        filePath = self._write('new.mkv')
+        self.assertEqual(self._check(1), [])
+        self.assertEqual(self._check(5), [])
+        self.watcher.notify(self.root)
+        self.assertEqual(self._check(1), [])
+        self.assertEqual(self._check(2), [filePath])
+
+    def test_thread(self):
+        arrived = threading.Event()
+        files = []
+
+        def onFiles(ready):
+            files.extend(ready)
+            arrived.set()
+
+        watcher = FolderWatcher([self.root], on_files=onFiles, settle=0.1,
+                                interval=0.05, debounce=0)
+        watcher.start()
+        try:
+            # Let the first round list the directory
+            while not watcher.directories:
+                arrived.wait(0.01)
+            filePath = self._write('new.mkv')
+            self.assertTrue(arrived.wait(10))
+        finally:
+            watcher.stop()
+        self.assertEqual(files, [filePath])
+
+
+if __name__ == '__main__':
+    unittest.main()
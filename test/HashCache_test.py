@@ -0,0 +1,68 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+
+from .context import service
+from service.HashCache import HashCache
+
+
+class HashCacheTests(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._cache = HashCache.in_directory(self._dir.name)
+        self._movie = os.path.join(self._dir.name, 'movie.avi')
+        with open(self._movie, 'wb') as f:
+            f.write(b'\0' * 1024)
+
+    def tearDown(self):
+        self._cache.close()
+        self._dir.cleanup()
+
+    def test_hit(self):
+        self.assertIsNone(self._cache.get(self._movie))
+        self._cache.put(self._movie, '0123456789abcdef')
+        self.assertEqual(self._cache.get(self._movie), '0123456789abcdef')
+        self.assertEqual((self._cache.hits, self._cache.misses), (1, 1))
+
+    def test_stale_after_modification(self):
+        self._cache.put(self._movie, '0123456789abcdef')
+        st = os.stat(self._movie)
+        os.utime(self._movie, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertIsNone(self._cache.get(self._movie))
+
+    def test_invalidate(self):
+        self._cache.put(self._movie, '0123456789abcdef')
+        self._cache.invalidate(self._movie)
+        self.assertIsNone(self._cache.get(self._movie))
+        self._cache.put(self._movie, '0123456789abcdef')
+        self._cache.invalidate()
+        self.assertEqual(len(self._cache), 0)
+
+    def test_eviction(self):
+        self._cache.close()
+        self._cache = HashCache(os.path.join(self._dir.name, 'small.sqlite'),
+                                max_entries=2)
+        st = os.stat(self._movie)
+        for i in range(3):
+            self._cache.put('/movie{}'.format(i), str(i), st)
+        self._cache._evict()
+        self.assertEqual(len(self._cache), 2)
+        self.assertIsNone(self._cache.get('/movie0', st))
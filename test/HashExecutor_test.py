@@ -0,0 +1,98 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import collections
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from .context import service
+from service.HashExecutor import HashExecutor, device_of
+
+
+class HashExecutorTests(unittest.TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.running = collections.Counter()
+        self.peak = collections.Counter()
+
+    def _device(self, filePath):
+        # 'a/1' is on device 'a'
+        return filePath.split('/')[0]
+
+    def _read(self, filePath):
+        device = self._device(filePath)
+        with self.lock:
+            self.running[device] += 1
+            self.peak[device] = max(self.peak[device], self.running[device])
+        time.sleep(0.02)
+        with self.lock:
+            self.running[device] -= 1
+        return filePath
+
+    def test_per_device(self):
+        files = ['{}/{}'.format(d, i) for d in 'abc' for i in range(6)]
+        with HashExecutor(per_device=2, max_workers=8,
+                          device=self._device) as executor:
+            futures = [executor.submit(f, self._read, f) for f in files]
+            results = [future.result(5) for future in futures]
+        self.assertEqual(results, files)
+        self.assertEqual(self.peak, {'a': 2, 'b': 2, 'c': 2})
+
+    def test_priority(self):
+        order = []
+        gate = threading.Event()
+        with HashExecutor(per_device=1, max_workers=2,
+                          device=self._device) as executor:
+            executor.submit('a/0', gate.wait)
+            for name, priority in [('low', 0), ('high', 10), ('low2', 0)]:
+                executor.submit('a/' + name, order.append, name,
+                                priority=priority)
+            # Let all of them reach the queue of the device
+            time.sleep(0.1)
+            gate.set()
+        self.assertEqual(order, ['high', 'low', 'low2'])
+
+    def test_cancel(self):
+        gate = threading.Event()
+        with HashExecutor(per_device=1, max_workers=2,
+                          device=self._device) as executor:
+            executor.submit('a/0', gate.wait)
+            future = executor.submit('a/1', self._read, 'a/1')
+            time.sleep(0.1)
+            self.assertTrue(future.cancel())
+            gate.set()
+        self.assertEqual(self.peak, {})
+
+    def test_error(self):
+        with HashExecutor() as executor:
+            future = executor.submit('missing', os.stat, 'missing')
+            with self.assertRaises(FileNotFoundError):
+                future.result(5)
+
+    def test_device_of(self):
+        with tempfile.NamedTemporaryFile() as f:
+            self.assertEqual(device_of(f.name), os.stat(f.name).st_dev)
+        self.assertIsNone(device_of('/nonexistent/file'))
+
+
+if __name__ == '__main__':
+    unittest.main()
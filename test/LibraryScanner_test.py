@@ -0,0 +1,63 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import unittest
+
+from .context import service
+from service.LibraryScanner import LibraryScanner
+
+
+class LibraryScannerTests(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        for name in ['a/Movie.mkv', 'a/Movie.eng.srt', 'a/b/Episode.avi',
+                     'a/b/Episode.fre.sub', 'a/b/c/notes.txt',
+                     'a/b/c/Clip.MP4', '.hidden/Secret.mkv']:
+            filePath = os.path.join(self._dir.name, name)
+            os.makedirs(os.path.dirname(filePath), exist_ok=True)
+            open(filePath, 'wb').close()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _scan(self, languages, paths=None):
+        scanner = LibraryScanner(languages=languages, jobs=2)
+        found = scanner.scan(paths or [self._dir.name])
+        return sorted(os.path.relpath(f, self._dir.name) for f in found)
+
+    def test_videos(self):
+        self.assertEqual(self._scan(None), [
+            'a/Movie.mkv', 'a/b/Episode.avi', 'a/b/c/Clip.MP4'])
+
+    def test_skips_subtitled(self):
+        self.assertEqual(self._scan(['eng']), [
+            'a/b/Episode.avi', 'a/b/c/Clip.MP4'])
+        self.assertEqual(self._scan(['eng', 'fre']), [
+            'a/Movie.mkv', 'a/b/Episode.avi', 'a/b/c/Clip.MP4'])
+
+    def test_files_are_passed_through(self):
+        notes = os.path.join(self._dir.name, 'a/b/c/notes.txt')
+        self.assertEqual(self._scan(['eng'], [notes]), ['a/b/c/notes.txt'])
+
+    def test_early_stop(self):
+        scanner = LibraryScanner(jobs=2)
+        found = scanner.scan([self._dir.name])
+        next(found)
+        found.close()
@@ -0,0 +1,75 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import random
+import tempfile
+import unittest
+
+from .context import service
+from service.MovieHash import movie_hash, CHUNK_SIZE, MIN_SIZE
+from pythonopensubtitles.utils import File
+
+
+class MovieHashTests(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _makeFile(self, data, size=None):
+        filePath = os.path.join(self._dir.name, 'movie{}.avi'.format(
+            len(os.listdir(self._dir.name))))
+        with open(filePath, 'wb') as f:
+            f.write(data)
+            if size is not None:
+                f.truncate(size)
+        return filePath
+
+    def test_zeros(self):
+        # Only the size term contributes
+        filePath = self._makeFile(b'\0' * MIN_SIZE)
+        self.assertEqual(movie_hash(filePath), '0000000000020000')
+
+    def test_overflow(self):
+        # 16384 words of 2**64 - 1 wrap around to -16384
+        filePath = self._makeFile(b'\xff' * MIN_SIZE)
+        self.assertEqual(movie_hash(filePath), '000000000001c000')
+
+    def test_little_endian(self):
+        filePath = self._makeFile(b'\x01' + b'\0' * (MIN_SIZE - 1))
+        self.assertEqual(movie_hash(filePath), '0000000000020001')
+
+    def test_too_small(self):
+        filePath = self._makeFile(b'\0' * (MIN_SIZE - 1))
+        with self.assertRaises(ValueError):
+            movie_hash(filePath)
+
+    def test_matches_library(self):
+        rnd = random.Random(42)
+        sizes = [MIN_SIZE, MIN_SIZE + 1, MIN_SIZE + CHUNK_SIZE // 2,
+                 3 * CHUNK_SIZE + 7, 10 * 1024 * 1024 + 13]
+        for size in sizes:
+            head = bytes(rnd.getrandbits(8) for _ in range(MIN_SIZE))
+            filePath = self._makeFile(head, size)
+            with open(filePath, 'r+b') as f:
+                f.seek(size - CHUNK_SIZE)
+                f.write(bytes(rnd.getrandbits(8) for _ in range(CHUNK_SIZE)))
+            self.assertEqual(movie_hash(filePath), File(filePath).get_hash(),
+                             "size={}".format(size))
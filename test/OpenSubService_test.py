@@ -16,13 +16,49 @@
 # You should have received a copy of the GNU General Public License
 # along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
 
+import os
+import tempfile
+import threading
 import unittest
 
 from .context import service
+from .FakeOpenSubServer import FakeServerTestCase
+from service.DownloadService import DownloadService
+from service.OpenSubService import (
+    SEARCH_DONE, SEARCH_REFUSED, SEARCH_THROTTLED, LoginError,
+    NoSubtitlesFound, SearchError, SearchPlan, imdb_id, search_outcome
+)
+from service.SubtitleCandidate import Language
+from service.ResultCache import ResultCache
 
 
 TEST_HASH = '92099e543d2a0841'
 
+
+class FakeClient(object):
+    """Answers SearchSubtitles with one subtitle per query."""
+
+    def __init__(self):
+        self.calls = []
+        self.token = None
+        self.data = {}
+
+    def login(self, username, password):
+        self.data = dict(status='200 OK')
+        return 'token'
+
+    def search_subtitles(self, queries):
+        self.calls.append(queries)
+        self.data = dict(status='200 OK')
+        return [dict(QueryNumber=str(i), MovieHash=q['moviehash'],
+                     Score=1.0, SubSize='100', SubHash='', SubBad='0',
+                     SubRating='0.0', SubDownloadsCnt='1', MovieFPS='0',
+                     SubFeatured='0', SubEncoding='UTF-8',
+                     SubDownloadLink=q['moviehash'], SubLanguageID='eng',
+                     SubFormat='srt', ISO639='en')
+                for i, q in enumerate(queries)]
+
+
 class OpenSubServiceTests(unittest.TestCase):
     def setUp(self):
         pass
@@ -30,6 +66,181 @@ class OpenSubServiceTests(unittest.TestCase):
     def test_calculate_hash(self):
         pass
 
-    def test_download_by_hash(self):
+    def test_find_by_hashes(self):
+        svc = service.OpenSubService()
+        svc._ost = FakeClient()
+        hashes = ['{:016x}'.format(i) for i in range(45)]
+        result = svc.find_by_hashes(hashes, chunk_size=20)
+        self.assertEqual([len(c) for c in svc._ost.calls], [20, 20, 5])
+        self.assertEqual(list(result), hashes)
+        for hash, subtitles in result.items():
+            self.assertEqual([s.download_link for s in subtitles], [hash])
+
+    def test_language_ids(self):
+        svc = service.OpenSubService()
+        self.assertEqual(svc.language_ids(['bg', 'eng']), ['eng'])
+
+        languagesFile = os.path.join(os.path.dirname(__file__), '..',
+                                     'resources', 'languages.json')
+        svc = service.OpenSubService(result_cache=ResultCache(),
+                                     languages_file=languagesFile)
+        self.assertEqual(svc.language_ids(['bg', 'eng', 'xx']),
+                         ['bul', 'eng'])
+        svc._result_cache.put('languages', [
+            dict(code='bg', name='Bulgarian', id='bul'),
+            dict(code='en', name='English', id='eng')], 60)
+        self.assertEqual(svc.language_ids(['en', 'bg', 'bul', 'xx']),
+                         ['eng', 'bul'])
+        self.assertEqual(svc.language_ids([]), ['eng'])
+
+    def test_find_by_hashes_cached(self):
+        svc = service.OpenSubService(result_cache=ResultCache())
+        svc._ost = FakeClient()
+        first = svc.find_by_hashes([TEST_HASH])
+        second = svc.find_by_hashes([TEST_HASH, '0123456789abcdef'])
+        self.assertEqual([len(c) for c in svc._ost.calls], [1, 1])
+        self.assertEqual(svc._result_cache.hits, 1)
+        self.assertEqual(second[TEST_HASH], first[TEST_HASH])
+
+    def test_plan_search(self):
+        svc = service.OpenSubService(result_cache=ResultCache())
+        svc._ost = FakeClient()
+        svc.find_by_hashes([TEST_HASH])
+        hashes = ['{:016x}'.format(i) for i in range(25)]
+        plan = svc.plan_search([TEST_HASH] + hashes, chunk_size=20)
+        self.assertEqual(list(plan.cached), [TEST_HASH])
+        self.assertEqual([len(c) for c in plan.chunks], [20, 5])
+        chunk = plan.chunks[1]
+        data = svc._ost.search_subtitles(SearchPlan.queries(chunk))
+        self.assertEqual([hash for hash, _ in plan.results(chunk, data)],
+                         hashes[20:])
+        # The results are cached
+        plan = svc.plan_search(hashes[20:])
+        self.assertEqual((len(plan.cached), plan.chunks), (5, []))
+
+    def test_search_outcome(self):
+        self.assertEqual(search_outcome('200 OK', False, 0), SEARCH_DONE)
+        self.assertEqual(search_outcome('429 Too many', True, 0),
+                         SEARCH_THROTTLED)
+        self.assertEqual(search_outcome('401 Unauthorized', True, 0),
+                         SEARCH_REFUSED)
+        with self.assertRaises(LoginError):
+            search_outcome('401 Unauthorized', True, 1)
+        for status in ('503 Service Unavailable', '500 Error', ''):
+            with self.assertRaises(SearchError):
+                search_outcome(status, False, 0)
+
+    def test_iter_by_hashes(self):
         svc = service.OpenSubService()
-        svc.download_by_hash(TEST_HASH, lambda x: print(str(x)))
+        svc._ost = FakeClient()
+        hashes = ['{:016x}'.format(i) for i in range(45)]
+        results = svc.iter_by_hashes(hashes, chunk_size=20)
+        for i, (hash, subtitles) in enumerate(results):
+            if i == 19:
+                break
+        self.assertEqual([len(c) for c in svc._ost.calls], [20])
+
+
+class OpenSubServiceServerTests(FakeServerTestCase):
+    server_options = dict(missing=['0000000000000000', '0000000000000001',
+                                   '0000000000000002'],
+                          tags=['Movie.2019.720p.mkv'],
+                          imdb_ids=['1234567'])
+
+    def test_find_and_download(self):
+        self.assertTrue(self.subService.login())
+        subtitles = self.subService.find_by_hash(TEST_HASH)
+        self.assertEqual(len(subtitles), 3)
+        self.assertEqual({s.language_id for s in subtitles}, {'eng'})
+
+        downloadService = DownloadService()
+        with tempfile.TemporaryDirectory() as directory:
+            moviePath = os.path.join(directory, 'movie.mkv')
+            subtitlePath = downloadService.download_subtitle(subtitles[0],
+                                                             moviePath)
+            self.assertEqual(subtitlePath,
+                             os.path.join(directory, 'movie.eng.srt'))
+            with open(subtitlePath) as f:
+                self.assertTrue(f.read().startswith('1\n00:00:00,000'))
+        downloadService.close()
+
+    def test_find_by_hash_missing(self):
+        self.subService.login()
+        with self.assertRaises(NoSubtitlesFound):
+            self.subService.find_by_hash('0000000000000000')
+
+    def test_find_by_hashes_fallback(self):
+        self.subService.login()
+        paths = {
+            '0000000000000000': '/movies/Movie.2019.720p.mkv',
+            '0000000000000001': '/movies/Movie (tt1234567)/movie.mkv',
+            '0000000000000002': '/movies/Unknown.mkv',
+            TEST_HASH: '/movies/Movie.2019.720p.mkv',
+        }
+        result = self.subService.find_by_hashes(list(paths), paths=paths)
+        self.assertEqual(self.server.calls['SearchSubtitles'], 1)
+        self.assertEqual(
+            {hash: {s.matched_by for s in subtitles}
+             for hash, subtitles in result.items()},
+            {'0000000000000000': {'tag'},
+             '0000000000000001': {'imdbid'},
+             '0000000000000002': set(),
+             TEST_HASH: {'moviehash'}})
+        with self.assertRaises(NoSubtitlesFound):
+            self.subService.find_by_hash('0000000000000002')
+
+    def test_imdb_id(self):
+        self.assertEqual(imdb_id('/a/Movie.tt0111161.720p.mkv'), '0111161')
+        self.assertEqual(imdb_id('/a/Movie [tt12345678]/movie.mkv'),
+                         '12345678')
+        self.assertIsNone(imdb_id('/a/Matt1234567.mkv'))
+
+    def test_find_by_hashes_languages(self):
+        self.subService.login()
+        hashes = ['{:016x}'.format(i + 100) for i in range(25)]
+        result = self.subService.find_by_hashes(hashes,
+                                                languages=['eng', 'bul'])
+        self.assertEqual(self.server.calls['SearchSubtitles'], 2)
+        for subtitles in result.values():
+            self.assertEqual(len(subtitles), 6)
+
+    def test_session_expired(self):
+        self.subService.find_by_hash(TEST_HASH)
+        self.server.expire_tokens()
+        subtitles = self.subService.find_by_hash('{:016x}'.format(200))
+        self.assertEqual(len(subtitles), 3)
+        self.assertEqual(self.server.calls['LogIn'], 2)
+
+    def test_session_shared(self):
+        threads = [threading.Thread(
+            target=self.subService.find_by_hash,
+            args=('{:016x}'.format(300 + i),)) for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.server.calls['LogIn'], 1)
+        self.assertEqual(self.server.calls['SearchSubtitles'], 6)
+
+    def test_search_failed(self):
+        subService = service.OpenSubService(server_url=self.server.url,
+                                            result_cache=ResultCache())
+        self.server.fail_searches(1)
+        with self.assertRaises(SearchError):
+            subService.find_by_hash(TEST_HASH)
+        # The failure is not remembered as a movie without subtitles
+        self.assertEqual(len(subService.find_by_hash(TEST_HASH)), 3)
+
+    def test_recheck_miss(self):
+        subService = service.OpenSubService(server_url=self.server.url,
+                                            result_cache=ResultCache())
+        hash = '0000000000000000'
+        subService.find_by_hashes([hash])
+        subService.find_by_hashes([hash])
+        self.assertEqual(self.server.calls['SearchSubtitles'], 1)
+        subService.find_by_hashes([hash], recheck={hash})
+        self.assertEqual(self.server.calls['SearchSubtitles'], 2)
+
+    def test_get_languages(self):
+        languages = self.subService.get_languages()
+        self.assertIn(Language('en', 'English', 'eng'), languages)
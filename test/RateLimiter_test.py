@@ -0,0 +1,228 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import threading
+import unittest
+from xmlrpc.client import ProtocolError
+
+from .context import service
+from .FakeClock import FakeClock
+from .FakeOpenSubServer import FakeServerTestCase
+from service.OpenSubService import OpenSubService
+from service.RateLimiter import (
+    AdaptiveConcurrency, RateLimiter, TokenBucket, DOWNLOAD, SEARCH,
+    throttle_status
+)
+
+
+class TokenBucketTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(2, 3, self.clock, self.clock.sleep)
+
+    def test_burst(self):
+        waits = [self.bucket.acquire() for i in range(5)]
+        self.assertEqual(waits, [0, 0, 0, 0.5, 0.5])
+
+    def test_refill(self):
+        for i in range(3):
+            self.bucket.acquire()
+        self.clock.now += 10
+        waits = [self.bucket.acquire() for i in range(4)]
+        self.assertEqual(waits, [0, 0, 0, 0.5])
+
+    def test_pause(self):
+        self.bucket.pause(2)
+        self.assertEqual(self.bucket.acquire(), 2.5)
+
+
+class AdaptiveConcurrencyTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.concurrency = AdaptiveConcurrency(8, initial=4,
+                                               target_latency=1.0,
+                                               clock=self.clock)
+
+    def test_increase(self):
+        for i in range(4):
+            self.concurrency.acquire()
+            self.concurrency.release(0.1)
+        self.assertAlmostEqual(self.concurrency.limit, 4.9, places=1)
+        for i in range(100):
+            self.concurrency.acquire()
+            self.concurrency.release(0.1)
+        self.assertEqual(self.concurrency.limit, 8)
+
+    def test_slow(self):
+        self.concurrency.acquire()
+        self.concurrency.release(5.0)
+        self.assertEqual(self.concurrency.limit, 4)
+
+    def test_decrease(self):
+        for i in range(3):
+            self.concurrency.acquire()
+        for i in range(3):
+            self.concurrency.release(0.1, throttled=True)
+        # The same overload only counts once
+        self.assertEqual(self.concurrency.limit, 2)
+        self.clock.now += 1
+        self.concurrency.acquire()
+        self.concurrency.release(0.1, throttled=True)
+        self.assertEqual(self.concurrency.limit, 1)
+        self.clock.now += 1
+        self.concurrency.acquire()
+        self.concurrency.release(0.1, throttled=True)
+        self.assertEqual(self.concurrency.limit, 1)
+
+    def test_limit(self):
+        concurrency = AdaptiveConcurrency(2)
+        concurrency.acquire()
+        concurrency.acquire()
+        acquired = threading.Event()
+
+        def acquire():
+            concurrency.acquire()
+            acquired.set()
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+        self.assertEqual(concurrency.waiting, 1)
+        concurrency.release(0.1)
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+        self.assertEqual(concurrency.in_flight, 2)
+
+    def test_limit_async(self):
+        concurrency = AdaptiveConcurrency(2)
+        order = []
+
+        async def call(name):
+            await concurrency.acquire_async()
+            order.append(name)
+            await asyncio.sleep(0.01)
+            concurrency.release(0.01)
+
+        async def main():
+            await asyncio.gather(*[call(i) for i in range(5)])
+
+        asyncio.run(main())
+        self.assertEqual(sorted(order), list(range(5)))
+        self.assertEqual((concurrency.in_flight, concurrency.waiting),
+                         (0, 0))
+
+
+class RateLimiterTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(search_rate=1, search_burst=1,
+                                   download_rate=10, download_burst=10,
+                                   clock=self.clock, sleep=self.clock.sleep)
+
+    def test_separate_budgets(self):
+        for i in range(3):
+            with self.limiter.slot(DOWNLOAD):
+                pass
+        with self.limiter.slot(SEARCH):
+            pass
+        self.assertEqual(self.clock.sleeps, [])
+        with self.limiter.slot(SEARCH):
+            pass
+        self.assertEqual(self.clock.sleeps, [1])
+
+    def test_throttled(self):
+        with self.assertRaises(ProtocolError):
+            with self.limiter.slot(SEARCH):
+                raise ProtocolError('url', 429, 'Too Many Requests', {})
+        metrics = self.limiter.metrics()[SEARCH]
+        self.assertEqual((metrics['calls'], metrics['throttled']), (1, 1))
+        self.assertEqual(metrics['limit'], 1)
+        with self.limiter.slot(SEARCH):
+            pass
+        self.assertEqual(self.clock.sleeps, [3])
+
+    def test_mark_throttled(self):
+        with self.limiter.slot(DOWNLOAD) as slot:
+            slot.throttled()
+        self.assertEqual(self.limiter.metrics()[DOWNLOAD]['throttled'], 1)
+
+    def test_metrics(self):
+        for i in range(5):
+            with self.limiter.slot(DOWNLOAD):
+                self.clock.now += 1
+        metrics = self.limiter.metrics()[DOWNLOAD]
+        self.assertEqual(metrics['calls'], 5)
+        self.assertEqual(metrics['current_rate'], 0.5)
+        self.assertEqual((metrics['in_flight'], metrics['waiting']), (0, 0))
+        self.clock.now += 20
+        self.assertEqual(self.limiter.metrics()[DOWNLOAD]['current_rate'], 0)
+
+    def test_async_slot(self):
+        async def main():
+            for i in range(3):
+                async with self.limiter.async_slot(DOWNLOAD):
+                    pass
+            with self.assertRaises(ProtocolError):
+                async with self.limiter.async_slot(SEARCH):
+                    raise ProtocolError('url', 429, 'Too Many Requests', {})
+
+        asyncio.run(main())
+        metrics = self.limiter.metrics()
+        self.assertEqual(metrics[DOWNLOAD]['calls'], 3)
+        self.assertEqual(metrics[SEARCH]['throttled'], 1)
+
+    def test_throttle_status(self):
+        self.assertEqual(
+            throttle_status(ProtocolError('url', 503, 'Busy', {})), 503)
+        self.assertIsNone(
+            throttle_status(ProtocolError('url', 500, 'Error', {})))
+        self.assertIsNone(throttle_status(ValueError()))
+
+
+class RateLimiterServerTests(FakeServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.limiter = RateLimiter(search_rate=100, throttle_pause=0.01)
+        self.subService = OpenSubService(server_url=self.server.url,
+                                         rate_limiter=self.limiter)
+
+    def test_retry_throttled(self):
+        self.subService.login()
+        self.server.throttle(2)
+        subtitles = self.subService.find_by_hash('{:016x}'.format(100))
+        self.assertEqual(len(subtitles), 3)
+        self.assertEqual(self.server.calls['429'], 2)
+        self.assertEqual(self.limiter.metrics()[SEARCH]['throttled'], 2)
+
+    def test_give_up(self):
+        self.subService.login()
+        self.server.throttle(OpenSubService.THROTTLE_RETRIES + 1, 503)
+        with self.assertRaises(ProtocolError):
+            self.subService.find_by_hash('{:016x}'.format(100))
+
+    def test_no_limiter(self):
+        subService = OpenSubService(server_url=self.server.url)
+        subService.login()
+        self.server.throttle(1)
+        with self.assertRaises(ProtocolError):
+            subService.find_by_hash('{:016x}'.format(100))
+
+
+if __name__ == '__main__':
+    unittest.main()
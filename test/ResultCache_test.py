@@ -0,0 +1,51 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import tempfile
+import unittest
+
+from .context import service
+from service.ResultCache import ResultCache
+
+
+class ResultCacheTests(unittest.TestCase):
+    def test_lru(self):
+        cache = ResultCache(max_entries=2)
+        cache.put('a', 1, 60)
+        cache.put('b', 2, 60)
+        cache.get('a')
+        cache.put('c', 3, 60)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_expiry(self):
+        cache = ResultCache()
+        cache.put('a', [], -1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = ResultCache.in_directory(directory)
+            cache.put('languages', [dict(code='en')], 60)
+            cache.close()
+            cache = ResultCache.in_directory(directory)
+            self.assertEqual(cache.get('languages'), [dict(code='en')])
+            cache.invalidate()
+            self.assertIsNone(cache.get('languages'))
+            cache.close()
@@ -0,0 +1,94 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import unittest
+
+from .context import service
+from service.SubtitleCandidate import SubtitleCandidate
+from service.SubtitleRanker import SubtitleRanker
+
+
+def subtitle(language='eng', n=0, bad='0', rating='0.0', downloads='0',
+             featured='0', fps='0', format='srt', score='0',
+             matched_by='moviehash'):
+    return SubtitleCandidate(str(n), '100', bad, rating, downloads, fps,
+                             featured, 'UTF-8', '', language, format, '',
+                             score, matched_by)
+
+
+class SubtitleRankerTests(unittest.TestCase):
+    def setUp(self):
+        self.ranker = SubtitleRanker()
+
+    def test_best_per_language(self):
+        subtitles = [subtitle('bul', bad=True, n=1),
+                     subtitle('eng', n=2),
+                     subtitle('bul', n=3),
+                     subtitle('eng', rating='9.0', n=4)]
+        best = self.ranker.best_per_language(subtitles,
+                                             ['bul', 'eng', 'fre'])
+        self.assertEqual([s.hash for s in best], ['3', '4'])
+
+    def test_video_fps(self):
+        subtitles = [subtitle(n=1, fps='25.000', matched_by='tag'),
+                     subtitle(n=2, fps='25.000', matched_by='tag'),
+                     subtitle(n=3, fps='23.976'),
+                     subtitle(n=4, fps='0'),
+                     subtitle('bul', n=5, fps='23.976')]
+        self.assertEqual(self.ranker.video_fps(subtitles), 23.976)
+        self.assertIsNone(self.ranker.video_fps(subtitles[:2]))
+        # The frame rate counts against a tag match of another release
+        best = self.ranker.best_per_language(
+            subtitles[:2] + [subtitle(n=6, fps='23.976', matched_by='tag')],
+            ['eng'], fps=23.976)
+        self.assertEqual([s.hash for s in best], ['6'])
+
+    def test_candidates_hashable(self):
+        # Equal candidates, e.g. read back from the cache, are one key
+        candidates = {subtitle(n=1), subtitle(n=2),
+                      SubtitleCandidate.from_row(subtitle(n=1).to_row())}
+        self.assertEqual(sorted(s.hash for s in candidates), ['1', '2'])
+
+    def test_rank(self):
+        subtitles = [subtitle(n=1, matched_by='tag', downloads='100000'),
+                     subtitle(n=2, fps='25.000'),
+                     subtitle(n=3, fps='23.976'),
+                     subtitle(n=4, format='sub', fps='23.976'),
+                     subtitle('bul', n=5, fps='23.976')]
+        ranked = self.ranker.rank(subtitles, fps=23.976,
+                                  languages=['eng', 'bul'])
+        self.assertEqual([s.hash for s in ranked], ['3', '4', '5', '1', '2'])
+        top = self.ranker.top(iter(subtitles), 2, fps=23.976,
+                              languages=['eng', 'bul'])
+        self.assertEqual(top, ranked[:2])
+
+    def test_weights(self):
+        ranker = SubtitleRanker(weights=dict(bad=0, rating=0))
+        ranked = ranker.rank([subtitle(rating='9.0', n=1),
+                              subtitle(bad=True, featured='1', n=2)])
+        self.assertEqual([s.hash for s in ranked], ['2', '1'])
+        with self.assertRaises(ValueError):
+            SubtitleRanker(weights=dict(colour=1))
+
+    def test_breakdown(self):
+        s = subtitle(bad=True, rating='5.0', featured='1')
+        breakdown = self.ranker.breakdown(s)
+        self.assertEqual(breakdown['bad'], SubtitleRanker.WEIGHTS['bad'])
+        self.assertEqual(breakdown['rating'],
+                         SubtitleRanker.WEIGHTS['rating'] / 2)
+        self.assertAlmostEqual(breakdown['total'], self.ranker.score(s))
@@ -0,0 +1,154 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+import time
+import unittest
+
+from .context import service
+from .FakeClock import FakeClock
+from service.TokenManager import TokenManager
+
+
+class TokenManagerTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.valid = set()
+        self.pings = []
+        self.manager = TokenManager(self._login, self._no_operation,
+                                    refresh_after=600, clock=self.clock)
+
+    def _login(self):
+        token = 'token{}'.format(self.manager.logins + 1)
+        self.valid.add(token)
+        return token
+
+    def _no_operation(self, token):
+        self.pings.append(token)
+        return token in self.valid
+
+    def test_reuse(self):
+        self.assertEqual(self.manager.token(), 'token1')
+        self.clock.now = 599
+        self.assertEqual(self.manager.token(), 'token1')
+        self.assertEqual((self.manager.logins, self.pings), (1, []))
+
+    def test_refresh(self):
+        self.manager.token()
+        self.clock.now = 600
+        self.assertEqual(self.manager.token(), 'token1')
+        self.assertEqual(self.pings, ['token1'])
+        # The refresh counts as activity
+        self.clock.now = 1100
+        self.manager.token()
+        self.assertEqual(self.pings, ['token1'])
+
+    def test_ready_token(self):
+        self.assertIsNone(self.manager.ready_token())
+        self.manager.token()
+        self.clock.now = 599
+        self.assertEqual(self.manager.ready_token(), 'token1')
+        # It counts as a use
+        self.clock.now = 1198
+        self.assertEqual(self.manager.ready_token(), 'token1')
+        self.clock.now = 1798
+        self.assertIsNone(self.manager.ready_token())
+        self.assertEqual((self.manager.logins, self.pings), (1, []))
+
+    def test_refresh_expired(self):
+        self.manager.token()
+        self.valid.clear()
+        self.clock.now = 600
+        self.assertEqual(self.manager.token(), 'token2')
+        self.assertEqual(self.manager.logins, 2)
+
+    def test_touch(self):
+        self.manager.token()
+        self.clock.now = 500
+        self.manager.touch('token1')
+        self.clock.now = 1000
+        self.manager.token()
+        self.assertEqual(self.pings, [])
+
+    def test_invalidate(self):
+        self.manager.token()
+        self.manager.invalidate('token1')
+        self.assertEqual(self.manager.token(), 'token2')
+        # A stale token does not drop the new one
+        self.manager.invalidate('token1')
+        self.assertEqual(self.manager.token(), 'token2')
+        self.assertEqual(self.manager.logins, 2)
+
+    def test_keep_alive(self):
+        self.manager.keep_alive()
+        self.assertEqual(self.pings, [])
+        self.manager.token()
+        self.clock.now = 600
+        self.manager.keep_alive()
+        self.assertEqual(self.pings, ['token1'])
+
+    def test_no_stampede(self):
+        def slowLogin():
+            time.sleep(0.05)
+            return self._login()
+
+        self.manager = TokenManager(slowLogin, self._no_operation)
+        tokens = []
+        threads = [threading.Thread(
+            target=lambda: tokens.append(self.manager.token()))
+            for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(tokens, ['token1'] * 8)
+        self.assertEqual(self.manager.logins, 1)
+
+    def test_start_stop(self):
+        self.manager.token()
+        self.clock.now = 600
+        self.manager.start(interval=0.01)
+        deadline = time.time() + 5
+        while not self.pings and time.time() < deadline:
+            time.sleep(0.01)
+        self.manager.stop()
+        self.assertEqual(self.pings[0], 'token1')
+
+    def test_stop_while_refreshing(self):
+        refreshing, release = threading.Event(), threading.Event()
+
+        def slowNoOperation(token):
+            refreshing.set()
+            release.wait(5)
+            return True
+
+        manager = TokenManager(self._login, slowNoOperation,
+                               refresh_after=600, clock=self.clock)
+        manager.token()
+        self.clock.now = 600
+        manager.start(interval=0.01)
+        self.assertTrue(refreshing.wait(5))
+        started = time.time()
+        manager.stop()
+        # Does not wait for the server
+        self.assertLess(time.time() - started, 1)
+        release.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
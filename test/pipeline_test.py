@@ -0,0 +1,182 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import threading
+import unittest
+
+from .context import service
+from .FakeOpenSubServer import FakeServerTestCase
+from service.AsyncOpenSubService import AsyncOpenSubService
+from service.DownloadService import DownloadService
+from service.EncodingService import EncodingService
+from service.ResultCache import ResultCache
+
+try:
+    from PyQt5.QtCore import QCoreApplication, QEventLoop, QTimer
+    from ui.pipeline import Pipeline
+    from ui.scheduler import Scheduler
+    HAVE_QT = True
+except ImportError:
+    HAVE_QT = False
+
+TIMEOUT = 20000  # ms
+
+
+@unittest.skipUnless(HAVE_QT, "PyQt5 is not installed")
+class PipelineTests(FakeServerTestCase):
+    server_options = dict(latency=0.02)
+
+    def setUp(self):
+        super().setUp()
+        self.app = QCoreApplication.instance() or QCoreApplication([])
+        self._dir = tempfile.TemporaryDirectory()
+        self.downloadService = DownloadService()
+        self.pipeline = self._pipeline()
+        self.finished, self.failed = [], []
+        self.pipeline.fileFinished.connect(self.finished.append)
+        self.pipeline.taskFailed.connect(
+            lambda filePath, e, task: self.failed.append(filePath))
+
+    def _pipeline(self):
+        return Pipeline(self.subService, self.downloadService,
+                        encodingService=EncodingService())
+
+    def tearDown(self):
+        self.pipeline.shutdown()
+        self.downloadService.close()
+        self._dir.cleanup()
+        super().tearDown()
+
+    def _files(self, count):
+        files = []
+        for i in range(count):
+            filePath = os.path.join(self._dir.name, 'movie{}.avi'.format(i))
+            with open(filePath, 'wb') as f:
+                f.write(os.urandom(256 * 1024))
+            files.append(filePath)
+        return files
+
+    def _run(self):
+        loop = QEventLoop()
+        self.pipeline.finished.connect(loop.quit)
+        QTimer.singleShot(TIMEOUT, loop.quit)
+        if not self.pipeline.isIdle():
+            loop.exec_()
+        self.assertTrue(self.pipeline.isIdle())
+
+    def test_files(self):
+        files = self._files(3)
+        self.pipeline.setLanguages(['eng', 'bul'])
+        self.pipeline.addFiles(files)
+        self._run()
+        self.assertEqual(sorted(self.finished), files)
+        self.assertEqual(self.failed, [])
+        for filePath in files:
+            base = os.path.splitext(filePath)[0]
+            self.assertTrue(os.path.exists(base + '.eng.srt'))
+            self.assertTrue(os.path.exists(base + '.bul.srt'))
+
+    def test_convert(self):
+        files = self._files(2)
+        self.pipeline.setEncoding('UTF-16')
+        self.pipeline.addFiles(files)
+        self._run()
+        self.assertEqual(sorted(self.finished), files)
+        with open(os.path.splitext(files[0])[0] + '.eng.srt', 'rb') as f:
+            self.assertTrue(f.read().decode('utf-16').startswith('1\n'))
+
+    def test_cancel(self):
+        files = self._files(4)
+        self.pipeline.addFiles(files)
+        self.pipeline.cancel(files[1:3])
+        self._run()
+        self.assertEqual(sorted(self.finished), [files[0], files[3]])
+        self.assertEqual(self.failed, [])
+        self.assertEqual(sorted(os.listdir(self._dir.name)),
+                         ['movie0.avi', 'movie0.eng.srt', 'movie1.avi',
+                          'movie2.avi', 'movie3.avi', 'movie3.eng.srt'])
+
+    def test_background_failed(self):
+        files = self._files(3)
+        self.server.fail_searches(10)
+        self.pipeline.addFiles(files, Scheduler.BACKGROUND)
+        self._run()
+        self.assertEqual(self.finished, [])
+        # Not reported one by one
+        self.assertEqual(self.failed, [])
+        self.assertEqual(self.pipeline.stats.failed, 3)
+
+    def test_retry_miss(self):
+        self.subService = service.OpenSubService(
+            server_url=self.server.url, result_cache=ResultCache())
+        self.pipeline.shutdown()
+        self.pipeline = self._pipeline()
+        self.pipeline.fileFinished.connect(self.finished.append)
+        tasks = []
+        self.pipeline.taskFailed.connect(
+            lambda filePath, e, task: tasks.append(task))
+        files = self._files(1)
+        hash = self.subService.calculate_hash(files[0])
+        self.server.missing.add(hash)
+        self.pipeline.addFiles(files)
+        self._run()
+        self.assertEqual(len(tasks), 1)
+        # Subtitles were uploaded meanwhile
+        self.server.missing.discard(hash)
+        self.pipeline.retry(files[0], tasks[0])
+        self._run()
+        self.assertEqual(self.finished, files)
+        self.assertEqual(self.server.calls['SearchSubtitles'], 2)
+
+    def test_cancel_all(self):
+        self.pipeline.addFiles(self._files(5))
+        self.pipeline.cancelAll()
+        self._run()
+        self.assertEqual(self.finished, [])
+        self.assertEqual(self.server.calls['SearchSubtitles'], 0)
+
+
+class AsyncPipelineTests(PipelineTests):
+    def _pipeline(self):
+        self.asyncService = AsyncOpenSubService(self.subService)
+        return Pipeline(self.subService, self.downloadService,
+                        encodingService=EncodingService(),
+                        asyncService=self.asyncService)
+
+    def test_shutdown(self):
+        closed = []
+        self.asyncService.close = \
+            lambda: closed.append(threading.current_thread().name)
+        self.pipeline.addFiles(self._files(2))
+        self._run()
+        self.pipeline.shutdown()
+        # Its connections are closed on the event loop
+        self.assertEqual(closed, ['asyncio'])
+
+    def test_many_files(self):
+        files = self._files(50)
+        self.pipeline.addFiles(files)
+        self._run()
+        self.assertEqual(sorted(self.finished), sorted(files))
+        self.assertEqual(self.server.calls['LogIn'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,207 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import threading
+import unittest
+from functools import partial
+
+from .context import service
+
+try:
+    from PyQt5.QtCore import QCoreApplication, QEventLoop, QTimer
+    from ui.scheduler import Scheduler
+    HAVE_QT = True
+except ImportError:
+    HAVE_QT = False
+
+TIMEOUT = 10000  # ms
+
+
+@unittest.skipUnless(HAVE_QT, "PyQt5 is not installed")
+class SchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.app = QCoreApplication.instance() or QCoreApplication([])
+        self.scheduler = Scheduler({'A': 1, 'B': 1, 'D': 1},
+                                   asyncStages=['C', 'D'])
+        self.events = []
+        # Holds the single 'A' thread until released
+        self.gate = threading.Event()
+
+    def tearDown(self):
+        self.gate.set()
+        self._wait(lambda: not self.scheduler.pending())
+        self.scheduler.shutdown()
+
+    def _wait(self, condition):
+        loop = QEventLoop()
+        timer = QTimer()
+        timer.timeout.connect(lambda: condition() and loop.quit())
+        timer.start(5)
+        QTimer.singleShot(TIMEOUT, loop.quit)
+        loop.exec_()
+        timer.stop()
+        self.assertTrue(condition())
+
+    def _record(self, name):
+        def func(*args):
+            self.events.append(name)
+            return name
+        return func
+
+    def _block(self):
+        self.scheduler.schedule('A', func=self.gate.wait)
+
+    def test_priority(self):
+        self._block()
+        for name, priority in [('low', Scheduler.BACKGROUND),
+                               ('high', Scheduler.INTERACTIVE),
+                               ('low2', Scheduler.BACKGROUND)]:
+            self.scheduler.schedule('A', func=self._record(name),
+                                    priority=priority)
+        self.gate.set()
+        self._wait(lambda: len(self.events) == 3)
+        self.assertEqual(self.events, ['high', 'low', 'low2'])
+
+    def test_cancel_queued(self):
+        self._block()
+        cancelled = []
+        self.scheduler.schedule('A', func=self._record('a'), group='x',
+                                onCancel=cancelled.append)
+        self.scheduler.schedule('A', func=self._record('b'), group='y')
+        self.assertEqual(self.scheduler.pending('x'), 1)
+        self.scheduler.cancel('x')
+        self.assertEqual(len(cancelled), 1)
+        self.gate.set()
+        self._wait(lambda: not self.scheduler.pending())
+        self.assertEqual(self.events, ['b'])
+
+    def test_cancel_running(self):
+        started = threading.Event()
+        results, cancelled = [], []
+
+        def work():
+            started.set()
+            self.gate.wait()
+            return 'done'
+
+        self.scheduler.schedule('A', func=work, group='x',
+                                onSuccess=lambda r, t: results.append(r),
+                                onCancel=cancelled.append)
+        started.wait(TIMEOUT / 1000)
+        self.assertFalse(self.scheduler.cancelEvent('x').is_set())
+        event = self.scheduler.cancelEvent('x')
+        self.scheduler.cancel('x')
+        self.assertTrue(event.is_set())
+        self.gate.set()
+        self._wait(lambda: cancelled)
+        self.assertEqual(results, [])
+        # A new task in the group is not affected
+        self.scheduler.schedule('A', func=self._record('again'), group='x')
+        self._wait(lambda: self.events == ['again'])
+
+    def test_chain(self):
+        results = []
+        first = self.scheduler.schedule('A', func=lambda: 20)
+        self.scheduler.schedule('B', func=lambda x: x + 1, after=first,
+                                onSuccess=lambda r, t: results.append(r))
+        self._wait(lambda: results)
+        self.assertEqual(results, [21])
+
+    def test_chain_error(self):
+        errors, cancelled = [], []
+
+        def fail():
+            raise IOError("failed")
+
+        first = self.scheduler.schedule(
+            'A', func=fail, onError=lambda e, t: errors.append(e))
+        self.scheduler.schedule('B', func=self._record('second'),
+                                after=first, onCancel=cancelled.append)
+        self._wait(lambda: cancelled)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(self.events, [])
+
+    def test_chain_cancelled(self):
+        self._block()
+        cancelled = []
+        first = self.scheduler.schedule('A', func=self._record('first'),
+                                        group='x')
+        self.scheduler.schedule('B', func=self._record('second'),
+                                after=first, group='x',
+                                onCancel=cancelled.append)
+        self.scheduler.cancel('x')
+        self.assertEqual(len(cancelled), 1)
+        self.gate.set()
+        self._wait(lambda: not self.scheduler.pending())
+        self.assertEqual(self.events, [])
+
+    def test_async(self):
+        results = []
+
+        async def work(i):
+            await asyncio.sleep(0.1)
+            return i
+
+        for i in range(50):
+            first = self.scheduler.schedule('C', func=partial(work, i))
+            self.scheduler.schedule('B', func=lambda x: x * 2, after=first,
+                                    onSuccess=lambda r, t: results.append(r))
+        # All coroutines wait concurrently, on one thread
+        self._wait(lambda: len(results) == 50)
+        self.assertEqual(sorted(results), list(range(0, 100, 2)))
+
+    def test_async_cancel(self):
+        errors, cancelled = [], []
+        started = threading.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(TIMEOUT)
+
+        async def fail():
+            raise IOError("failed")
+
+        self.scheduler.schedule('C', func=work, group='x',
+                                onCancel=cancelled.append)
+        self.scheduler.schedule('C', func=fail,
+                                onError=lambda e, t: errors.append(e))
+        started.wait(TIMEOUT / 1000)
+        self.scheduler.cancel('x')
+        self._wait(lambda: cancelled and errors)
+        self.assertEqual(len(cancelled), 1)
+
+    def test_async_priority(self):
+        async def work(name):
+            self.events.append(name)
+            await asyncio.sleep(0.05)
+
+        for name, priority in [('first', Scheduler.BACKGROUND),
+                               ('low', Scheduler.BACKGROUND),
+                               ('high', Scheduler.INTERACTIVE),
+                               ('cancelled', Scheduler.INTERACTIVE)]:
+            self.scheduler.schedule('D', func=partial(work, name),
+                                    priority=priority, group=name)
+        self.scheduler.cancel('cancelled')
+        self._wait(lambda: not self.scheduler.pending())
+        # One at a time, the queued ones by priority
+        self.assertEqual(self.events, ['first', 'high', 'low'])
+
+
+if __name__ == '__main__':
+    unittest.main()
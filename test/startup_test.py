@@ -0,0 +1,66 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+from .context import service
+import startup
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+try:
+    import PyQt5.QtWidgets
+    HAVE_QT = True
+except ImportError:
+    HAVE_QT = False
+
+
+class StartupTests(unittest.TestCase):
+    def test_report(self):
+        startup.mark('test')
+        report = startup.report()
+        self.assertEqual(report['steps'][-1]['step'], 'test')
+        self.assertGreaterEqual(report['steps'][-1]['delta_ms'], 0)
+
+    @unittest.skipUnless(HAVE_QT, "PyQt5 is not installed")
+    def test_window_without_services(self):
+        env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+        env[startup.ENV] = 'quit'
+        output = subprocess.run([sys.executable, 'main.py'], cwd=ROOT,
+                                env=env, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, timeout=60,
+                                check=True).stderr
+        report = json.loads(output.decode().strip().splitlines()[-1])
+        self.assertEqual([s['step'] for s in report['steps']],
+                         ['import', 'application', 'window', 'show',
+                          'event loop'])
+        self.assertEqual(report['loaded'], [])
+
+    def test_cli_defers_services(self):
+        code = "import sys, cli; " \
+            "sys.exit(any(m in sys.modules for m in ('requests', " \
+            "'service.OpenSubService')))"
+        subprocess.check_call([sys.executable, '-c', code], cwd=ROOT)
+
+
+if __name__ == '__main__':
+    unittest.main()
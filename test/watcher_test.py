@@ -0,0 +1,83 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+
+import os
+import tempfile
+import unittest
+
+from .context import service
+
+try:
+    from PyQt5.QtCore import QCoreApplication, QEventLoop, QTimer
+    from ui.watcher import Watcher
+    HAVE_QT = True
+except ImportError:
+    HAVE_QT = False
+
+TIMEOUT = 10000  # ms
+
+
+@unittest.skipUnless(HAVE_QT, "PyQt5 is not installed")
+class WatcherTests(unittest.TestCase):
+    def setUp(self):
+        self.app = QCoreApplication.instance() or QCoreApplication([])
+        self._dir = tempfile.TemporaryDirectory()
+        self.watcher = Watcher()
+        self.arrived = []
+        self.watcher.filesArrived.connect(self.arrived.extend)
+
+    def tearDown(self):
+        self.watcher.stop()
+        self._dir.cleanup()
+
+    def _wait(self, condition):
+        loop = QEventLoop()
+        timer = QTimer()
+        timer.timeout.connect(lambda: condition() and loop.quit())
+        timer.start(5)
+        QTimer.singleShot(TIMEOUT, loop.quit)
+        loop.exec_()
+        timer.stop()
+        self.assertTrue(condition())
+
+    def test_new_files(self):
+        subdirectory = os.path.join(self._dir.name, 'sub')
+        os.mkdir(subdirectory)
+        self.watcher.watch([self._dir.name], settle=0.2)
+        self._wait(lambda: len(self.watcher.directories()) == 2)
+
+        filePaths = []
+        for directory in (self._dir.name, subdirectory):
+            filePath = os.path.join(directory, 'movie.mkv')
+            with open(filePath, 'wb') as f:
+                f.write(b'x' * 1024)
+            filePaths.append(filePath)
+        self._wait(lambda: len(self.arrived) == 2)
+        self.assertEqual(sorted(self.arrived), sorted(filePaths))
+
+    def test_stop(self):
+        self.watcher.watch([self._dir.name], settle=0.2)
+        self._wait(lambda: self.watcher._fsWatcher.directories())
+        self.watcher.stop()
+        self.assertEqual(self.watcher.directories(), [])
+        self.assertEqual(self.watcher._fsWatcher.directories(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,12 +16,10 @@
 # You should have received a copy of the GNU General Public License
 # along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
 
-from PyQt5.Qt import (
+from PyQt5.QtCore import (
     pyqtProperty,
     pyqtSignal,
     pyqtSlot,
-    QApplication,
-    QColor,
     QDateTime,
     QElapsedTimer,
     QEasingCurve,
@@ -32,10 +30,12 @@ from PyQt5.Qt import (
     QTimer,
 )
 from PyQt5.QtWidgets import (
+    QApplication,
     QWidget
 )
 from PyQt5.QtGui import (
     QBrush,
+    QColor,
     QDragEnterEvent,
     QDragLeaveEvent,
     QDragMoveEvent,
@@ -181,8 +181,8 @@ class DndWidget(QWidget):
 
         palette: QPalette = QApplication.instance().palette()
         painter.setPen(QPen(palette.color(QPalette.Active, QPalette.Dark), 1))
-        textRect.moveTo(widgetRect.width() / 2 - textRect.width() / 2,
-                        widgetRect.height() / 2 - textRect.height() / 2)
+        textRect.moveTo(widgetRect.width() // 2 - textRect.width() // 2,
+                        widgetRect.height() // 2 - textRect.height() // 2)
         painter.drawText(textRect, Qt.AlignCenter, text)
 
     def paintEvent(self, event: QPaintEvent):
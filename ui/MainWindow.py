@@ -16,35 +16,31 @@
 # You should have received a copy of the GNU General Public License
 # along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
 
-import shutil
-import os
-import gzip
 import sys
-import requests
 from enum import IntEnum, auto, unique
 from os import path
-from PyQt5.Qt import (
+from PyQt5.QtCore import (
     pyqtSlot,
-    QAction,
-    QApplication,
     QByteArray,
-    QErrorMessage,
-    QKeySequence,
-    QMainWindow,
-    QMenu,
     QMimeDatabase,
     QMimeType,
-    QSizePolicy,
     Qt,
-    QThreadPool,
+    QTimer,
     QUrl,
 )
 from PyQt5.QtGui import (
     QCloseEvent,
     QDesktopServices,
+    QKeySequence,
 )
 from PyQt5.QtWidgets import (
+    QAction,
+    QApplication,
     QDesktopWidget,
+    QErrorMessage,
+    QMainWindow,
+    QMenu,
+    QSizePolicy,
     QFileDialog,
     QLabel,
     QMenuBar,
@@ -56,16 +52,11 @@ from PyQt5.QtWidgets import (
     QWidget,
 )
 from .task import Task
-from .PreferencesDialog import PreferencesDialog
-from .AboutDialog import AboutDialog
 from .DndWidget import DndWidget
 from .Settings import Settings
-from service.OpenSubService import OpenSubService
-from service.EncodingService import EncodingService
+from Application import Application
 from log import logger
-from functools import partial
-from tempfile import NamedTemporaryFile
-from typing import List, Dict
+from typing import List
 
 PROG = 'Subtitles'
 
@@ -74,16 +65,87 @@ class MainWindow(QMainWindow):
     def __init__(self, parent=None):
         super().__init__(parent)
 
-        self._subService = OpenSubService()
-        self._encService = EncodingService()
-        self._token = None
-
-        self._threadPool = QThreadPool.globalInstance()
+        # The services, the pipeline and the dialogs pull in the network
+        # libraries, so they are created on first use rather than delaying
+        # the window.
+        self._subService = None
+        self._encService = None
+        self._rateLimiter = None
+        self._pipeline = None
+        self._watcher = None
+        # Only launch the video player for single-file drops
+        self._playAfterDownload = set()
 
         self._initUi()
 
         self._restoreWindowSettings()
 
+        if self._watchFolders():
+            # Lists the folders, so not before the window is shown
+            QTimer.singleShot(0, self._startWatching)
+
+    @property
+    def subtitleService(self):
+        if self._subService is None:
+            from service.OpenSubService import OpenSubService
+            from service.HashCache import HashCache
+            from service.ResultCache import ResultCache
+            self._subService = OpenSubService(
+                hash_cache=self._openCache(HashCache),
+                result_cache=self._openCache(ResultCache),
+                languages_file=Application.instance().findResource(
+                    'languages.json'),
+                rate_limiter=self.rateLimiter)
+            # Keep the session open while the window is idle
+            self._subService.session.start()
+        return self._subService
+
+    @property
+    def rateLimiter(self):
+        # Shared by the searches and the downloads
+        if self._rateLimiter is None:
+            from service.RateLimiter import RateLimiter
+            self._rateLimiter = RateLimiter()
+        return self._rateLimiter
+
+    @property
+    def encodingService(self):
+        if self._encService is None:
+            from service.EncodingService import EncodingService
+            self._encService = EncodingService()
+        return self._encService
+
+    @property
+    def pipeline(self):
+        if self._pipeline is None:
+            from service.AsyncOpenSubService import AsyncOpenSubService
+            from service.DownloadService import DownloadService
+            from .pipeline import Pipeline
+            downloadService = DownloadService(
+                pool_size=Pipeline.STAGE_THREADS[Pipeline.DOWNLOAD],
+                rate_limiter=self.rateLimiter)
+            # Searches and downloads wait on the network, so they run on
+            # one event loop rather than holding a thread each
+            asyncService = AsyncOpenSubService(self.subtitleService,
+                                               rate_limiter=self.rateLimiter)
+            self._pipeline = Pipeline(self.subtitleService, downloadService,
+                                      encodingService=self.encodingService,
+                                      parent=self, asyncService=asyncService)
+            self._pipeline.subtitleDownloaded.connect(
+                self._onSubtitlesDownloaded)
+            self._pipeline.fileFinished.connect(self._onFileFinished)
+            self._pipeline.taskFailed.connect(self._errorHandler)
+            self._pipeline.finished.connect(self._onBatchFinished)
+        return self._pipeline
+
+    def _openCache(self, cacheClass):
+        try:
+            return cacheClass.in_directory(
+                Application.instance().dataLocation())
+        except Exception as e:
+            logger.warn(f"Unable to open {cacheClass.__name__}: {e}")
+            return None
+
     def _initUi(self):
         self._initCentralWidget()
 
@@ -111,6 +173,12 @@ class MainWindow(QMainWindow):
         openMovieAction = fileMenu.addAction(self.tr("&Open Movie..."))
         openMovieAction.triggered.connect(self.showOpenFile)
         openMovieAction.setShortcut(QKeySequence.Open)
+        watchFolderAction = fileMenu.addAction(self.tr("&Watch Folder..."))
+        watchFolderAction.triggered.connect(self.showWatchFolder)
+        self._stopWatchingAction = fileMenu.addAction(
+            self.tr("&Stop Watching"))
+        self._stopWatchingAction.triggered.connect(self.stopWatching)
+        self._stopWatchingAction.setEnabled(bool(self._watchFolders()))
 
         if sys.platform == 'darwin':
             # XXX: Keep this in the "File" menu.  Qt on macOS will automatically
@@ -149,6 +217,13 @@ class MainWindow(QMainWindow):
 
     def closeEvent(self, event: QCloseEvent):
         self._saveWindowSettings()
+        if self._pipeline:
+            # Don't keep the application alive for queued downloads
+            self._pipeline.shutdown()
+        if self._watcher:
+            self._watcher.stop()
+        if self._subService:
+            self._subService.session.stop()
 
     def _saveWindowSettings(self):
         settings = Settings()
@@ -168,19 +243,15 @@ class MainWindow(QMainWindow):
 
     @pyqtSlot()
     def showOpenFile(self):
+        from service.LibraryScanner import VIDEO_MIME_TYPES
+
         dlg = QFileDialog(self)
         dlg.setWindowTitle(self.tr("Open Video Files"))
         dlg.setWindowModality(Qt.WindowModal)
 
-        mimeFilters = [
-            "video/mp4",
-            "video/quicktime",
-            "video/x-msvideo",
-            "video/x-ms-wmv"
-        ]
         globPatterns = []
         db = QMimeDatabase()
-        for m in mimeFilters:
+        for m in VIDEO_MIME_TYPES:
             mimeType = db.mimeTypeForName(m)
             if not mimeType.isValid():
                 logger.warn("Invalid MIME type: {}".format(m))
@@ -203,8 +274,49 @@ class MainWindow(QMainWindow):
             filenames = dlg.selectedFiles()
             self.processVideoFiles(filenames)
 
+    @pyqtSlot()
+    def showWatchFolder(self):
+        directory = QFileDialog.getExistingDirectory(
+            self, self.tr("Watch Folder"))
+        if not directory:
+            return
+        folders = self._watchFolders()
+        if directory not in folders:
+            Settings().set(Settings.WATCH_FOLDERS, folders + [directory])
+        self._startWatching()
+
+    @pyqtSlot()
+    def stopWatching(self):
+        Settings().set(Settings.WATCH_FOLDERS, [])
+        if self._watcher:
+            self._watcher.stop()
+        self._stopWatchingAction.setEnabled(False)
+
+    def _watchFolders(self) -> List[str]:
+        folders = Settings().get(Settings.WATCH_FOLDERS)
+        if isinstance(folders, str):
+            # QSettings returns a single-item list as a string
+            folders = [folders]
+        return list(folders or [])
+
+    def _startWatching(self):
+        if self._watcher is None:
+            from .watcher import Watcher
+            self._watcher = Watcher(self)
+            self._watcher.filesArrived.connect(self._onFilesArrived)
+        self._watcher.watch(self._watchFolders(), self._preferredLanguages())
+        self._stopWatchingAction.setEnabled(True)
+
+    def _onFilesArrived(self, filePaths: List[str]):
+        from .scheduler import Scheduler
+        logger.debug(f"{len(filePaths)} new file(s) in the watched folders")
+        # After the files the user opens or drops
+        pipeline = self._preparePipeline(self._preferredLanguages())
+        pipeline.addFiles(filePaths, Scheduler.BACKGROUND)
+
     @pyqtSlot()
     def showAbout(self):
+        from .AboutDialog import AboutDialog
         dlg = AboutDialog(self)
         dlg.exec_()
 
@@ -217,116 +329,67 @@ class MainWindow(QMainWindow):
 
     @pyqtSlot()
     def showPreferences(self):
+        from .PreferencesDialog import PreferencesDialog
         prefDialog = PreferencesDialog(
-            subtitleService=self._subService,
-            encodingService=self._encService,
+            subtitleService=self.subtitleService,
+            encodingService=self.encodingService,
             parent=self)
         code = prefDialog.exec_()
         logger.debug("Preference dialog code: {}".format(code))
 
-    def _onSubtitlesFound(self, filePath, subtitles):
-        logger.debug(
-            "_onSubtitlesFound: filePath={}, subtitles=\n{}".format(filePath,
-                                                                    subtitles))
-        if not subtitles:
-            # TODO: Display a message
-            logger.warning("No subtitles found")
-
-        subtitle = subtitles[0]  # TODO: Handle the other subtitles
-        self._schedule("Download Subtitles",
-                       func=partial(self._downloadSubtitle, subtitle, filePath),
-                       onSuccess=partial(self._onSubtitlesDownloaded, filePath),
-                       onError=self._errorHandler)
-
-    def _downloadSubtitle(self, subtitleDict: Dict, moviePath: str) -> str:
-        url = subtitleDict['downloadLink']
-        logger.debug("Downloading subtitle: {}".format(url))
-        r = requests.get(url, stream=True)
-        try:
-            tempfile_unzipped = NamedTemporaryFile(
-                prefix=PROG, delete=False)
-            with NamedTemporaryFile(prefix=PROG) as tempfile:
-                r.raw.decode_content = True
-                shutil.copyfileobj(r.raw, tempfile)
-                with gzip.open(tempfile.name) as gz:
-                    shutil.copyfileobj(gz, tempfile_unzipped)
-
-            dirname = path.dirname(moviePath)
-            basename = path.splitext(path.basename(moviePath))[0]
-            sub_basename = "{}.{}.{}".format(
-                basename, subtitleDict['language_id'], subtitleDict['format'])
-            filename = path.join(dirname, sub_basename)
-            logger.debug("filename: {}".format(filename))
-            os.rename(tempfile_unzipped.name, filename)
-            return filename
-        except Exception as e:
-            if tempfile_unzipped:
-                os.remove(tempfile_unzipped.name)
-            raise e
-
     def _onSubtitlesDownloaded(self, filePath: str, subtitlePath: str):
         logger.debug(f"filePath={filePath}, subtitlePath={subtitlePath}")
-        logger.debug(f"Launching video file")
-        QDesktopServices.openUrl(QUrl.fromLocalFile(filePath))
-        # TODO: Convert encoding
-
-    def _findSubtitles(self, hash: int, filePath: str):
-        logger.debug(f"hash={hash}, filePath={filePath}")
-        if not self._token:
-            logger.debug("Not authenticated, performing login()")
-            self._token = self._subService.login()
-            if not self._token:
-                # TODO: Define exception class
-                raise Exception("Unable to login")
-        logger.debug(f"_findSubtitles: token={self._token}")
-        return self._subService.find_by_hash(hash)
-
-    def _onHashCalculated(self, filePath: str, hash: int, task: Task):
-        logger.debug(f"filePath={filePath}, hash={hash}, task={task}")
-
-        self._schedule("Find Subtitles",
-                       func=partial(self._findSubtitles, hash, filePath),
-                       onSuccess=partial(self._onSubtitlesFound, filePath),
-                       onError=self._errorHandler)
-
-    def _saveToken(self, token):
-        logger.debug("Got token:{}".format(token))
-        self._token = token
-
-    def _rescheduleTask(self, task) -> Task:
-        return self._schedule(task.name, task.func, task.onSuccess, task.onError)
-
-    def _schedule(self, name, func, onSuccess, onError=None) -> Task:
-        task = Task(func, name, onSuccess, onError)
-        self._scheduleTask(task)
-        return task
-
-    def _scheduleTask(self, task: Task) -> None:
-        logger.debug(f"ThreadPool starting task {task}")
-        self._threadPool.start(task)
-
-    def _errorHandler(self, e: Exception, task: Task):
+
+    def _onBatchFinished(self):
+        logger.info(f"Rate limits: {self.rateLimiter.metrics()}")
+
+    def _onFileFinished(self, filePath: str):
+        if filePath in self._playAfterDownload:
+            self._playAfterDownload.discard(filePath)
+            logger.debug(f"Launching video file")
+            QDesktopServices.openUrl(QUrl.fromLocalFile(filePath))
+
+    def _errorHandler(self, filePath: str, e: Exception, task: Task):
         mb = QMessageBox(self)
         mb.setIcon(QMessageBox.Critical)
         mb.setText(self.tr(f"Error occurred while running '{task.name}''"))
         mb.setInformativeText(self.tr("Would you like to retry?"))
-        mb.setDetailedText(str(e) + '\n\n' + str(task))
+        mb.setDetailedText(filePath + '\n\n' + str(e) + '\n\n' + str(task))
         mb.addButton(QMessageBox.Close)
         mb.addButton(QMessageBox.Retry)
         mb.setDefaultButton(QMessageBox.Retry)
         # mb.setWindowModality(Qt.WindowModal)
         response = mb.exec_()
         if response == QMessageBox.Retry:
-            logger.info(f"Retrying task {task}")
-            self._rescheduleTask(task)
+            self.pipeline.retry(filePath, task)
+        else:
+            self._playAfterDownload.discard(filePath)
 
     @pyqtSlot('QVariantList')
     def processVideoFiles(self, filePaths: List[str]):
-        # TODO: Handle multiple files
-        filePath = filePaths[0]
-        logger.warn(f"Multiple files not supported, only using the first one: '{filePath}'")
-        logger.debug(f"_processFile(): Running worker for filePath '{filePath}'")
-        self._schedule("Hash",
-                       partial(self._subService.calculate_hash, filePath),
-                       onSuccess=partial(self._onHashCalculated, filePath),
-                       onError=self._errorHandler)
+        directories = [p for p in filePaths if path.isdir(p)]
+        files = [p for p in filePaths if not path.isdir(p)]
+        logger.debug(f"Processing {len(files)} file(s) and "
+                     f"{len(directories)} directories")
+        languages = self._preferredLanguages()
+        pipeline = self._preparePipeline(languages)
+        if len(files) == 1 and not directories:
+            self._playAfterDownload.add(files[0])
+        if files:
+            pipeline.addFiles(files)
+        if directories:
+            pipeline.addDirectories(directories, languages)
+
+    def _preparePipeline(self, languages: List[str]):
+        # Applies the preferences to the files added next
+        pipeline = self.pipeline
+        pipeline.setLanguages(languages)
+        pipeline.setEncoding(Settings().get(Settings.ENCODING))
+        return pipeline
+
+    def _preferredLanguages(self) -> List[str]:
+        codes = Settings().get(Settings.LANGUAGES)
+        if isinstance(codes, str):
+            # QSettings returns a single-item list as a string
+            codes = [codes]
+        return self.subtitleService.language_ids(codes or [])
@@ -25,6 +25,7 @@ from PyQt5.Qt import (
     QMimeData,
     Qt,
     QTextCodec,
+    QThreadPool,
 )
 from PyQt5.QtWidgets import (
     QAbstractItemView,
@@ -43,6 +44,7 @@ from PyQt5.QtWidgets import (
     QVBoxLayout
 )
 from .Settings import Settings
+from .task import Task
 from Application import Application
 from log import logger
 
@@ -53,6 +55,7 @@ class PreferencesDialog(QDialog):
 
         self._subService = subtitleService
         self._encService = encodingService
+        self._languagesTask = None
 
         self._initLocales()
 
@@ -86,9 +89,7 @@ class PreferencesDialog(QDialog):
         formLayout.addRow(self.tr("Save subtitles with encoding:"),
                           self._encodingList)
 
-        # TODO: Make async
-        languages = self._subService.get_languages()
-        self._onLanguagesReceived(languages)
+        self._queryLanguages()
 
         browseAppLayout = QHBoxLayout()
         appEdit = QLineEdit(self.tr(""))
@@ -128,32 +129,88 @@ class PreferencesDialog(QDialog):
         langList.addItem(self.tr("Querying languages..."))
         return langList
 
+    def _queryLanguages(self):
+        languages = self._subService.cached_languages()
+        if languages:
+            self._onLanguagesReceived(languages)
+            return
+
+        languages = self._subService.bundled_languages()
+        if languages:
+            self._onLanguagesReceived(languages)
+
+        self._languagesTask = Task(self._subService.get_languages,
+                                   "Query Languages",
+                                   onSuccess=self._onLanguagesReceived,
+                                   onError=self._onLanguagesError)
+        self.finished.connect(self._cancelLanguagesQuery)
+        QThreadPool.globalInstance().start(self._languagesTask)
+
+    def _cancelLanguagesQuery(self):
+        if self._languagesTask:
+            self._languagesTask.setStop()
+
+    def _onLanguagesError(self, e: Exception, task: Task):
+        logger.warn(f"Error querying languages: {e}")
+        self._languagesTask = None
+        if not self._isLanguageListReady():
+            self._langList.clear()
+            self._langList.addItem(self.tr("Unable to query languages"))
+
+    def _isLanguageListReady(self):
+        return self._langList.count() > 0 and \
+            self._langList.item(0).data(Qt.UserRole) is not None
+
+    def _listedLanguages(self):
+        return {self._langList.item(i).data(Qt.UserRole)
+                for i in range(self._langList.count())}
+
+    def _checkedLanguages(self):
+        languages = []
+        for i in range(self._langList.count()):
+            item = self._langList.item(i)
+            if item.checkState() == Qt.Checked:
+                languages.append(item.data(Qt.UserRole))
+        return languages
+
     def _initEncodingList(self):
         encList = QComboBox(self)
 
-        codecs = QTextCodec.availableCodecs()
-        codecNames = sorted([str(x, encoding='ascii')
-                             for x in codecs], key=lambda x: x.lower())
+        registry = self._encService.registry
+        if not registry.qt_registered:
+            for mib in QTextCodec.availableMibs():
+                codec = QTextCodec.codecForMib(mib)
+                registry.register_qt_codec(
+                    str(codec.name(), encoding='ascii'),
+                    [str(x, encoding='ascii') for x in codec.aliases()])
+            registry.qt_registered = True
+        encList.addItems(registry.names)
 
-        for codec in codecNames:
-            encList.addItem(codec)
-
-        preferredCodec = self._getPreferredCodec()
-        if preferredCodec not in codecNames:
-            preferredCodec = 'UTF-8'
-        encList.setCurrentText(preferredCodec)
+        preferredCodec = registry.display_name(self._getPreferredCodec())
+        encList.setCurrentText(preferredCodec or 'UTF-8')
 
         return encList
 
-    def _onLanguagesReceived(self, languages):
+    def _onLanguagesReceived(self, languages, task=None):
+        if task:
+            self._languagesTask = None
         loc = QLocale.system()
         sysLang = QLocale.languageToString(loc.language())
-        preferredLanguages = self._getPreferredLanguages()
+        # Keep the choices made while the list was being refreshed
+        keepChoices = self._isLanguageListReady()
+        if keepChoices:
+            # And the saved ones that the previous list did not have
+            listed = self._listedLanguages()
+            preferredLanguages = self._checkedLanguages() + [
+                code for code in self._getPreferredLanguages()
+                if code not in listed]
+        else:
+            preferredLanguages = self._getPreferredLanguages()
         self._langList.clear()
         firstCheckedItem = None
-        for lang in sorted(languages, key=lambda x: x['name']):
-            langName = lang['name']
-            langCode = lang['code']
+        for lang in sorted(languages, key=lambda x: x.name):
+            langName = lang.name
+            langCode = lang.code
             nativeLang = self._getNativeLanguageName(langName)
             text = langName
             isSystemLang = langName == sysLang
@@ -163,7 +220,7 @@ class PreferencesDialog(QDialog):
             item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
             item.setData(Qt.UserRole, langCode)
             if (preferredLanguages and langCode in preferredLanguages) \
-                    or isSystemLang:
+                    or (isSystemLang and not keepChoices):
                 item.setCheckState(Qt.Checked)
                 firstCheckedItem = item
             else:
@@ -191,9 +248,5 @@ class PreferencesDialog(QDialog):
         settings = Settings()
         settings.set(Settings.ENCODING, self._encodingList.currentText())
 
-        languages = []
-        for i in range(self._langList.count()):
-            item = self._langList.item(i)
-            if item.checkState() == Qt.Checked:
-                languages.append(item.data(Qt.UserRole))
-        settings.set(Settings.LANGUAGES, languages)
+        if self._isLanguageListReady():
+            settings.set(Settings.LANGUAGES, self._checkedLanguages())
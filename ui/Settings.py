@@ -25,6 +25,7 @@ class Settings(object):
     CORE = "core"
     LANGUAGES = CORE + "/languages"
     ENCODING = CORE + "/encoding"
+    WATCH_FOLDERS = CORE + "/watchFolders"
     WINDOW = "window"
     WINDOW_GEOMETRY = WINDOW + "/geometry"
     WINDOW_STATE = WINDOW + "/state"
@@ -0,0 +1,112 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+import threading
+from typing import Callable
+from .task import Task
+from log import logger
+
+
+class AsyncBridge(object):
+    """Runs tasks whose ``func`` returns a coroutine on an asyncio event
+    loop, on a single background thread.
+
+    The tasks report through their queued signals, as if they had run on a
+    thread pool, so any number of them can be in flight without holding a
+    thread each.  A cancelled task's coroutine is cancelled where it
+    awaits.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._loop = None
+        self._thread = None
+        self._running = {}  # Task -> asyncio.Task, used on the loop only
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The event loop, started on first use."""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever,
+                                            name='asyncio', daemon=True)
+            self._thread.start()
+        return self._loop
+
+    def start(self, task: Task):
+        self.loop.call_soon_threadsafe(self._start, task)
+
+    def cancel(self, task: Task):
+        """Cancels ``task``, whose cancel event must already be set."""
+        self.loop.call_soon_threadsafe(self._cancel, task)
+
+    def stop(self, cleanup: Callable = None):
+        """Cancels the running coroutines and stops the loop.
+
+        ``cleanup`` is then called on the loop, e.g. to close the
+        connections the coroutines used.
+        """
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._stop(cleanup), self._loop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = self._thread = None
+
+    def _start(self, task: Task):
+        if task.stop:
+            task.signals.cancelled.emit(task)
+            return
+        self._running[task] = self._loop.create_task(self._run(task))
+
+    def _cancel(self, task: Task):
+        running = self._running.get(task)
+        if running:
+            running.cancel()
+
+    async def _stop(self, cleanup):
+        running = list(self._running.values())
+        for coroutine in running:
+            coroutine.cancel()
+        # Let the cancelled coroutines finish before stopping
+        await asyncio.gather(*running, return_exceptions=True)
+        if cleanup:
+            cleanup()
+        # And the transports closed by them and by cleanup
+        await asyncio.sleep(0)
+        self._loop.stop()
+
+    async def _run(self, task: Task):
+        try:
+            result = await task.func()
+        except asyncio.CancelledError:
+            task.signals.cancelled.emit(task)
+        except Exception as e:
+            if task.stop:
+                task.signals.cancelled.emit(task)
+            else:
+                logger.error(f"Got exception from func: {e}")
+                task.signals.error.emit(e, task)
+        else:
+            if task.stop:
+                task.signals.cancelled.emit(task)
+            else:
+                task.signals.success.emit(result, task)
+        finally:
+            del self._running[task]
@@ -0,0 +1,451 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import threading
+from os import path
+from functools import partial
+from typing import Dict, List, Set, Tuple
+from PyQt5.QtCore import (
+    pyqtSignal, QObject, QRunnable, QTimer
+)
+from .scheduler import Scheduler
+from .task import Task
+from service.BatchStats import BatchStats
+from service.HashExecutor import HashExecutor
+from service.OpenSubService import (
+    DEFAULT_LANGUAGES, SEARCH_MAX_QUERIES, NoSubtitlesFound
+)
+from service.RateLimiter import RateLimiter
+from service.SubtitleCandidate import SubtitleCandidate
+from service.SubtitleRanker import SubtitleRanker
+from service.LibraryScanner import LibraryScanner
+from log import logger
+
+
+class Pipeline(QObject):
+    """Runs Hash -> Find Subtitles -> Download Subtitles -> Convert Encoding
+    for every file.
+
+    Each stage has its own thread pool, so hashing (disk-bound) overlaps
+    with searching and downloading (network-bound).  Hashing runs on a
+    ``HashExecutor``, which reads ``HASH_PER_DEVICE`` files at a time from
+    each disk or share, and files on different devices in parallel.  Files
+    added directly are processed before the files found by directory
+    scans, and every file can be cancelled until its subtitles are saved.
+
+    With an ``asyncService``, an ``AsyncOpenSubService``, the searches and
+    downloads are coroutines on one event loop thread instead, and run
+    concurrently within the limits of its rate limiter.  They still start
+    in priority order, ``ASYNC_STAGE_TASKS`` at a time.
+    """
+
+    HASH = "Hash"
+    FIND = "Find Subtitles"
+    DOWNLOAD = "Download Subtitles"
+    CONVERT = "Convert Encoding"
+    SCAN = "Scan Directories"
+
+    # The XML-RPC client shares a single connection and is not thread-safe,
+    # so searches run one at a time.
+    STAGE_THREADS = {
+        # Across all devices
+        HASH: 8,
+        FIND: 1,
+        DOWNLOAD: 4,
+        CONVERT: 2,
+        # LibraryScanner lists the directories on its own threads
+        SCAN: 2,
+    }
+
+    # Searches and downloads in flight with an ``asyncService``: as many as
+    # its rate limiter lets through at most, so the rest wait here, in
+    # priority order.
+    ASYNC_STAGE_TASKS = {
+        FIND: RateLimiter.SEARCH_CONCURRENCY,
+        DOWNLOAD: RateLimiter.DOWNLOAD_CONCURRENCY,
+    }
+
+    HASH_PER_DEVICE = 2
+
+    # How long to wait for more hashes before searching a partial batch.
+    SEARCH_BATCH_DELAY = 250  # ms
+
+    subtitleDownloaded = pyqtSignal(str, str)
+    # Emitted once all subtitles of a file have been downloaded
+    fileFinished = pyqtSignal(str)
+    # Emitted for the files added interactively; the failures of files
+    # found in the background are only logged and counted in the stats
+    taskFailed = pyqtSignal(str, Exception, QRunnable)
+    finished = pyqtSignal()
+
+    _fileDiscovered = pyqtSignal(str)
+
+    def __init__(self, subtitleService, downloadService, ranker=None,
+                 encodingService=None, parent=None, asyncService=None):
+        super().__init__(parent)
+
+        self._subService = subtitleService
+        self._asyncService = asyncService
+        self._downloadService = downloadService
+        self._encService = encodingService
+        self._encoding = None
+        self._ranker = ranker or SubtitleRanker()
+        self._languages = list(DEFAULT_LANGUAGES)
+
+        asyncStages = (Pipeline.FIND, Pipeline.DOWNLOAD) if asyncService \
+            else ()
+        hashExecutor = HashExecutor(
+            per_device=Pipeline.HASH_PER_DEVICE,
+            max_workers=Pipeline.STAGE_THREADS[Pipeline.HASH])
+        stageThreads = dict(Pipeline.STAGE_THREADS)
+        if asyncService:
+            stageThreads.update(Pipeline.ASYNC_STAGE_TASKS)
+        self._scheduler = Scheduler(stageThreads, self, asyncStages,
+                                    {Pipeline.HASH: hashExecutor})
+
+        # Active files and their priority
+        self._active = {}
+        self._scanning = 0
+        self._fileDiscovered.connect(self._onFileDiscovered)
+        self._stats = BatchStats()
+
+        # Hashed files waiting to be searched, keyed by hash
+        self._hashing = 0
+        self._searchQueue = {}
+        self._searchSizes = {}
+        self._searchTimer = QTimer(self)
+        self._searchTimer.setSingleShot(True)
+        self._searchTimer.setInterval(Pipeline.SEARCH_BATCH_DELAY)
+        self._searchTimer.timeout.connect(self._flushSearchQueue)
+
+        # Downloads in progress, keyed by file
+        self._downloads = {}
+
+    @property
+    def stats(self) -> BatchStats:
+        return self._stats
+
+    def setLanguages(self, languages: List[str]):
+        """Sets the subtitle language IDs to search for.
+
+        The best subtitle is downloaded for each language.  Applies to the
+        searches that have not started yet.
+        """
+        self._languages = list(languages) or list(DEFAULT_LANGUAGES)
+
+    def setEncoding(self, encoding: str):
+        """Sets the encoding that downloaded subtitles are converted to, or
+        None to keep them as they are."""
+        self._encoding = encoding
+
+    def isIdle(self) -> bool:
+        return not self._active and not self._scanning
+
+    def addFiles(self, filePaths: List[str],
+                 priority: int = Scheduler.INTERACTIVE):
+        if self.isIdle():
+            self._stats.reset()
+        for filePath in filePaths:
+            if filePath in self._active:
+                logger.debug(f"Already processing '{filePath}'")
+                continue
+            self._stats.file_queued()
+            self._startFile(filePath, priority)
+
+    def addDirectories(self, directories: List[str], languages: List[str]):
+        """Scans ``directories`` on a worker thread and adds the video files
+        as they are found."""
+        if self.isIdle():
+            self._stats.reset()
+        self._scanning += 1
+        scanner = LibraryScanner(languages=languages)
+        cancelled = self._scheduler.cancelEvent(Pipeline.SCAN)
+        self._scheduler.schedule(
+            Pipeline.SCAN,
+            func=partial(self._scanDirectories, scanner, directories,
+                         cancelled),
+            onSuccess=self._onScanFinished,
+            onError=self._onScanError,
+            onCancel=self._onScanCancelled,
+            group=Pipeline.SCAN)
+
+    def _scanDirectories(self, scanner: LibraryScanner,
+                         directories: List[str],
+                         cancelled: threading.Event) -> int:
+        count = 0
+        for filePath in scanner.scan(directories):
+            if cancelled.is_set():
+                break
+            self._fileDiscovered.emit(filePath)
+            count += 1
+        return count
+
+    def _onFileDiscovered(self, filePath: str):
+        self.addFiles([filePath], Scheduler.BACKGROUND)
+
+    def _onScanFinished(self, count: int, task: Task):
+        logger.info(f"Found {count} video file(s) without subtitles")
+        self._scanDone()
+
+    def _onScanError(self, e: Exception, task: Task):
+        logger.error(f"Error scanning directories: {e}")
+        self._scanDone()
+
+    def _onScanCancelled(self, task: Task):
+        logger.info("Directory scan cancelled")
+        self._scanDone()
+
+    def _scanDone(self):
+        self._scanning -= 1
+        if self.isIdle():
+            logger.info(f"Batch finished: {self._stats}")
+            self.finished.emit()
+
+    def retry(self, filePath: str, task: Task):
+        logger.info(f"Retrying '{filePath}' after failed task {task}")
+        if filePath in self._active:
+            return
+        self._stats.file_retried()
+        self._startFile(filePath, Scheduler.INTERACTIVE)
+
+    def cancel(self, filePaths: List[str]):
+        """Stops processing ``filePaths``.
+
+        Their queued tasks are dropped, and running downloads stop after the
+        current chunk.  Searches already sent to the server still complete,
+        but their results are ignored for these files.
+        """
+        filePaths = [f for f in filePaths if f in self._active]
+        for filePath in filePaths:
+            logger.info(f"Cancelling '{filePath}'")
+            for hash, files in list(self._searchQueue.items()):
+                if filePath in files:
+                    files.remove(filePath)
+                if not files:
+                    del self._searchQueue[hash]
+                    self._searchSizes.pop(hash, None)
+            self._downloads.pop(filePath, None)
+            del self._active[filePath]
+            self._scheduler.cancel(filePath)
+        if filePaths and self.isIdle():
+            logger.info(f"Batch finished: {self._stats}")
+            self.finished.emit()
+
+    def cancelAll(self):
+        """Stops the directory scans and the processing of all files."""
+        self._scheduler.cancel(Pipeline.SCAN)
+        self.cancel(list(self._active))
+
+    def shutdown(self):
+        """Cancels everything, and closes the connections and stops the
+        event loop of the async searches and downloads."""
+        self.cancelAll()
+        self._scheduler.shutdown(
+            self._asyncService.close if self._asyncService else None)
+
+    def _startFile(self, filePath: str, priority: int):
+        self._active[filePath] = priority
+        self._hashing += 1
+        self._scheduler.schedule(
+            Pipeline.HASH,
+            func=partial(self._hashFile, filePath),
+            onSuccess=partial(self._onHashCalculated, filePath),
+            onError=partial(self._onHashError, filePath),
+            onCancel=self._onHashCancelled,
+            priority=priority,
+            group=filePath,
+            filePath=filePath)
+
+    def _hashFile(self, filePath: str) -> Tuple[str, int]:
+        hash = self._subService.calculate_hash(filePath)
+        size = path.getsize(filePath)
+        self._stats.file_hashed(size)
+        return hash, size
+
+    def _onHashCalculated(self, filePath: str, hashAndSize: Tuple[str, int],
+                          task: Task):
+        hash, size = hashAndSize
+        logger.debug(f"filePath={filePath}, hash={hash}, task={task}")
+        self._hashing -= 1
+        if filePath not in self._active:
+            # Cancelled after hashing, before this callback
+            self._hashDone()
+            return
+        self._searchQueue.setdefault(hash, []).append(filePath)
+        self._searchSizes[hash] = size
+        if len(self._searchQueue) >= SEARCH_MAX_QUERIES or not self._hashing:
+            self._flushSearchQueue()
+        else:
+            self._searchTimer.start()
+
+    def _onHashError(self, filePath: str, e: Exception, task: Task):
+        self._hashing -= 1
+        if filePath in self._active:
+            self._onTaskError([filePath], e, task)
+        self._hashDone()
+
+    def _onHashCancelled(self, task: Task):
+        self._hashing -= 1
+        self._hashDone()
+
+    def _hashDone(self):
+        if not self._hashing and self._searchQueue:
+            self._flushSearchQueue()
+
+    def _flushSearchQueue(self):
+        self._searchTimer.stop()
+        if not self._searchQueue:
+            return
+        filesByHash, sizes = self._searchQueue, self._searchSizes
+        self._searchQueue, self._searchSizes = {}, {}
+        filePaths = [f for files in filesByHash.values() for f in files]
+        languages = self._languages
+        # The files the user opens or retries skip the cached misses
+        recheck = {hash for hash, files in filesByHash.items()
+                   if any(self._active[f] == Scheduler.INTERACTIVE
+                          for f in files)}
+        # A search serves many files, so it is not cancelled with them
+        self._scheduler.schedule(
+            Pipeline.FIND,
+            func=partial(self._findSubtitles, filesByHash, sizes, languages,
+                         recheck),
+            onSuccess=partial(self._onSubtitlesFound, filesByHash, languages),
+            onError=partial(self._onSearchError, filePaths),
+            priority=max(self._active[f] for f in filePaths))
+
+    def _findSubtitles(self, filesByHash: Dict[str, List[str]],
+                       sizes: Dict[str, int], languages: List[str],
+                       recheck: Set[str]):
+        logger.debug(f"{len(filesByHash)} hashes")
+        # The service logs in, and again when the session expires
+        paths = {hash: files[0] for hash, files in filesByHash.items()}
+        service = self._asyncService or self._subService
+        return service.find_by_hashes(list(filesByHash), sizes, languages,
+                                      paths=paths, recheck=recheck)
+
+    def _onSubtitlesFound(self, filesByHash: Dict[str, List[str]],
+                          languages: List[str],
+                          subtitlesByHash: Dict[str, List[Dict]],
+                          task: Task):
+        for hash, filePaths in filesByHash.items():
+            filePaths = [f for f in filePaths if f in self._active]
+            if not filePaths:
+                continue
+            subtitles = subtitlesByHash.get(hash) or []
+            subtitles = self._ranker.best_per_language(
+                subtitles, languages, self._ranker.video_fps(subtitles))
+            if not subtitles:
+                logger.warning(f"No subtitles found for {filePaths}")
+                self._onTaskError(filePaths, NoSubtitlesFound(hash), task)
+                continue
+            if len(subtitles) < len(languages):
+                logger.info(f"Subtitles found in {len(subtitles)} of "
+                            f"{len(languages)} languages for {filePaths}")
+            for filePath in filePaths:
+                self._stats.subtitles_found()
+                self._downloads[filePath] = dict(pending=len(subtitles),
+                                                 error=None, task=None)
+                for subtitle in subtitles:
+                    logger.debug(f"filePath={filePath}, subtitle={subtitle}")
+                    self._scheduleDownload(filePath, subtitle)
+
+    def _scheduleDownload(self, filePath: str, subtitle: SubtitleCandidate):
+        # Download -> Convert Encoding, as one chain per subtitle
+        priority = self._active[filePath]
+        cancelled = self._scheduler.cancelEvent(filePath)
+        encoding = self._encoding if self._encService else None
+        service = self._asyncService or self._downloadService
+        task = self._scheduler.schedule(
+            Pipeline.DOWNLOAD,
+            func=partial(service.download_subtitle, subtitle, filePath,
+                         cancelled=cancelled.is_set),
+            onSuccess=None if encoding else partial(
+                self._onSubtitleDownloaded, filePath),
+            onError=partial(self._onDownloadError, filePath),
+            priority=priority,
+            group=filePath)
+        if encoding:
+            self._scheduler.schedule(
+                Pipeline.CONVERT,
+                func=partial(self._convertSubtitle, subtitle, encoding),
+                onSuccess=partial(self._onSubtitleDownloaded, filePath),
+                onError=partial(self._onDownloadError, filePath),
+                priority=priority,
+                group=filePath,
+                after=task)
+
+    def _convertSubtitle(self, subtitle: SubtitleCandidate, encoding: str,
+                         subtitlePath: str) -> str:
+        try:
+            self._encService.convert_file(subtitlePath, encoding,
+                                          subtitle.encoding)
+        except Exception as e:
+            # The subtitle is still usable in its original encoding
+            logger.warning(f"Unable to convert '{subtitlePath}' to "
+                           f"{encoding}: {e}")
+        return subtitlePath
+
+    def _onSubtitleDownloaded(self, filePath: str, subtitlePath: str,
+                              task: Task):
+        logger.debug(f"filePath={filePath}, subtitlePath={subtitlePath}")
+        if filePath not in self._downloads:
+            return
+        self.subtitleDownloaded.emit(filePath, subtitlePath)
+        self._downloadDone(filePath)
+
+    def _onDownloadError(self, filePath: str, e: Exception, task: Task):
+        logger.error(f"Task '{task.name}' failed for '{filePath}': {e}")
+        state = self._downloads.get(filePath)
+        if not state:
+            return
+        if not state['error']:
+            state['error'], state['task'] = e, task
+        self._downloadDone(filePath)
+
+    def _downloadDone(self, filePath: str):
+        state = self._downloads[filePath]
+        state['pending'] -= 1
+        if state['pending']:
+            return
+        del self._downloads[filePath]
+        if state['error']:
+            self._onTaskError([filePath], state['error'], state['task'])
+            return
+        self._stats.file_downloaded()
+        self._fileDone(filePath)
+        self.fileFinished.emit(filePath)
+
+    def _onSearchError(self, filePaths: List[str], e: Exception, task: Task):
+        self._onTaskError([f for f in filePaths if f in self._active], e,
+                          task)
+
+    def _onTaskError(self, filePaths: List[str], e: Exception, task: Task):
+        for filePath in filePaths:
+            logger.error(f"Task '{task.name}' failed for '{filePath}': {e}")
+            priority = self._active.get(filePath)
+            self._stats.file_failed()
+            self._fileDone(filePath)
+            if priority != Scheduler.BACKGROUND:
+                self.taskFailed.emit(filePath, e, task)
+
+    def _fileDone(self, filePath: str):
+        self._active.pop(filePath, None)
+        logger.info(f"Batch progress: {self._stats}")
+        if self.isIdle():
+            logger.info(f"Batch finished: {self._stats}")
+            self.finished.emit()
@@ -0,0 +1,246 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+import heapq
+import itertools
+import threading
+from functools import partial
+from typing import Callable, Dict, Hashable, Iterable
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool
+from .asyncbridge import AsyncBridge
+from service.HashExecutor import HashExecutor
+from .task import Task
+from log import logger
+
+
+class Scheduler(QObject):
+    """Runs tasks on one thread pool per stage.
+
+    Each stage runs at most ``stageThreads[stage]`` tasks at once, and
+    starts its queued tasks highest ``priority`` first.
+
+    Tasks scheduled with the same ``group``, e.g. the file they work on,
+    can be cancelled together.  A task scheduled ``after`` another one is
+    started once that task succeeds, and its ``func`` is called with the
+    result; if that task fails or is cancelled, so is the dependent task.
+
+    The tasks of ``asyncStages`` return a coroutine from ``func``, which
+    runs on an ``AsyncBridge`` rather than on a pool.  They are queued
+    the same way, but ``stageThreads[stage]`` is the number of coroutines
+    in flight, and without one they all start at once.  The tasks of a stage
+    in ``executors`` run on that ``HashExecutor``, which limits them per
+    device of the ``filePath`` they are scheduled with.
+
+    Must be used from the thread that owns it; the callbacks are also
+    called on that thread.
+    """
+
+    BACKGROUND = 0
+    INTERACTIVE = 10
+
+    def __init__(self, stageThreads: Dict[str, int], parent=None,
+                 asyncStages: Iterable[str] = (),
+                 executors: Dict[str, HashExecutor] = None):
+        super().__init__(parent)
+        self._asyncStages = set(asyncStages)
+        self._bridge = AsyncBridge()
+        self._executors = executors or {}
+        self._futures = {}  # Task -> (filePath, Future) of executor stages
+        # Async stages: their limit, queued (-priority, order, Task), and
+        # running Tasks
+        self._asyncLimits = {s: stageThreads.get(s) for s in asyncStages}
+        self._asyncQueues = {s: [] for s in asyncStages}
+        self._asyncRunning = {s: set() for s in asyncStages}
+        self._order = itertools.count()
+
+        self._pools = {}
+        for stage, threadCount in stageThreads.items():
+            if stage in self._executors or stage in self._asyncStages:
+                continue
+            pool = QThreadPool(self)
+            pool.setMaxThreadCount(threadCount)
+            self._pools[stage] = pool
+
+        # Tasks are owned here until their last callback has run
+        self._tasks = {}  # Task -> (group, priority)
+        self._dependents = {}  # Task -> [Task]
+        self._waiting = set()  # Tasks waiting for another task
+        self._groups = {}  # group -> set of Tasks
+        self._cancelEvents = {}  # group -> threading.Event
+
+    def setMaxThreads(self, stage: str, threadCount: int):
+        if stage in self._asyncStages:
+            self._asyncLimits[stage] = threadCount
+            self._startQueued(stage)
+        else:
+            self._pools[stage].setMaxThreadCount(threadCount)
+
+    def maxThreads(self, stage: str) -> int:
+        if stage in self._asyncStages:
+            return self._asyncLimits[stage]
+        return self._pools[stage].maxThreadCount()
+
+    def cancelEvent(self, group: Hashable) -> threading.Event:
+        """Returns the event that is set when ``group`` is cancelled, for
+        long-running functions to check."""
+        if group is None:
+            return threading.Event()
+        try:
+            return self._cancelEvents[group]
+        except KeyError:
+            event = self._cancelEvents[group] = threading.Event()
+            return event
+
+    def schedule(self, stage: str, func: Callable,
+                 onSuccess: Callable = None, onError: Callable = None,
+                 onCancel: Callable = None, priority: int = BACKGROUND,
+                 group: Hashable = None, after: Task = None,
+                 filePath: str = None) -> Task:
+        """Runs ``func`` on the pool of ``stage`` and returns its task.
+
+        The callbacks are those of ``Task``.  With ``after``, ``func`` is
+        called with the result of that task, which must still be pending.
+        ``filePath`` is the file that ``func`` reads, for executor stages.
+        """
+        if after is not None and after not in self._tasks:
+            raise ValueError(f"Task {after} has already finished")
+        task = Task(func, stage, onSuccess, onError, onCancel,
+                    self.cancelEvent(group))
+        # Connected after the callbacks, so that they run first
+        task.signals.success.connect(self._onSuccess)
+        task.signals.error.connect(self._onFinished)
+        task.signals.cancelled.connect(self._onFinished)
+
+        self._tasks[task] = (group, priority)
+        if task.name in self._executors:
+            self._futures[task] = (filePath, None)
+        if group is not None:
+            self._groups.setdefault(group, set()).add(task)
+        if after is None:
+            self._start(task)
+        else:
+            self._waiting.add(task)
+            self._dependents.setdefault(after, []).append(task)
+        return task
+
+    def cancel(self, group: Hashable):
+        """Cancels the tasks of ``group``.
+
+        Queued tasks are taken off their pool, and running tasks drop their
+        result once ``func`` returns.  Tasks scheduled later in the same
+        group are not affected.
+        """
+        event = self._cancelEvents.pop(group, None)
+        if not event:
+            return
+        event.set()
+        for task in list(self._groups.pop(group, ())):
+            if task in self._waiting:
+                self._drop(task)
+            elif task in self._asyncRunning.get(task.name, ()):
+                # The bridge reports the cancellation
+                self._bridge.cancel(task)
+            elif task.name in self._asyncStages:
+                # Left in the queue, and skipped once released
+                self._drop(task)
+            elif task.name in self._executors:
+                if self._futures[task][1].cancel():
+                    self._drop(task)
+            elif self._pools[task.name].tryTake(task):
+                # It never runs, so report the cancellation here
+                self._drop(task)
+        logger.debug(f"Cancelled group {group}")
+
+    def cancelAll(self):
+        for group in list(self._cancelEvents):
+            self.cancel(group)
+
+    def shutdown(self, cleanup: Callable = None):
+        """Cancels everything and stops the event loop of the async
+        stages, after calling ``cleanup`` on it."""
+        self.cancelAll()
+        self._bridge.stop(cleanup)
+        for executor in self._executors.values():
+            executor.shutdown(wait=False)
+
+    def pending(self, group: Hashable = None) -> int:
+        """Returns the number of unfinished tasks, in ``group`` if given."""
+        if group is None:
+            return len(self._tasks)
+        return len(self._groups.get(group, ()))
+
+    def _start(self, task: Task):
+        self._waiting.discard(task)
+        group, priority = self._tasks[task]
+        logger.debug(f"Stage '{task.name}' starting task {task}")
+        if task.name in self._asyncStages:
+            heapq.heappush(self._asyncQueues[task.name],
+                           (-priority, next(self._order), task))
+            self._startQueued(task.name)
+        elif task.name in self._executors:
+            filePath, _ = self._futures[task]
+            future = self._executors[task.name].submit(filePath, task.run,
+                                                       priority=priority)
+            self._futures[task] = (filePath, future)
+        else:
+            self._pools[task.name].start(task, priority)
+
+    def _startQueued(self, stage: str):
+        queue = self._asyncQueues[stage]
+        running = self._asyncRunning[stage]
+        limit = self._asyncLimits[stage]
+        while queue and (limit is None or len(running) < limit):
+            task = heapq.heappop(queue)[-1]
+            if task in self._tasks:
+                running.add(task)
+                self._bridge.start(task)
+
+    def _onSuccess(self, result, task: Task):
+        for dependent in self._dependents.pop(task, ()):
+            if dependent.stop:
+                self._drop(dependent)
+                continue
+            dependent.func = partial(dependent.func, result)
+            self._start(dependent)
+        self._release(task)
+
+    def _onFinished(self, *args):
+        task = args[-1]
+        for dependent in self._dependents.pop(task, ()):
+            self._drop(dependent)
+        self._release(task)
+
+    def _drop(self, task: Task):
+        # Reports the cancellation of a task that will not run, once
+        if task in self._tasks:
+            self._waiting.discard(task)
+            task.signals.cancelled.emit(task)
+
+    def _release(self, task: QRunnable):
+        group, priority = self._tasks.pop(task, (None, None))
+        self._futures.pop(task, None)
+        if task in self._asyncRunning.get(task.name, ()):
+            self._asyncRunning[task.name].discard(task)
+            self._startQueued(task.name)
+        tasks = self._groups.get(group)
+        if tasks is None:
+            return
+        tasks.discard(task)
+        if not tasks:
+            del self._groups[group]
+            self._cancelEvents.pop(group, None)
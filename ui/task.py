@@ -16,8 +16,8 @@
 # You should have received a copy of the GNU General Public License
 # along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
 
-from PyQt5.QtCore import QRunnable, QObject
-from PyQt5.Qt import pyqtSlot, pyqtSignal, QErrorMessage
+from PyQt5.QtCore import pyqtSlot, pyqtSignal, QRunnable, QObject
+import threading
 import traceback
 from log import logger
 from typing import Callable
@@ -30,46 +30,79 @@ from typing import Callable
 class TaskSignals(QObject):
     success = pyqtSignal(object, QRunnable)
     error = pyqtSignal(Exception, QRunnable)
+    cancelled = pyqtSignal(QRunnable)
 
     def __init__(self):
         super().__init__()
 
 
 class Task(QRunnable):
+    """Runs ``func`` on a thread pool and reports its result through
+    queued signals.
+
+    A task is cancelled when its ``cancelEvent`` is set, which may be shared
+    with other tasks.  It then reports neither its result nor its error, but
+    calls ``onCancel``.  ``func`` is not interrupted; it may check the
+    event itself to stop early.
+    """
+
     def __init__(self,
                  func: Callable,
                  name: str,
-                 onSuccess: Callable[[object, QRunnable], None],
-                 onError: Callable[[Exception, QRunnable], None] = None):
+                 onSuccess: Callable[[object, QRunnable], None] = None,
+                 onError: Callable[[Exception, QRunnable], None] = None,
+                 onCancel: Callable[[QRunnable], None] = None,
+                 cancelEvent: threading.Event = None):
         super().__init__()
         self.func = func
         self.name = name
-        self.stop = False
         self.onSuccess = onSuccess
         self.onError = onError
+        self.onCancel = onCancel
+        self.cancelEvent = cancelEvent or threading.Event()
         self._on = TaskSignals()
-        self._on.success.connect(onSuccess)
+        if onSuccess:
+            self._on.success.connect(onSuccess)
         if onError:
             self._on.error.connect(onError)
-        # self.setAutoDelete(False)
+        if onCancel:
+            self._on.cancelled.connect(onCancel)
+        # The signals are queued to the receiver's thread, so the task must
+        # outlive run(); the scheduler owns it until a callback fires.
+        self.setAutoDelete(False)
+
+    @property
+    def signals(self) -> TaskSignals:
+        return self._on
+
+    @property
+    def stop(self) -> bool:
+        return self.cancelEvent.is_set()
 
     @pyqtSlot()
     def setStop(self):
-        self.stop = True
+        self.cancelEvent.set()
 
     @pyqtSlot()
     def run(self):
         if self.stop:
+            self._on.cancelled.emit(self)
             return
         logger.debug("Running")
         try:
             logger.debug(f"Invoking func {self.func}")
             result = self.func()
         except Exception as e:
+            if self.stop:
+                self._on.cancelled.emit(self)
+                return
             logger.error(f"Got exception from func: {e}")
             self._on.error.emit(e, self)
         else:
             logger.debug("func finished")
+            if self.stop:
+                self._on.cancelled.emit(self)
+                return
             try:
                 self._on.success.emit(result, self)
             except Exception as e:
@@ -0,0 +1,93 @@
+# Copyright (C) 2018--2019 Philip Belemezov.
+# All Rights Reserved.
+#
+# This file is part of Subtitles.
+#
+# Subtitles is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Subtitles is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Subtitles.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import List
+from PyQt5.QtCore import pyqtSignal, QFileSystemWatcher, QObject
+from service.FolderWatcher import FolderWatcher
+from log import logger
+
+
+class Watcher(QObject):
+    """Watches directories for new video files.
+
+    ``QFileSystemWatcher`` (inotify on Linux) tells the ``FolderWatcher``
+    which directories changed.  Where it cannot watch a directory, e.g.
+    past the inotify limit or on some network shares, the watcher falls
+    back to polling the modification times of the directories.
+    """
+
+    filesArrived = pyqtSignal(list)
+
+    _directoriesChanged = pyqtSignal(list, list)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._fsWatcher = QFileSystemWatcher(self)
+        self._fsWatcher.directoryChanged.connect(self._onDirectoryChanged)
+        self._directoriesChanged.connect(self._onDirectoriesChanged)
+        self._folderWatcher = None
+
+    def watch(self, directories: List[str], languages: List[str] = None,
+              settle: float = FolderWatcher.SETTLE):
+        """Watches ``directories``, and their subdirectories, instead of
+        the current ones."""
+        self.stop()
+        if not directories:
+            return
+        logger.info(f"Watching {directories}")
+        # Signals, so that the callbacks are queued to this thread
+        self._folderWatcher = FolderWatcher(
+            directories, on_files=self.filesArrived.emit,
+            on_directories=self._directoriesChanged.emit,
+            languages=languages, settle=settle, poll=False)
+        self._folderWatcher.start()
+
+    def stop(self):
+        if not self._folderWatcher:
+            return
+        self._folderWatcher.stop()
+        self._folderWatcher = None
+        watched = self._fsWatcher.directories()
+        if watched:
+            self._fsWatcher.removePaths(watched)
+
+    def directories(self) -> List[str]:
+        if not self._folderWatcher:
+            return []
+        return self._folderWatcher.directories
+
+    def _onDirectoryChanged(self, directory: str):
+        if self._folderWatcher:
+            self._folderWatcher.notify(directory)
+
+    def _onDirectoriesChanged(self, added: List[str], removed: List[str]):
+        if not self._folderWatcher:
+            return
+        watched = set(self._fsWatcher.directories())
+        removed = [d for d in removed if d in watched]
+        if removed:
+            self._fsWatcher.removePaths(removed)
+        if added:
+            failed = self._fsWatcher.addPaths(added)
+            if failed and not self._folderWatcher.poll:
+                logger.warning(f"Unable to watch {len(failed)} "
+                               f"directories, polling instead")
+                self._folderWatcher.poll = True
+            # Catch what arrived before the directories were watched
+            for directory in added:
+                self._folderWatcher.notify(directory)